@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Index of the notifications list of a recipient in the order of the keyset pagination."""
+
+    dependencies = [
+        ('notifications', '0008_index_together_recipient_unread'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX notification_recipient_time_idx '
+            'ON notifications_notification (recipient_id, "timestamp" DESC, id DESC);',
+            'DROP INDEX notification_recipient_time_idx;',
+        ),
+    ]
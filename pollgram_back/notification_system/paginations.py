@@ -1,7 +1,7 @@
-from rest_framework.pagination import PageNumberPagination
+from socialmedia.pagination import KeysetPagination
 
 
-class NotificationPagination(PageNumberPagination):
+class NotificationPagination(KeysetPagination):
     page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+    ordering = ('-timestamp', '-id')
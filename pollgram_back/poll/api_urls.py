@@ -5,11 +5,15 @@ app_name = 'poll'
 urlpatterns = [
     path('<int:pk>/', PollRetrieveDestroyAPIView.as_view(), name='poll_retrieve_destroy'),
     path('', PollCreateAPIView.as_view(), name='poll_create'),
+    path('bulk/', PollBulkCreateAPIView.as_view(), name='poll_bulk_create'),
     path('<int:poll_pk>/vote/', VoteAPIView.as_view(), name='vote'),
     path('<int:poll_pk>/choice/<int:order>/voters/', VotersListAPIView.as_view(), name='voters'),
     path('image/', ImageCreateAPIView.as_view(), name='image'),
     path('file/', FileCreateAPIView.as_view(), name='file'),
     path('category/', CategoryListAPIView.as_view(), name='categories'),
+    path('category/stats/', CategoryStatsAPIView.as_view(), name='category_stats'),
+    path('search/', PollSearchAPIView.as_view(), name='poll_search'),
+    path('trending/', TrendingPollListAPIView.as_view(), name='trending_polls'),
     path('category/<int:cat_pk>/', CategoryPollListAPIView.as_view(), name='category_polls'),
 
     path('<int:poll_pk>/comment/', CommentListCreateAPIView.as_view(), name='comment_list_create'),
@@ -17,11 +21,15 @@ urlpatterns = [
 
     path('<int:poll_pk>/comment/<int:comment_pk>/reply/', ReplyListAPIView.as_view(), name='comment_replies'),
 
+    path('<int:poll_pk>/comment/<int:comment_pk>/reaction/', ReactionAPIView.as_view(), name='reaction'),
     path('<int:poll_pk>/comment/<int:comment_pk>/like/', LikeAPIView.as_view(), name='like'),
     path('<int:poll_pk>/comment/<int:comment_pk>/dislike/', DislikeAPIView.as_view(), name='dislike'),
 
     path('<int:poll_pk>/chart/circle/', CircularChartAPIView.as_view(), name='circle_chart'),
-    path('<int:poll_pk>/chart/bar/', BarChartAPIView.as_view(), name='bar_chart')
+    path('<int:poll_pk>/chart/bar/', BarChartAPIView.as_view(), name='bar_chart'),
+    path('<int:poll_pk>/chart/co-selection/', CoSelectionChartAPIView.as_view(), name='co_selection_chart'),
+    path('<int:poll_pk>/chart/ranked/', RankedChartAPIView.as_view(), name='ranked_chart'),
+    path('<int:poll_pk>/export/', PollExportAPIView.as_view(), name='poll_export'),
 
 ]
 
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class PollConfig(AppConfig):
     name = 'poll'
+
+    def ready(self):
+        import poll.checks
+        import poll.signals
@@ -0,0 +1,120 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import Category, CategoryStats, CategoryTreeVersion, CategoryVoteRollup, Poll, VoteRollup
+
+# the version, serialized tree and etag last built by this process, replaced at once so threads share it safely
+_category_tree = (None, None, None)
+
+
+def get_category_tree(serializer_class):
+    """
+    Return the category tree serialized by serializer_class and its strong etag. They are kept in the process
+    until the version stamp stored in the database is bumped by a change of the categories, so the workers build
+    the tree again on their next request after the change is committed.
+    """
+    global _category_tree
+    version = CategoryTreeVersion.objects.get_version()
+    built_version, data, etag = _category_tree
+    if built_version != version:
+        data = serializer_class(Category.objects.get_tree(), many=True).data
+        # derived from the content, so the workers send the same etag for the same tree
+        etag = '"{}"'.format(hashlib.sha256(json.dumps(data).encode()).hexdigest())
+        _category_tree = (version, data, etag)
+    return data, etag
+
+
+def get_top_polls(categories, candidates):
+    """
+    Return the dict of the category id to the top CATEGORY_TOP_POLLS (count, poll id, creator id) of its subtree,
+    candidates is the dict of the category id to those of the category itself. The top polls of a subtree are
+    among the top polls of the category and of its sub categories.
+    """
+    top_polls = {}
+
+    def visit(category):
+        polls = list(candidates.get(category.pk, []))
+        for sub_category in category.get_sub_categories():
+            polls.extend(visit(sub_category))
+        top_polls[category.pk] = sorted(polls, reverse=True)[:settings.CATEGORY_TOP_POLLS]
+        return top_polls[category.pk]
+
+    for root in categories:
+        visit(root)
+    return top_polls
+
+
+def refresh_category_stats(recount=False):
+    """
+    Rank the polls of every category subtree by their votes in the last CATEGORY_TOP_POLLS_HOURS and store the top
+    of each one, drop the category hour buckets older than the recent vote counts read and, with recount, count
+    the polls of the categories again. Return the number of categories refreshed.
+    """
+    now = timezone.now()
+    since = VoteRollup.get_bucket_start(now - timedelta(hours=settings.CATEGORY_TOP_POLLS_HOURS - 1),
+                                        VoteRollup.Bucket.HOUR)
+    rows = VoteRollup.objects.filter(bucket=VoteRollup.Bucket.HOUR, order=VoteRollup.POLL_TOTAL,
+                                     bucket_start__gte=since, poll__category__isnull=False,
+                                     poll__creator__is_public=True) \
+        .order_by().values_list('poll', 'poll__category', 'poll__creator').annotate(count=Sum('count'))
+    candidates = {}
+    for poll_id, category_id, creator_id, count in rows:
+        if count > 0:
+            candidates.setdefault(category_id, []).append((count, poll_id, creator_id))
+    roots = Category.objects.get_tree()
+    top_polls = get_top_polls(roots, candidates)
+    poll_counts = {}
+    if recount:
+        poll_counts = dict(Poll.objects.filter(category__isnull=False, creator__is_public=True).order_by()
+                           .values_list('category').annotate(count=Count('id')))
+    with transaction.atomic():
+        CategoryStats.objects.bulk_create([CategoryStats(category_id=category_id) for category_id in top_polls],
+                                          ignore_conflicts=True)
+        stats = list(CategoryStats.objects.select_for_update().filter(category__in=top_polls))
+        for category_stats in stats:
+            category_stats.top_polls = [[poll_id, creator_id]
+                                        for _, poll_id, creator_id in top_polls[category_stats.category_id]]
+            category_stats.top_polls_refreshed_at = now
+            if recount:
+                category_stats.poll_count = poll_counts.get(category_stats.category_id, 0)
+        fields = ['top_polls', 'top_polls_refreshed_at'] + (['poll_count'] if recount else [])
+        CategoryStats.objects.bulk_update(stats, fields, batch_size=500)
+    hours = max(settings.CATEGORY_RECENT_VOTES_HOURS, settings.CATEGORY_TOP_POLLS_HOURS)
+    CategoryVoteRollup.objects.filter(
+        bucket_start__lt=VoteRollup.get_bucket_start(now - timedelta(hours=hours), VoteRollup.Bucket.HOUR)).delete()
+    return len(stats)
+
+
+def get_category_stats_tree(user):
+    """
+    Return the category tree with the poll count, the recent vote count and the top poll ids of each subtree,
+    read with three queries. The top polls of the users who have blocked the user are left out.
+    """
+    roots = Category.objects.get_tree()
+    stats = {category_stats.category_id: category_stats for category_stats in CategoryStats.objects.all()}
+    recent_counts = CategoryVoteRollup.objects.get_recent_counts(settings.CATEGORY_RECENT_VOTES_HOURS)
+    blocker_ids = user.blocker_ids
+
+    def build(category):
+        category_stats = stats.get(category.pk)
+        sub_categories = [build(sub_category) for sub_category in category.get_sub_categories()]
+        return {
+            'id': category.pk,
+            'name': category.name,
+            'order': category.order,
+            'poll_count': (category_stats.poll_count if category_stats else 0) +
+            sum(sub_category['poll_count'] for sub_category in sub_categories),
+            'recent_vote_count': recent_counts.get(category.pk, 0) +
+            sum(sub_category['recent_vote_count'] for sub_category in sub_categories),
+            'top_poll_ids': [poll_id for poll_id, creator_id in (category_stats.top_polls if category_stats else [])
+                             if creator_id not in blocker_ids],
+            'sub_categories': sub_categories,
+        }
+
+    return [build(root) for root in roots]
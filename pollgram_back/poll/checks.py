@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The result snapshots and the ranked results lock and generations are shared by the workers through the
+    default cache, a cache of each process leaves the other workers serving stale data.
+    """
+    if settings.DEBUG or settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS:
+        return []
+    return [Error(
+        'The default cache is not shared by the worker processes.',
+        hint='Set DJANGO_CACHE_BACKEND and DJANGO_CACHE_LOCATION to a memcached or another shared cache.',
+        obj='CACHES',
+        id='poll.E001',
+    )]
@@ -0,0 +1,60 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Vote, VoteRollup, VoteCounterShard
+
+CSV_HEADER = ('record', 'order', 'context', 'date', 'count', 'user_id', 'username', 'voted_at')
+
+
+def get_export_records(poll, user):
+    """
+    Yield the records of the poll export as dicts: its choices with their counts, the vote total, the per-day
+    vote counts of the poll and its choices and the voters. The rows are read with server-side cursors,
+    so the memory use does not depend on the vote count. The voters who have blocked the user are left out,
+    like on the voters list.
+    """
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    shard_counts = {}
+    if poll.get_counter_shards() > 1:
+        shard_counts = VoteCounterShard.objects.get_counts([poll.pk]).get(poll.pk, {})
+    for order, context, vote_count in poll.choices.order_by('order').values_list('order', 'context', 'vote_count'):
+        yield {'record': 'choice', 'order': order, 'context': context, 'count': vote_count + shard_counts.get(order, 0)}
+    yield {'record': 'total', 'count': poll.vote_count + sum(shard_counts.values())}
+    # the buckets of a sharded poll are summed over their shard rows
+    days = VoteRollup.objects.filter(poll=poll, bucket=VoteRollup.Bucket.DAY) \
+        .order_by('bucket_start', 'order').values_list('bucket_start', 'order') \
+        .annotate(count=Sum('count')).filter(count__gt=0)
+    for bucket_start, order, count in days.iterator(chunk_size=chunk_size):
+        record = {'record': 'day', 'date': timezone.localdate(bucket_start), 'count': count}
+        if order != VoteRollup.POLL_TOTAL:
+            record['order'] = order
+        yield record
+    votes = Vote.objects.filter(poll=poll).visible_to(user).order_by('created_at', 'id') \
+        .values_list('user_id', 'user__username', 'selected_orders', 'created_at')
+    for user_id, username, selected_orders, created_at in votes.iterator(chunk_size=chunk_size):
+        for order in Vote.decode_orders(selected_orders):
+            yield {'record': 'vote', 'order': order, 'user_id': user_id, 'username': username, 'voted_at': created_at}
+
+
+class Echo:
+    """File-like object of csv.writer which returns the written line instead of keeping it."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(records):
+    writer = csv.DictWriter(Echo(), fieldnames=CSV_HEADER)
+    yield writer.writeheader()
+    for record in records:
+        yield writer.writerow(record)
+
+
+def stream_ndjson(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
@@ -0,0 +1,53 @@
+from collections import Counter
+
+from django.db import transaction
+
+from .models import Poll, Vote, PendingVote, VoteRollup, CoSelection, RankedBallot, CategoryVoteRollup
+from .ranking import update_ranked_results
+from .results import invalidate_poll_results
+
+
+def apply_pending_votes(batch_size):
+    """
+    Apply the oldest batch_size pending votes: insert their votes with one bulk insert, update the vote counters,
+    rollups and co-selections of their polls and delete them, in one transaction. The rows are locked with
+    skip_locked, so several workers can apply batches side by side. Return the number of pending votes handled.
+    """
+    with transaction.atomic():
+        pending_votes = list(PendingVote.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        if not pending_votes:
+            return 0
+        # a vote may have been cast synchronously while the poll was switching modes, the pending one is dropped
+        applied = set(Vote.objects.filter(user__in={pending_vote.user_id for pending_vote in pending_votes},
+                                          poll__in={pending_vote.poll_id for pending_vote in pending_votes})
+                      .values_list('user', 'poll'))
+        # the votes keep the time they were cast at, so the rollups count them in their buckets however late
+        votes = [Vote(user_id=pending_vote.user_id, poll_id=pending_vote.poll_id, created_at=pending_vote.created_at,
+                      selected_orders=pending_vote.selected_orders, ranking=pending_vote.ranking)
+                 for pending_vote in pending_votes if (pending_vote.user_id, pending_vote.poll_id) not in applied]
+        Vote.objects.bulk_create(votes)
+        choice_counts = Counter((vote.poll_id, order) for vote in votes for order in vote.get_selected_orders())
+        polls = Poll.objects.filter(pk__in={vote.poll_id for vote in votes}) \
+            .only('id', 'results_max_age', 'counter_shards', 'max_choice_can_vote', 'is_ranked', 'category')
+        multi_choice_poll_ids = set()
+        categories = {}
+        for poll in polls:
+            categories[poll.pk] = poll.category_id
+            if poll.is_multi_choice():
+                multi_choice_poll_ids.add(poll.pk)
+            # one counter update per distinct count, most choices of a batch share a few of them
+            orders_per_count = {}
+            for (poll_id, order), count in choice_counts.items():
+                if poll_id == poll.pk:
+                    orders_per_count.setdefault(count, []).append(order)
+            for count, orders in orders_per_count.items():
+                poll.update_vote_counters(orders, count)
+            if poll.is_ranked:
+                update_ranked_results(poll, Counter(vote.ranking for vote in votes if vote.poll_id == poll.pk))
+            invalidate_poll_results(poll)
+        VoteRollup.objects.record_many(votes, 1)
+        CoSelection.objects.record_many([vote for vote in votes if vote.poll_id in multi_choice_poll_ids], 1)
+        RankedBallot.objects.record_many([vote for vote in votes if vote.ranking is not None], 1)
+        CategoryVoteRollup.objects.record_many(votes, categories, 1)
+        PendingVote.objects.filter(pk__in=[pending_vote.pk for pending_vote in pending_votes]).delete()
+    return len(pending_votes)
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from poll.ingestion import apply_pending_votes
+
+
+class Command(BaseCommand):
+    help = 'Apply the votes queued on the polls which buffer their votes, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.VOTE_BUFFER_BATCH_SIZE,
+                            help='number of pending votes applied per transaction')
+        parser.add_argument('--forever', action='store_true', help='keep waiting for new votes when the queue is empty')
+        parser.add_argument('--sleep', type=float, default=0.5, help='seconds to wait on an empty queue with --forever')
+
+    def handle(self, *args, **options):
+        applied_count = 0
+        while True:
+            count = apply_pending_votes(options['batch_size'])
+            applied_count += count
+            if count:
+                continue
+            if not options['forever']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'{applied_count} pending votes applied.'))
@@ -0,0 +1,58 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from poll.models import Poll, Choice, VoteCounterShard
+from socialmedia.models import User
+
+
+class Command(BaseCommand):
+    help = 'Measure the vote counter increments per second of concurrent writers on one poll for several shard ' \
+           'counts, on a throwaway poll which is deleted afterwards. Meant for PostgreSQL, SQLite allows one writer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='number of concurrent writers')
+        parser.add_argument('--increments', type=int, default=200, help='increments per writer and shard count')
+        parser.add_argument('--shards', type=int, nargs='+', default=[1, 4, 16], help='shard counts measured')
+        parser.add_argument('--hold-ms', type=float, default=2.0,
+                            help='milliseconds the counter rows stay locked after the increment, like the rest '
+                                 'of the vote transaction')
+
+    def handle(self, *args, **options):
+        creator = User.objects.create(username='benchmark-counters', email='benchmark-counters@local.dev')
+        try:
+            for shards in options['shards']:
+                poll = Poll.objects.create(creator=creator, question='benchmark', counter_shards=shards,
+                                           visibility_status=Poll.PollVisibilityStatus.VISIBLE)
+                Choice.objects.bulk_create([Choice(poll=poll, order=1, context='1')])
+                seconds = self.run(poll, options['threads'], options['increments'], options['hold_ms'] / 1000)
+                increments_count = options['threads'] * options['increments']
+                # the stored counter and the shard sums, read without the cache of the shard sums
+                shard_sums = VoteCounterShard.objects.filter(poll=poll).values_list('count', flat=True)
+                counted = Poll.objects.get(pk=poll.pk).vote_count + sum(shard_sums)
+                self.stdout.write(f'{shards} shards: {increments_count} increments in {seconds:.2f}s, '
+                                  f'{increments_count / seconds:.0f} increments/s, {counted} counted')
+                if counted != increments_count:
+                    self.stderr.write(f'{shards} shards: expected {increments_count} increments, counted {counted}')
+        finally:
+            creator.delete()
+
+    def run(self, poll, threads_count, increments_count, hold_seconds):
+        def write():
+            try:
+                for _ in range(increments_count):
+                    with transaction.atomic():
+                        poll.update_vote_counters([1], 1)
+                        time.sleep(hold_seconds)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write) for _ in range(threads_count)]
+        started_at = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started_at
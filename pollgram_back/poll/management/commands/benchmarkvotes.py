@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from poll.ingestion import apply_pending_votes
+from poll.models import Poll, Choice
+from poll.views import VoteAPIView
+from socialmedia.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure the votes per second of the synchronous and the buffered vote paths on throwaway data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--votes', type=int, default=1000, help='number of votes cast on each path')
+        parser.add_argument('--batch-size', type=int, default=500, help='pending votes applied per transaction')
+
+    def handle(self, *args, **options):
+        # everything is written in one transaction which is rolled back at the end
+        try:
+            with transaction.atomic():
+                self.run(options['votes'], options['batch_size'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, votes_count, batch_size):
+        creator = User.objects.create(username='benchmark-creator', email='benchmark-creator@local.dev')
+        User.objects.bulk_create([User(username=f'benchmark-voter-{i}', email=f'benchmark-voter-{i}@local.dev')
+                                  for i in range(votes_count)])
+        voters = list(User.objects.filter(username__startswith='benchmark-voter-'))
+        factory = APIRequestFactory()
+        view = VoteAPIView.as_view()
+
+        def cast_votes(poll):
+            started_at = time.perf_counter()
+            for i, voter in enumerate(voters):
+                request = factory.post(f'/api/poll/{poll.pk}/vote/', {'selected': [i % 4 + 1]}, format='json')
+                force_authenticate(request, user=voter)
+                view(request, poll_pk=poll.pk)
+            return time.perf_counter() - started_at
+
+        sync_seconds = cast_votes(self.create_poll(creator, buffers_votes=False))
+        self.report('synchronous', votes_count, sync_seconds)
+
+        buffered_poll = self.create_poll(creator, buffers_votes=True)
+        acknowledge_seconds = cast_votes(buffered_poll)
+        started_at = time.perf_counter()
+        while apply_pending_votes(batch_size):
+            pass
+        apply_seconds = time.perf_counter() - started_at
+        self.report('buffered, acknowledged', votes_count, acknowledge_seconds)
+        self.report('buffered, applied by the worker', votes_count, apply_seconds)
+        self.report('buffered, end to end', votes_count, acknowledge_seconds + apply_seconds)
+        buffered_poll.refresh_from_db()
+        if buffered_poll.vote_count != votes_count:
+            self.stderr.write(f'expected {votes_count} applied votes, counted {buffered_poll.vote_count}')
+
+    def create_poll(self, creator, buffers_votes):
+        poll = Poll.objects.create(creator=creator, question='benchmark', buffers_votes=buffers_votes,
+                                   visibility_status=Poll.PollVisibilityStatus.VISIBLE)
+        Choice.objects.bulk_create([Choice(poll=poll, order=order, context=str(order)) for order in range(1, 5)])
+        return poll
+
+    def report(self, name, votes_count, seconds):
+        self.stdout.write(f'{name}: {votes_count} votes in {seconds:.2f}s, {votes_count / seconds:.0f} votes/s')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from poll.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete the idempotency keys of the vote submissions which are older than IDEMPOTENCY_KEY_TTL'
+
+    def handle(self, *args, **options):
+        deleted_count, _ = IdempotencyKey.objects.delete_expired()
+        self.stdout.write(self.style.SUCCESS(f'{deleted_count} expired idempotency keys deleted.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from poll.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Index the question and description of every poll again in the full-text search index'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            indexed_count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'{indexed_count} polls indexed.'))
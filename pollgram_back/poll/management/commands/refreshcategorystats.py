@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from poll.categories import refresh_category_stats
+
+
+class Command(BaseCommand):
+    help = 'Refresh the top polls of the categories by their recent votes and drop the outdated category vote buckets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true',
+                            help='count the polls of the categories again instead of trusting the counters')
+
+    def handle(self, *args, **options):
+        refreshed_count = refresh_category_stats(recount=options['recount'])
+        self.stdout.write(self.style.SUCCESS(f'Statistics of {refreshed_count} categories refreshed.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from poll.trending import refresh_trending_polls
+
+
+class Command(BaseCommand):
+    help = 'Rank the polls by their time-decayed recent activity and store the trending feed'
+
+    def handle(self, *args, **options):
+        trending_count = refresh_trending_polls()
+        self.stdout.write(self.style.SUCCESS(f'{trending_count} trending polls stored.'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+
+from poll.models import Comment, CommentReaction
+
+
+class Command(BaseCommand):
+    help = 'Recompute the like, dislike and reply counters of the comments from their reactions and replies and ' \
+           'repair the drifted ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='number of comments repaired per transaction')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        repaired_comments = 0
+        last_pk = 0
+        while True:
+            comment_ids = list(Comment.objects.filter(pk__gt=last_pk).order_by('pk')
+                               .values_list('pk', flat=True)[:chunk_size])
+            if not comment_ids:
+                break
+            last_pk = comment_ids[-1]
+            with transaction.atomic():
+                comments = Comment.objects.select_for_update().filter(pk__in=comment_ids).order_by('pk')
+                reactions = CommentReaction.objects.filter(comment__in=comment_ids).order_by().values('comment') \
+                    .annotate(likes=Count('id', filter=Q(value=CommentReaction.Value.LIKE)),
+                              dislikes=Count('id', filter=Q(value=CommentReaction.Value.DISLIKE)))
+                reaction_counts = {row['comment']: (row['likes'], row['dislikes']) for row in reactions}
+                reply_counts = dict(Comment.objects.filter(parent__in=comment_ids).order_by().values_list('parent')
+                                    .annotate(count=Count('id')))
+                drifted_comments = []
+                for comment in comments:
+                    actual_counts = reaction_counts.get(comment.pk, (0, 0)) + (reply_counts.get(comment.pk, 0),)
+                    if (comment.likes_count, comment.dislikes_count, comment.replies_count) != actual_counts:
+                        comment.likes_count, comment.dislikes_count, comment.replies_count = actual_counts
+                        drifted_comments.append(comment)
+                Comment.objects.bulk_update(drifted_comments, ['likes_count', 'dislikes_count', 'replies_count'])
+            repaired_comments += len(drifted_comments)
+        self.stdout.write(self.style.SUCCESS(f'Counters repaired for {repaired_comments} comments.'))
@@ -0,0 +1,68 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from poll.models import Poll, Choice, Vote, VoteCounterShard
+
+
+class Command(BaseCommand):
+    help = 'Recompute the vote counters of polls and choices from the votes and repair the drifted ones, the counter ' \
+           'shards of sharded polls are folded into the stored counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='number of polls repaired per transaction')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        repaired_polls = 0
+        repaired_choices = 0
+        last_pk = 0
+        while True:
+            poll_ids = list(Poll.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not poll_ids:
+                break
+            last_pk = poll_ids[-1]
+            with transaction.atomic():
+                # every counter row is locked before the votes are counted, a vote committing meanwhile either has
+                # updated its counters before, then it is counted, or updates them after the repair
+                polls = {poll.pk: poll for poll in Poll.objects.select_for_update().filter(pk__in=poll_ids)}
+                choices = list(Choice.objects.select_for_update().filter(poll__in=poll_ids))
+                # a shard row inserted by a vote after the lock could not be locked, so every shard row a vote of
+                # the sharded polls may pick is created first, the votes then only update the locked rows
+                VoteCounterShard.objects.bulk_create([
+                    VoteCounterShard(poll_id=choice.poll_id, order=choice.order, shard=shard) for choice in choices
+                    for shard in range(polls[choice.poll_id].get_counter_shards())
+                    if polls[choice.poll_id].get_counter_shards() > 1
+                ], ignore_conflicts=True)
+                shard_ids = list(VoteCounterShard.objects.select_for_update().filter(poll__in=poll_ids)
+                                 .values_list('pk', flat=True))
+                actual_counts = {}
+                vote_groups = Vote.objects.filter(poll__in=poll_ids).values('poll', 'selected_orders') \
+                    .annotate(voters=Count('id')).order_by()
+                for group in vote_groups:
+                    for order in Vote.decode_orders(group['selected_orders']):
+                        key = (group['poll'], order)
+                        actual_counts[key] = actual_counts.get(key, 0) + group['voters']
+                poll_totals = dict.fromkeys(polls, 0)
+                drifted_choices = []
+                for choice in choices:
+                    actual_vote_count = actual_counts.get((choice.poll_id, choice.order), 0)
+                    poll_totals[choice.poll_id] += actual_vote_count
+                    if choice.vote_count != actual_vote_count:
+                        choice.vote_count = actual_vote_count
+                        drifted_choices.append(choice)
+                drifted_polls = []
+                for poll_id, total in poll_totals.items():
+                    if polls[poll_id].vote_count != total:
+                        polls[poll_id].vote_count = total
+                        drifted_polls.append(polls[poll_id])
+                Choice.objects.bulk_update(drifted_choices, ['vote_count'])
+                Poll.objects.bulk_update(drifted_polls, ['vote_count'])
+                # the stored counters now hold every counted vote, the shard rows locked here start over from zero
+                VoteCounterShard.objects.filter(pk__in=shard_ids).update(count=0)
+            cache.delete_many([VoteCounterShard.get_cache_key(poll_id) for poll_id in poll_ids])
+            repaired_polls += len(drifted_polls)
+            repaired_choices += len(drifted_choices)
+        self.stdout.write(self.style.SUCCESS(
+            f'Vote counters repaired for {repaired_polls} polls and {repaired_choices} choices.'))
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.utils import timezone
+
+from poll.models import Poll, VoteCounterShard, VoteRollup
+
+
+class Command(BaseCommand):
+    help = 'Change the number of vote counter shards of polls, raise the hot polls or fold the shards back ' \
+           'into the stored counters. A poll dropped to one shard is switched first and folded twice after it, a ' \
+           'vote loaded before the switch and counted after the second fold stays on its shard until the next ' \
+           '--fold or repairvotecounters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=int, help='id of the poll to reshard')
+        parser.add_argument('--shards', type=int, help='number of counter shards of the poll, 0 uses the default')
+        parser.add_argument('--hot', action='store_true',
+                            help='raise the polls with HOT_POLL_VOTES_PER_HOUR votes in the current hour to '
+                                 'HOT_POLL_COUNTER_SHARDS shards')
+        parser.add_argument('--fold', action='store_true', help='fold the shards of all the polls into their counters')
+
+    def handle(self, *args, **options):
+        if options['poll'] is not None:
+            if options['shards'] is None or options['shards'] < 0:
+                raise CommandError('--shards is required with --poll and must not be negative')
+            try:
+                poll = Poll.objects.get(pk=options['poll'])
+            except Poll.DoesNotExist:
+                raise CommandError(f'poll {options["poll"]} does not exist')
+            self.reshard([poll], options['shards'] or None)
+        if options['hot']:
+            self.raise_hot_polls()
+        if options['fold']:
+            poll_ids = VoteCounterShard.objects.exclude(count=0).values_list('poll', flat=True).distinct()
+            folded_count = sum(VoteCounterShard.objects.fold(poll) for poll in Poll.objects.filter(pk__in=poll_ids))
+            self.stdout.write(self.style.SUCCESS(f'{folded_count} counter shards folded.'))
+
+    def reshard(self, polls, shards):
+        for poll in polls:
+            poll.counter_shards = shards
+            Poll.objects.filter(pk=poll.pk).update(counter_shards=shards)
+            self.stdout.write(f'poll {poll.pk}: {poll.get_counter_shards()} counter shards')
+        # the votes cast before the change may still be on the shards, the stored counters take them over once the
+        # polls are switched, and once more for the votes which had picked a shard before and wrote it meanwhile
+        unsharded_polls = [poll for poll in polls if poll.get_counter_shards() == 1]
+        for _ in range(2):
+            for poll in unsharded_polls:
+                VoteCounterShard.objects.fold(poll)
+
+    def raise_hot_polls(self):
+        hot_shards = settings.HOT_POLL_COUNTER_SHARDS
+        hour_start = VoteRollup.get_bucket_start(timezone.now(), VoteRollup.Bucket.HOUR)
+        hot_poll_ids = VoteRollup.objects.filter(bucket=VoteRollup.Bucket.HOUR, bucket_start=hour_start,
+                                                 order=VoteRollup.POLL_TOTAL).order_by() \
+            .values_list('poll').annotate(count=Sum('count')) \
+            .filter(count__gte=settings.HOT_POLL_VOTES_PER_HOUR).values_list('poll', flat=True)
+        polls = [poll for poll in Poll.objects.filter(pk__in=hot_poll_ids) if poll.get_counter_shards() < hot_shards]
+        self.reshard(polls, hot_shards)
+        self.stdout.write(self.style.SUCCESS(f'{len(polls)} hot polls raised to {hot_shards} counter shards.'))
@@ -0,0 +1,34 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:16
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_vote_counters(apps, schema_editor):
+    Poll = apps.get_model('poll', 'Poll')
+    Choice = apps.get_model('poll', 'Choice')
+    for choice in Choice.objects.annotate(actual_vote_count=Count('votes')).iterator():
+        Choice.objects.filter(pk=choice.pk).update(vote_count=choice.actual_vote_count)
+    for poll in Poll.objects.annotate(actual_vote_count=Sum('choices__vote_count')).iterator():
+        Poll.objects.filter(pk=poll.pk).update(vote_count=poll.actual_vote_count or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0015_vote_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='vote_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='poll',
+            name='vote_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_vote_counters, migrations.RunPython.noop),
+    ]
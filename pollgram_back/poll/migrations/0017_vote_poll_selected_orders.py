@@ -0,0 +1,24 @@
+# Generated by Django 3.1.7 on 2026-10-18 09:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0016_vote_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='poll',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='poll.poll'),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='selected_orders',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.1.7 on 2026-10-18 09:03
+
+from django.db import migrations
+from django.db.models import F
+
+
+def compact_votes(apps, schema_editor):
+    """
+    Store every vote as one row per (user, poll) with the selected choice orders as a bitmask.
+    Votes whose selected choices span several polls are split, duplicated votes of a user on a poll are merged.
+    """
+    Vote = apps.get_model('poll', 'Vote')
+    Choice = apps.get_model('poll', 'Choice')
+    Poll = apps.get_model('poll', 'Poll')
+    kept_votes = {}
+    merged_poll_ids = set()
+    for vote in Vote.objects.order_by('pk').iterator():
+        selected_orders_by_poll = {}
+        for poll_id, order in vote.selected.values_list('poll', 'order'):
+            selected_orders_by_poll[poll_id] = selected_orders_by_poll.get(poll_id, 0) | (1 << order)
+        if not selected_orders_by_poll:
+            vote.delete()
+            continue
+        updated_current_vote = False
+        for poll_id, selected_orders in selected_orders_by_poll.items():
+            kept_vote = kept_votes.get((vote.user_id, poll_id))
+            if kept_vote is not None:
+                kept_vote.selected_orders |= selected_orders
+                kept_vote.save(update_fields=['selected_orders'])
+                merged_poll_ids.add(poll_id)
+            elif not updated_current_vote:
+                vote.poll_id = poll_id
+                vote.selected_orders = selected_orders
+                vote.save(update_fields=['poll', 'selected_orders'])
+                kept_votes[(vote.user_id, poll_id)] = vote
+                updated_current_vote = True
+            else:
+                split_vote = Vote.objects.create(user_id=vote.user_id, poll_id=poll_id, selected_orders=selected_orders)
+                Vote.objects.filter(pk=split_vote.pk).update(created_at=vote.created_at)
+                kept_votes[(vote.user_id, poll_id)] = split_vote
+        if not updated_current_vote:
+            vote.delete()
+
+    # merged duplicates were counted once per row by the stored counters
+    for poll_id in merged_poll_ids:
+        poll_total = 0
+        for choice in Choice.objects.filter(poll=poll_id):
+            vote_count = Vote.objects.filter(poll=poll_id).annotate(
+                selected_bit=F('selected_orders').bitand(1 << choice.order)).filter(selected_bit__gt=0).count()
+            Choice.objects.filter(pk=choice.pk).update(vote_count=vote_count)
+            poll_total += vote_count
+        Poll.objects.filter(pk=poll_id).update(vote_count=poll_total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0017_vote_poll_selected_orders'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_votes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.7 on 2026-10-18 09:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0018_compact_votes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='vote',
+            name='selected',
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='poll',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='poll.poll'),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='selected_orders',
+            field=models.PositiveSmallIntegerField(),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('user', 'poll'), name='unique_vote_per_user_and_poll'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0020_timeline'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['poll', 'parent', '-created_at', '-id'], name='comment_poll_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['parent', '-created_at', '-id'], name='comment_parent_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(fields=['creator', '-created_at', '-id'], name='poll_creator_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='poll_category_created_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:28
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_comment_counters(apps, schema_editor):
+    Comment = apps.get_model('poll', 'Comment')
+    for field_name, relation in (('likes_count', 'likes'), ('dislikes_count', 'dislikes'),
+                                 ('replies_count', 'replies')):
+        comments = Comment.objects.annotate(actual_count=Count(relation)).filter(actual_count__gt=0)
+        for comment in comments.iterator():
+            Comment.objects.filter(pk=comment.pk).update(**{field_name: comment.actual_count})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0021_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_comment_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['poll', 'parent', '-likes_count', '-created_at', '-id'], name='comment_poll_likes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['poll', 'parent', '-dislikes_count', '-created_at', '-id'], name='comment_poll_dislikes_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:29
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef
+import django.db.models.deletion
+
+LIKE, DISLIKE = 1, -1
+BATCH_SIZE = 1000
+
+
+def convert_reactions(apps, schema_editor):
+    Comment = apps.get_model('poll', 'Comment')
+    CommentReaction = apps.get_model('poll', 'CommentReaction')
+    Like, Dislike = Comment.likes.through, Comment.dislikes.through
+    # a user is in at most one of the two relations, a like wins if both were ever written
+    liked = Like.objects.filter(comment_id=OuterRef('comment_id'), user_id=OuterRef('user_id'))
+    for rows, value in ((Like.objects.all(), LIKE), (Dislike.objects.filter(~Exists(liked)), DISLIKE)):
+        reactions = []
+        for comment_id, user_id in rows.values_list('comment_id', 'user_id').iterator():
+            reactions.append(CommentReaction(comment_id=comment_id, user_id=user_id, value=value))
+            if len(reactions) == BATCH_SIZE:
+                CommentReaction.objects.bulk_create(reactions)
+                reactions = []
+        CommentReaction.objects.bulk_create(reactions)
+    for field_name, value in (('likes_count', LIKE), ('dislikes_count', DISLIKE)):
+        Comment.objects.update(**{field_name: 0})
+        counts = CommentReaction.objects.filter(value=value).values_list('comment').annotate(count=Count('pk'))
+        for comment_id, count in counts.iterator():
+            Comment.objects.filter(pk=comment_id).update(**{field_name: count})
+
+
+def restore_reaction_relations(apps, schema_editor):
+    Comment = apps.get_model('poll', 'Comment')
+    CommentReaction = apps.get_model('poll', 'CommentReaction')
+    for relation, value in ((Comment.likes.through, LIKE), (Comment.dislikes.through, DISLIKE)):
+        rows = CommentReaction.objects.filter(value=value).values_list('comment_id', 'user_id').iterator()
+        relation.objects.bulk_create([relation(comment_id=comment_id, user_id=user_id) for comment_id, user_id in rows],
+                                     batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('poll', '0022_comment_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentReaction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.SmallIntegerField(choices=[(1, 'like'), (-1, 'dislike')])),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reactions', to='poll.comment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_reactions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='commentreaction',
+            constraint=models.UniqueConstraint(fields=('comment', 'user'), name='unique_reaction_per_user_and_comment'),
+        ),
+        migrations.RunPython(convert_reactions, restore_reaction_relations),
+    ]
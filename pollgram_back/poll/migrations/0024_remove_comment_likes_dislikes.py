@@ -0,0 +1,21 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:29
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0023_commentreaction'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='comment',
+            name='dislikes',
+        ),
+        migrations.RemoveField(
+            model_name='comment',
+            name='likes',
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:36
+
+from collections import Counter
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+HOUR, DAY = 'H', 'D'
+POLL_TOTAL = -1
+BATCH_SIZE = 1000
+
+
+def get_bucket_start(moment, bucket):
+    local_moment = timezone.localtime(moment)
+    if bucket == HOUR:
+        return local_moment - timedelta(minutes=local_moment.minute, seconds=local_moment.second,
+                                        microseconds=local_moment.microsecond)
+    local_start = local_moment.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    return timezone.make_aware(local_start, is_dst=False)
+
+
+def complete_sqlite_vote_dates(apps, schema_editor):
+    # postgresql casts the dates to midnight when the column type changes, sqlite keeps the bare date text
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("UPDATE poll_vote SET created_at = created_at || ' 00:00:00' WHERE length(created_at) = 10")
+
+
+def fill_vote_rollups(apps, schema_editor):
+    # the votes cast before this migration only have a date, so their hour buckets are the midnight of that date
+    Vote = apps.get_model('poll', 'Vote')
+    VoteRollup = apps.get_model('poll', 'VoteRollup')
+    poll_ids = Vote.objects.order_by().values_list('poll_id', flat=True).distinct()
+    for poll_id in poll_ids.iterator():
+        counts = Counter()
+        for created_at, selected_orders in Vote.objects.filter(poll_id=poll_id) \
+                .values_list('created_at', 'selected_orders').iterator():
+            orders = [POLL_TOTAL] + [order for order in range(selected_orders.bit_length())
+                                     if selected_orders & (1 << order)]
+            for bucket in (HOUR, DAY):
+                bucket_start = get_bucket_start(created_at, bucket)
+                for order in orders:
+                    counts[(bucket, bucket_start, order)] += 1
+        VoteRollup.objects.bulk_create([
+            VoteRollup(poll_id=poll_id, bucket=bucket, bucket_start=bucket_start, order=order, count=count)
+            for (bucket, bucket_start, order), count in counts.items()
+        ], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0024_remove_comment_likes_dislikes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vote',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.RunPython(complete_sqlite_vote_dates, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='VoteRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(choices=[('H', 'hour'), ('D', 'day')], max_length=1)),
+                ('bucket_start', models.DateTimeField()),
+                ('order', models.SmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_rollups', to='poll.poll')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='voterollup',
+            constraint=models.UniqueConstraint(fields=('poll', 'bucket', 'bucket_start', 'order'), name='unique_vote_rollup'),
+        ),
+        migrations.RunPython(fill_vote_rollups, migrations.RunPython.noop),
+    ]
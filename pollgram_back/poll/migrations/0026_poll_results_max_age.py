@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0025_vote_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poll',
+            name='results_max_age',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
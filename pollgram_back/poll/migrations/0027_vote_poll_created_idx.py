@@ -0,0 +1,17 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0026_poll_results_max_age'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['poll', '-created_at', '-id'], name='vote_poll_created_idx'),
+        ),
+    ]
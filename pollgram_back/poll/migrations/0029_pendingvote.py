@@ -0,0 +1,35 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('poll', '0028_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poll',
+            name='buffers_votes',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='PendingVote',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('selected_orders', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_votes', to='poll.poll')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_votes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='pendingvote',
+            constraint=models.UniqueConstraint(fields=('user', 'poll'), name='unique_pending_vote_per_user_and_poll'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0029_pendingvote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteCounterShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order', models.PositiveSmallIntegerField()),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='voterollup',
+            name='unique_vote_rollup',
+        ),
+        migrations.AddField(
+            model_name='poll',
+            name='counter_shards',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='voterollup',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='voterollup',
+            name='count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='voterollup',
+            constraint=models.UniqueConstraint(fields=('poll', 'bucket', 'bucket_start', 'order', 'shard'), name='unique_vote_rollup'),
+        ),
+        migrations.AddField(
+            model_name='votecountershard',
+            name='poll',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_counter_shards', to='poll.poll'),
+        ),
+        migrations.AddConstraint(
+            model_name='votecountershard',
+            constraint=models.UniqueConstraint(fields=('poll', 'order', 'shard'), name='unique_vote_counter_shard'),
+        ),
+    ]
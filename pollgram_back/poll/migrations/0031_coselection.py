@@ -0,0 +1,53 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:54
+
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def fill_co_selections(apps, schema_editor):
+    Vote = apps.get_model('poll', 'Vote')
+    CoSelection = apps.get_model('poll', 'CoSelection')
+    poll_ids = Vote.objects.filter(poll__max_choice_can_vote__gt=1).order_by() \
+        .values_list('poll_id', flat=True).distinct()
+    for poll_id in poll_ids.iterator():
+        counts = Counter()
+        for selected_orders in Vote.objects.filter(poll_id=poll_id).values_list('selected_orders', flat=True) \
+                .iterator():
+            orders = [order for order in range(selected_orders.bit_length()) if selected_orders & (1 << order)]
+            for i, first_order in enumerate(orders):
+                for second_order in orders[i:]:
+                    counts[(first_order, second_order)] += 1
+        CoSelection.objects.bulk_create([
+            CoSelection(poll_id=poll_id, first_order=first_order, second_order=second_order, count=count)
+            for (first_order, second_order), count in counts.items()
+        ], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0030_vote_counter_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoSelection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_order', models.PositiveSmallIntegerField()),
+                ('second_order', models.PositiveSmallIntegerField()),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_selections', to='poll.poll')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='coselection',
+            constraint=models.UniqueConstraint(fields=('poll', 'first_order', 'second_order', 'shard'), name='unique_co_selection'),
+        ),
+        migrations.RunPython(fill_co_selections, migrations.RunPython.noop),
+    ]
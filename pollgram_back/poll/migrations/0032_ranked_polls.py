@@ -0,0 +1,43 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0031_coselection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingvote',
+            name='ranking',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='poll',
+            name='is_ranked',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='ranking',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RankedBallot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ranking', models.BigIntegerField()),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ranked_ballots', to='poll.poll')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='rankedballot',
+            constraint=models.UniqueConstraint(fields=('poll', 'ranking', 'shard'), name='unique_ranked_ballot'),
+        ),
+    ]
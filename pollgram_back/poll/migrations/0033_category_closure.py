@@ -0,0 +1,41 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_category_closure(apps, schema_editor):
+    Category = apps.get_model('poll', 'Category')
+    CategoryClosure = apps.get_model('poll', 'CategoryClosure')
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    closures = []
+    for category_id in parents:
+        ancestor_id, depth = category_id, 0
+        while ancestor_id is not None:
+            closures.append(CategoryClosure(ancestor_id=ancestor_id, descendant_id=category_id, depth=depth))
+            ancestor_id, depth = parents[ancestor_id], depth + 1
+    CategoryClosure.objects.bulk_create(closures, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0032_ranked_polls'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='poll.category')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='poll.category')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='categoryclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_category_closure'),
+        ),
+        migrations.RunPython(fill_category_closure, migrations.RunPython.noop),
+    ]
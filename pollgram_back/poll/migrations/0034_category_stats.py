@@ -0,0 +1,69 @@
+# Generated by Django 3.1.7 on 2026-10-18 09:02
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.utils import timezone
+import django.db.models.deletion
+
+HOUR = 'H'
+POLL_TOTAL = -1
+# the hour buckets summed by the recent vote counts of the categories, up to a week
+BACKFILLED_HOURS = 7 * 24
+
+
+def fill_category_stats(apps, schema_editor):
+    Poll = apps.get_model('poll', 'Poll')
+    VoteRollup = apps.get_model('poll', 'VoteRollup')
+    CategoryStats = apps.get_model('poll', 'CategoryStats')
+    CategoryVoteRollup = apps.get_model('poll', 'CategoryVoteRollup')
+    poll_counts = Poll.objects.filter(category__isnull=False).order_by().values_list('category') \
+        .annotate(count=Count('id'))
+    CategoryStats.objects.bulk_create([CategoryStats(category_id=category_id, poll_count=count)
+                                       for category_id, count in poll_counts], batch_size=1000)
+    vote_counts = VoteRollup.objects.filter(bucket=HOUR, order=POLL_TOTAL, poll__category__isnull=False,
+                                            bucket_start__gte=timezone.now() - timedelta(hours=BACKFILLED_HOURS)) \
+        .order_by().values_list('poll__category', 'bucket_start').annotate(count=Sum('count'))
+    CategoryVoteRollup.objects.bulk_create([
+        CategoryVoteRollup(category_id=category_id, bucket_start=bucket_start, count=count)
+        for category_id, bucket_start, count in vote_counts if count
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0033_category_closure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='poll.category')),
+                ('poll_count', models.IntegerField(default=0)),
+                ('top_polls', models.JSONField(default=list)),
+                ('top_polls_refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryVoteRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_rollups', to='poll.category')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='categoryvoterollup',
+            index=models.Index(fields=['bucket_start'], name='category_vote_rollup_start_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='categoryvoterollup',
+            constraint=models.UniqueConstraint(fields=('category', 'bucket_start', 'shard'), name='unique_category_vote_rollup'),
+        ),
+        migrations.RunPython(fill_category_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.1.7 on 2026-10-18 09:05
+
+from collections import Counter
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+# the hours of the default trending window, the likes have no time and are counted from now on
+BACKFILLED_HOURS = 48
+
+
+def get_hour_start(moment):
+    local_moment = timezone.localtime(moment)
+    return local_moment - timedelta(minutes=local_moment.minute, seconds=local_moment.second,
+                                    microseconds=local_moment.microsecond)
+
+
+def fill_poll_activity(apps, schema_editor):
+    Comment = apps.get_model('poll', 'Comment')
+    PollActivityRollup = apps.get_model('poll', 'PollActivityRollup')
+    comments = Comment.objects.filter(created_at__gte=timezone.now() - timedelta(hours=BACKFILLED_HOURS)) \
+        .values_list('poll', 'created_at')
+    counts = Counter((poll_id, get_hour_start(created_at)) for poll_id, created_at in comments.iterator())
+    PollActivityRollup.objects.bulk_create([
+        PollActivityRollup(poll_id=poll_id, bucket_start=bucket_start, comments=count)
+        for (poll_id, bucket_start), count in counts.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0034_category_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingPoll',
+            fields=[
+                ('poll', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='poll.poll')),
+                ('rank', models.PositiveIntegerField(unique=True)),
+                ('score', models.FloatField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PollActivityRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('comments', models.IntegerField(default=0)),
+                ('likes', models.IntegerField(default=0)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_rollups', to='poll.poll')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pollactivityrollup',
+            index=models.Index(fields=['bucket_start'], name='poll_activity_start_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pollactivityrollup',
+            constraint=models.UniqueConstraint(fields=('poll', 'bucket_start'), name='unique_poll_activity_rollup'),
+        ),
+        migrations.RunPython(fill_poll_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+from itertools import islice
+
+from django.db import migrations
+
+# no stemming, the questions are written in several languages
+SEARCH_CONFIG = 'simple'
+# the polls are read and inserted in chunks, so the whole table is never held in memory
+CHUNK_SIZE = 1000
+
+
+def create_search_index(apps, schema_editor):
+    Poll = apps.get_model('poll', 'Poll')
+    polls = Poll.objects.values_list('id', 'question', 'description').order_by('id')
+    # a tsvector with a gin index on postgresql, a fts5 table keyed by the poll id on sqlite. The rows of the
+    # deleted polls are removed by the post_delete signal, a foreign key would stop the flush from truncating polls
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE TABLE poll_pollsearch (poll_id integer PRIMARY KEY, vector tsvector NOT NULL)')
+        schema_editor.execute('CREATE INDEX poll_search_vector_idx ON poll_pollsearch USING gin (vector)')
+        insert = (f"INSERT INTO poll_pollsearch (poll_id, vector) "
+                  f"VALUES (%s, setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'A') || "
+                  f"setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'B'))")
+    else:
+        schema_editor.execute('CREATE VIRTUAL TABLE poll_pollsearch USING fts5(question, description)')
+        insert = 'INSERT INTO poll_pollsearch (rowid, question, description) VALUES (%s, %s, %s)'
+    rows = polls.iterator(chunk_size=CHUNK_SIZE)
+    with schema_editor.connection.cursor() as cursor:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        while chunk:
+            cursor.executemany(insert, chunk)
+            chunk = list(islice(rows, CHUNK_SIZE))
+
+
+def drop_search_index(apps, schema_editor):
+    schema_editor.execute('DROP TABLE poll_pollsearch')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0035_trending_polls'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
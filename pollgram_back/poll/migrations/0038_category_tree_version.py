@@ -0,0 +1,20 @@
+# Generated by Django 3.1.7 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0037_vote_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryTreeVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(default='', max_length=32)),
+            ],
+        ),
+    ]
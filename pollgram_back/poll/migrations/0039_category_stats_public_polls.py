@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def count_public_polls(apps, schema_editor):
+    # the counters were filled with the polls of private pages too, they are counted again without them
+    Poll = apps.get_model('poll', 'Poll')
+    CategoryStats = apps.get_model('poll', 'CategoryStats')
+    poll_counts = dict(Poll.objects.filter(category__isnull=False, creator__is_public=True).order_by()
+                       .values_list('category').annotate(count=Count('id')))
+    stats = list(CategoryStats.objects.all())
+    for category_stats in stats:
+        category_stats.poll_count = poll_counts.get(category_stats.category_id, 0)
+    CategoryStats.objects.bulk_update(stats, ['poll_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0038_category_tree_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_public_polls, migrations.RunPython.noop),
+    ]
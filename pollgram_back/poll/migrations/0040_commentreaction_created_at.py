@@ -0,0 +1,19 @@
+# Generated by Django 3.1.7 on 2026-10-18 09:26
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0039_category_stats_public_polls'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commentreaction',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
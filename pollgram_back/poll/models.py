@@ -1,8 +1,16 @@
+import hashlib
+import json
 import os
+import random
 import uuid
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.cache import cache
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 from socialmedia.models import User
 
@@ -39,11 +47,32 @@ class Image(models.Model):
                               validators=[validate_image_size])
 
 
+class CategoryQuerySet(models.QuerySet):
+    def get_tree(self):
+        """
+        Return the root categories with their sub categories at any depth set on them, read with one query.
+        get_sub_categories of every returned category then reads no more rows.
+        """
+        categories = list(self.order_by('order', 'id'))
+        sub_categories = {category.pk: [] for category in categories}
+        roots = []
+        for category in categories:
+            if category.parent_id is None:
+                roots.append(category)
+            elif category.parent_id in sub_categories:
+                sub_categories[category.parent_id].append(category)
+        for category in categories:
+            category._prefetched_objects_cache = {'sub_categories': sub_categories[category.pk]}
+        return roots
+
+
 class Category(models.Model):
     name = models.CharField(max_length=30)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='sub_categories', blank=True, null=True)
     order = models.IntegerField()
 
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = 'Categories'
         ordering = ('order',)
@@ -52,9 +81,106 @@ class Category(models.Model):
         return 'Category = name: {}, id: {}, parent_id: {}'.format(self.name, self.id,
                                                                    '{}' if self.parent is None else self.parent.id)
 
+    def save(self, *args, **kwargs):
+        # the CategoryClosure rows follow the parent, the rows of deleted categories are deleted by the cascade
+        with transaction.atomic():
+            old_parent_id = None
+            is_new = self.pk is None or not Category.objects.filter(pk=self.pk).exists()
+            if not is_new:
+                old_parent_id = Category.objects.filter(pk=self.pk).values_list('parent', flat=True).get()
+                if self.parent_id is not None and \
+                        CategoryClosure.objects.filter(ancestor=self.pk, descendant=self.parent_id).exists():
+                    raise ValidationError('a category can not be moved under itself or its sub categories')
+            super(Category, self).save(*args, **kwargs)
+            if is_new:
+                CategoryClosure.objects.create(ancestor=self, descendant=self, depth=0)
+                CategoryClosure.objects.add_subtree(self)
+            elif old_parent_id != self.parent_id:
+                CategoryClosure.objects.remove_subtree(self)
+                CategoryClosure.objects.add_subtree(self)
+
     def get_sub_categories(self):
         return self.sub_categories.all()
 
+    def get_subtree_ids(self):
+        """Return the query of the ids of the category and all of its sub categories at any depth."""
+        return CategoryClosure.objects.filter(ancestor=self).values('descendant')
+
+
+class CategoryClosureQuerySet(models.QuerySet):
+    def add_subtree(self, category):
+        """Link the subtree of the category, itself included, to the ancestors of its parent."""
+        if category.parent_id is None:
+            return
+        ancestors = list(self.filter(descendant=category.parent_id).values_list('ancestor', 'depth'))
+        descendants = list(self.filter(ancestor=category).values_list('descendant', 'depth'))
+        self.bulk_create([
+            CategoryClosure(ancestor_id=ancestor_id, descendant_id=descendant_id,
+                            depth=ancestor_depth + descendant_depth + 1)
+            for ancestor_id, ancestor_depth in ancestors for descendant_id, descendant_depth in descendants
+        ])
+
+    def remove_subtree(self, category):
+        """Unlink the subtree of the category from the ancestors of the category, the links inside it stay."""
+        subtree_ids = list(self.filter(ancestor=category).values_list('descendant', flat=True))
+        self.filter(descendant__in=subtree_ids).exclude(ancestor__in=subtree_ids).delete()
+
+
+class CategoryClosure(models.Model):
+    """
+    A category and one of its sub categories at any depth, every category is also paired with itself at depth 0.
+    The polls of a subtree are read with one join on it.
+    """
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveSmallIntegerField()
+
+    objects = CategoryClosureQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_category_closure'),
+        ]
+
+    def __str__(self):
+        return 'CategoryClosure = ancestorId: {}, descendantId: {}, depth: {}'.format(
+            self.ancestor_id, self.descendant_id, self.depth)
+
+
+class CategoryTreeVersionQuerySet(models.QuerySet):
+    def get_version(self):
+        """Return the version stamp of the category tree, empty until the categories are first changed."""
+        return self.filter(pk=CategoryTreeVersion.ROW_ID).values_list('version', flat=True).first() or ''
+
+    def bump(self):
+        """Give the category tree a new version stamp, written in the transaction of the change of the categories."""
+        self.bulk_create([CategoryTreeVersion(pk=CategoryTreeVersion.ROW_ID)], ignore_conflicts=True)
+        # random rather than counted, a rolled back bump can't be handed out again for another tree
+        self.filter(pk=CategoryTreeVersion.ROW_ID).update(version=uuid.uuid4().hex)
+
+
+class CategoryTreeVersion(models.Model):
+    """
+    The one row holding the version stamp of the category tree. It is read by every worker, so a change of the
+    categories is seen by all of them once it is committed, whatever cache backend they use.
+    """
+    ROW_ID = 1
+
+    version = models.CharField(max_length=32, default='')
+
+    objects = CategoryTreeVersionQuerySet.as_manager()
+
+    def __str__(self):
+        return 'CategoryTreeVersion = version: {}'.format(self.version)
+
+
+class PollQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Exclude the polls of the users who have blocked the user."""
+        if not user.blocker_ids:
+            return self
+        return self.exclude(creator__in=user.blocker_ids)
+
 
 class Poll(models.Model):
     class PollVisibilityStatus(models.TextChoices):
@@ -79,18 +205,61 @@ class Poll(models.Model):
     visibility_status = models.CharField(max_length=2, choices=PollVisibilityStatus.choices,
                                          default=PollVisibilityStatus.VISIBLE_AFTER_VOTE)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='polls', null=True)
+    # sum of the choices vote counters, maintained by the vote and retract paths
+    vote_count = models.PositiveIntegerField(default=0, editable=False)
+    # set when the poll is written to the followers timelines, otherwise the followers pull it at read time
+    fanned_out = models.BooleanField(default=False, editable=False)
+    # seconds the cached result snapshot of a hot poll is served for, null drops the snapshot on every vote
+    results_max_age = models.PositiveIntegerField(null=True, blank=True)
+    # votes are queued as PendingVote rows and applied in batches by the applypendingvotes command
+    buffers_votes = models.BooleanField(default=False)
+    # number of VoteCounterShard rows per choice the votes are counted on, null uses VOTE_COUNTER_SHARDS,
+    # change it with the shardvotecounters command which folds the shards of a poll going back to one
+    counter_shards = models.PositiveSmallIntegerField(null=True, blank=True)
+    # the voters rank the selected choices and the poll is decided by instant-runoff rounds over the rankings
+    is_ranked = models.BooleanField(default=False)
+
+    objects = PollQuerySet.as_manager()
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['creator', '-created_at'], name='poll_pulled_creator_idx',
+                         condition=models.Q(fanned_out=False)),
+            models.Index(fields=['creator', '-created_at', '-id'], name='poll_creator_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='poll_category_created_idx'),
+        ]
 
     def __str__(self):
         return 'Poll = id: {}, creator: {}, question: {}'.format(self.id, self.creator, self.question)
 
+    def uses_vote_buffer(self):
+        return self.buffers_votes or settings.VOTE_BUFFER_ALL_POLLS
+
+    def get_counter_shards(self):
+        return self.counter_shards or settings.VOTE_COUNTER_SHARDS
+
+    def pick_counter_shard(self):
+        return random.randrange(self.get_counter_shards())
+
+    def is_multi_choice(self):
+        return self.max_choice_can_vote > 1
+
+    def update_vote_counters(self, orders, delta, shard=None):
+        # must run inside the transaction that adds or removes the votes
+        if self.get_counter_shards() > 1:
+            # the votes of a sharded poll spread over the shard rows instead of locking the choice and poll rows
+            VoteCounterShard.objects.add(self, orders, delta, self.pick_counter_shard() if shard is None else shard)
+            return
+        Choice.objects.filter(poll=self, order__in=orders).update(vote_count=F('vote_count') + delta)
+        Poll.objects.filter(pk=self.pk).update(vote_count=F('vote_count') + delta * len(orders))
+
 
 class Choice(models.Model):
     context = models.CharField(max_length=100)
     poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='choices')
     order = models.PositiveSmallIntegerField(validators=[MaxValueValidator(10)])
+    vote_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         indexes = [
@@ -99,19 +268,665 @@ class Choice(models.Model):
         unique_together = ['poll', 'order']
 
     def get_votes(self):
-        return self.votes.all()
+        return Vote.objects.filter(poll=self.poll_id).selecting(self.order)
 
     def __str__(self):
         return 'Choice = id: {}, context: {}'.format(self.id, self.context)
 
 
+class VoteQuerySet(models.QuerySet):
+    def selecting(self, order):
+        return self.annotate(selected_bit=F('selected_orders').bitand(Vote.order_bit(order))).filter(selected_bit__gt=0)
+
+    def visible_to(self, user):
+        """Exclude the votes of the users who have blocked the user."""
+        if not user.blocker_ids:
+            return self
+        return self.exclude(user__in=user.blocker_ids)
+
+
 class Vote(models.Model):
+    # orders are capped at 10, so an order plus one fits in 4 bits and the 10 preferences in 40
+    RANKING_BITS = 4
+    RANKING_MASK = (1 << RANKING_BITS) - 1
+
     user = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name='votes')
-    selected = models.ManyToManyField(Choice, related_name='votes')
-    created_at = models.DateField(auto_now_add=True)
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='votes')
+    # bit n is set when the choice with order n is selected, orders are capped at 10 by Choice.order
+    selected_orders = models.PositiveSmallIntegerField()
+    # the selected orders of a ranked poll from the first preference on, packed by Vote.encode_ranking
+    ranking = models.BigIntegerField(null=True, blank=True)
+    # a default instead of auto_now_add, which would override the time of the buffered votes when they are applied
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = VoteQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'poll'], name='unique_vote_per_user_and_poll'),
+        ]
+        indexes = [
+            # the voters of a choice are walked on it, the selected bit is checked on the walked rows
+            models.Index(fields=['poll', '-created_at', '-id'], name='vote_poll_created_idx'),
+        ]
 
     def __str__(self):
-        return 'Vote = id: {}, userId: {}, choiceId: {}'.format(self.id, self.user.id, self.selected.id)
+        return 'Vote = id: {}, userId: {}, pollId: {}, selected: {}'.format(self.id, self.user_id, self.poll_id,
+                                                                           self.get_selected_orders())
+
+    @staticmethod
+    def order_bit(order):
+        return 1 << order
+
+    @staticmethod
+    def encode_orders(orders):
+        selected_orders = 0
+        for order in orders:
+            selected_orders |= Vote.order_bit(order)
+        return selected_orders
+
+    @staticmethod
+    def decode_orders(selected_orders):
+        return [order for order in range(selected_orders.bit_length()) if selected_orders & Vote.order_bit(order)]
+
+    @staticmethod
+    def encode_ranking(orders):
+        # RANKING_BITS per preference, the first one in the lowest bits, an order is stored plus one so zero ends it
+        ranking = 0
+        for position, order in enumerate(orders):
+            ranking |= (order + 1) << (Vote.RANKING_BITS * position)
+        return ranking
+
+    @staticmethod
+    def decode_ranking(ranking):
+        orders = []
+        while ranking:
+            orders.append((ranking & Vote.RANKING_MASK) - 1)
+            ranking >>= Vote.RANKING_BITS
+        return orders
+
+    def get_selected_orders(self):
+        return self.decode_orders(self.selected_orders)
+
+    def get_ranking(self):
+        return self.decode_ranking(self.ranking) if self.ranking is not None else None
+
+
+class PendingVote(models.Model):
+    """A vote on a poll which buffers its votes, acknowledged to the voter and not applied yet."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pending_votes')
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='pending_votes')
+    selected_orders = models.PositiveSmallIntegerField()
+    ranking = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'poll'], name='unique_pending_vote_per_user_and_poll'),
+        ]
+
+    def __str__(self):
+        return 'PendingVote = id: {}, userId: {}, pollId: {}, selected: {}'.format(
+            self.id, self.user_id, self.poll_id, self.get_selected_orders())
+
+    def get_selected_orders(self):
+        return Vote.decode_orders(self.selected_orders)
+
+    def get_ranking(self):
+        return Vote.decode_ranking(self.ranking) if self.ranking is not None else None
+
+
+class VoteCounterShardQuerySet(models.QuerySet):
+    def add(self, poll, orders, delta, shard):
+        # must run inside the transaction that adds or removes the votes
+        self.bulk_create([VoteCounterShard(poll=poll, order=order, shard=shard) for order in orders],
+                         ignore_conflicts=True)
+        self.filter(poll=poll, order__in=orders, shard=shard).update(count=F('count') + delta)
+
+    def get_counts(self, poll_ids):
+        """
+        Return the dict of the poll id to the dict of the choice order to the sum of its shards, for the given
+        polls. The sums are cached for VOTE_COUNTER_SHARDS_CACHE_TIMEOUT seconds.
+        """
+        keys = {VoteCounterShard.get_cache_key(poll_id): poll_id for poll_id in poll_ids}
+        counts = {keys[key]: poll_counts for key, poll_counts in cache.get_many(keys).items()}
+        missing_poll_ids = [poll_id for poll_id in poll_ids if poll_id not in counts]
+        if missing_poll_ids:
+            missing_counts = {poll_id: {} for poll_id in missing_poll_ids}
+            rows = self.filter(poll__in=missing_poll_ids).order_by().values_list('poll', 'order') \
+                .annotate(count=Sum('count'))
+            for poll_id, order, count in rows:
+                missing_counts[poll_id][order] = count
+            cache.set_many({VoteCounterShard.get_cache_key(poll_id): poll_counts
+                            for poll_id, poll_counts in missing_counts.items()},
+                           settings.VOTE_COUNTER_SHARDS_CACHE_TIMEOUT)
+            counts.update(missing_counts)
+        return counts
+
+    def fold(self, poll):
+        """Move the shard sums of the poll to the stored counters of its choices and itself."""
+        with transaction.atomic():
+            # the rows are zeroed instead of deleted, so a concurrent increment waiting on them is not lost
+            shards = list(self.select_for_update().filter(poll=poll).exclude(count=0))
+            choice_counts = Counter()
+            for shard in shards:
+                choice_counts[shard.order] += shard.count
+            orders_per_count = {}
+            for order, count in choice_counts.items():
+                orders_per_count.setdefault(count, []).append(order)
+            for count, orders in orders_per_count.items():
+                Choice.objects.filter(poll=poll, order__in=orders).update(vote_count=F('vote_count') + count)
+            Poll.objects.filter(pk=poll.pk).update(vote_count=F('vote_count') + sum(shard.count for shard in shards))
+            for shard in shards:
+                self.filter(pk=shard.pk).update(count=F('count') - shard.count)
+        cache.delete(VoteCounterShard.get_cache_key(poll.pk))
+        return len(shards)
+
+
+class VoteCounterShard(models.Model):
+    """Part of the vote counter of a choice of a sharded poll, the votes pick one of the shards at random."""
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='vote_counter_shards')
+    order = models.PositiveSmallIntegerField()
+    shard = models.PositiveSmallIntegerField()
+    # a shard may go below zero when a vote is retracted on another shard than it was counted on
+    count = models.IntegerField(default=0)
+
+    objects = VoteCounterShardQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['poll', 'order', 'shard'], name='unique_vote_counter_shard'),
+        ]
+
+    def __str__(self):
+        return 'VoteCounterShard = pollId: {}, order: {}, shard: {}, count: {}'.format(
+            self.poll_id, self.order, self.shard, self.count)
+
+    @staticmethod
+    def get_cache_key(poll_id):
+        return 'poll-counter-shards:{}'.format(poll_id)
+
+
+class VoteRollupQuerySet(models.QuerySet):
+    def record(self, vote, delta, shard=0):
+        self.record_many([vote], delta, shard)
+
+    def record_many(self, votes, delta, shard=0):
+        """
+        Add delta to the hour and day buckets of the votes in the shard, for the poll totals and each selected
+        choice. Must run inside the transaction that adds or removes the votes.
+        """
+        counts = Counter()
+        for vote in votes:
+            for bucket in (VoteRollup.Bucket.HOUR, VoteRollup.Bucket.DAY):
+                bucket_start = VoteRollup.get_bucket_start(vote.created_at, bucket)
+                for order in [VoteRollup.POLL_TOTAL] + vote.get_selected_orders():
+                    counts[(vote.poll_id, bucket, bucket_start, order)] += 1
+        # a retract may land on a shard the vote was not counted on, so its rows are created too
+        self.bulk_create([
+            VoteRollup(poll_id=poll_id, bucket=bucket, bucket_start=bucket_start, order=order, shard=shard)
+            for poll_id, bucket, bucket_start, order in counts
+        ], ignore_conflicts=True)
+        # one update per bucket and count, the orders of a single vote share both
+        orders_per_update = {}
+        for (poll_id, bucket, bucket_start, order), count in counts.items():
+            orders_per_update.setdefault((poll_id, bucket, bucket_start, count), []).append(order)
+        for (poll_id, bucket, bucket_start, count), orders in orders_per_update.items():
+            self.filter(poll=poll_id, bucket=bucket, bucket_start=bucket_start, order__in=orders, shard=shard) \
+                .update(count=F('count') + delta * count)
+
+    def get_series(self, poll, start, end, bucket):
+        """
+        Return the vote counts of the poll in the buckets starting from start up to end, both truncated to
+        the bucket. A week bucket is summed up from the day buckets of its days.
+        Each item has bucket_start, count and a choices dict of the order to count of the selected choices.
+        """
+        stored_bucket = VoteRollup.Bucket.DAY if bucket == VoteRollup.WEEK else bucket
+        bucket_starts = VoteRollup.get_bucket_starts(start, end, bucket)
+        series = {bucket_start: {'bucket_start': bucket_start, 'count': 0, 'choices': {}}
+                  for bucket_start in bucket_starts}
+        rows = self.filter(poll=poll, bucket=stored_bucket, bucket_start__gte=bucket_starts[0],
+                           bucket_start__lt=VoteRollup.get_next_bucket_start(bucket_starts[-1], bucket)) \
+            .values_list('bucket_start', 'order', 'count')
+        for row_start, order, count in rows:
+            item = series[VoteRollup.get_bucket_start(row_start, bucket)]
+            if order == VoteRollup.POLL_TOTAL:
+                item['count'] += count
+            elif count:
+                item['choices'][order] = item['choices'].get(order, 0) + count
+        return list(series.values())
+
+
+class VoteRollup(models.Model):
+    """Vote counts of a poll per hour and per day, the buckets are aligned to the current time zone."""
+
+    class Bucket(models.TextChoices):
+        HOUR = 'H', 'hour'
+        DAY = 'D', 'day'
+
+    # read-only granularity, summed up from the day buckets
+    WEEK = 'W'
+    # order of the rows counting the votes of the poll, a multi-choice vote is counted once in them
+    POLL_TOTAL = -1
+
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='vote_rollups')
+    bucket = models.CharField(max_length=1, choices=Bucket.choices)
+    bucket_start = models.DateTimeField()
+    order = models.SmallIntegerField()
+    # the counter shard of the vote path, a bucket of a sharded poll is the sum of its shard rows
+    shard = models.PositiveSmallIntegerField(default=0)
+    # a shard row may go below zero when a vote is retracted on another shard than it was counted on
+    count = models.IntegerField(default=0)
+
+    objects = VoteRollupQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['poll', 'bucket', 'bucket_start', 'order', 'shard'],
+                                    name='unique_vote_rollup'),
+        ]
+
+    def __str__(self):
+        return 'VoteRollup = pollId: {}, bucket: {} {}, order: {}, count: {}'.format(
+            self.poll_id, self.bucket, self.bucket_start, self.order, self.count)
+
+    @staticmethod
+    def get_bucket_start(moment, bucket):
+        local_moment = timezone.localtime(moment)
+        if bucket == VoteRollup.Bucket.HOUR:
+            # truncated without leaving the aware datetime, so repeated local hours stay two buckets
+            return local_moment - timedelta(minutes=local_moment.minute, seconds=local_moment.second,
+                                            microseconds=local_moment.microsecond)
+        local_start = local_moment.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+        if bucket == VoteRollup.WEEK:
+            local_start -= timedelta(days=local_start.weekday())
+        return timezone.make_aware(local_start, is_dst=False)
+
+    @staticmethod
+    def get_next_bucket_start(bucket_start, bucket):
+        if bucket == VoteRollup.Bucket.HOUR:
+            return bucket_start + timedelta(hours=1)
+        # stepping in local time keeps the day and week buckets on midnight across offset changes
+        local_start = timezone.localtime(bucket_start).replace(tzinfo=None)
+        step = timedelta(weeks=1) if bucket == VoteRollup.WEEK else timedelta(days=1)
+        return timezone.make_aware(local_start + step, is_dst=False)
+
+    @staticmethod
+    def get_bucket_starts(start, end, bucket):
+        bucket_start = VoteRollup.get_bucket_start(start, bucket)
+        bucket_starts = []
+        while bucket_start <= end:
+            bucket_starts.append(bucket_start)
+            bucket_start = VoteRollup.get_next_bucket_start(bucket_start, bucket)
+        return bucket_starts
+
+
+class CoSelectionQuerySet(models.QuerySet):
+    def record(self, vote, delta, shard=0):
+        self.record_many([vote], delta, shard)
+
+    def record_many(self, votes, delta, shard=0):
+        """
+        Add delta to the pairs of the choices selected together in the votes, a choice is paired with itself too.
+        Must run inside the transaction that adds or removes the votes.
+        """
+        counts = Counter()
+        for vote in votes:
+            orders = vote.get_selected_orders()
+            for i, first_order in enumerate(orders):
+                for second_order in orders[i:]:
+                    counts[(vote.poll_id, first_order, second_order)] += 1
+        self.bulk_create([
+            CoSelection(poll_id=poll_id, first_order=first_order, second_order=second_order, shard=shard)
+            for poll_id, first_order, second_order in counts
+        ], ignore_conflicts=True)
+        # the pairs of a single vote share the count, they are updated at once per first order
+        second_orders_per_update = {}
+        for (poll_id, first_order, second_order), count in counts.items():
+            second_orders_per_update.setdefault((poll_id, first_order, count), []).append(second_order)
+        for (poll_id, first_order, count), second_orders in second_orders_per_update.items():
+            self.filter(poll=poll_id, first_order=first_order, second_order__in=second_orders, shard=shard) \
+                .update(count=F('count') + delta * count)
+
+    def get_matrix(self, poll):
+        """Return the dict of the (first order, second order) pairs to the number of votes selecting both."""
+        rows = self.filter(poll=poll).order_by().values_list('first_order', 'second_order') \
+            .annotate(count=Sum('count'))
+        matrix = {}
+        for first_order, second_order, count in rows:
+            matrix[(first_order, second_order)] = count
+            matrix[(second_order, first_order)] = count
+        return matrix
+
+
+class CoSelection(models.Model):
+    """
+    Number of votes of a multi-choice poll selecting both choices of a pair, stored once per pair with the lower
+    order first. The pair of a choice with itself counts the votes selecting the choice.
+    """
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='co_selections')
+    first_order = models.PositiveSmallIntegerField()
+    second_order = models.PositiveSmallIntegerField()
+    # the counter shard of the vote path, a pair of a sharded poll is the sum of its shard rows
+    shard = models.PositiveSmallIntegerField(default=0)
+    # a shard row may go below zero when a vote is retracted on another shard than it was counted on
+    count = models.IntegerField(default=0)
+
+    objects = CoSelectionQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['poll', 'first_order', 'second_order', 'shard'],
+                                    name='unique_co_selection'),
+        ]
+
+    def __str__(self):
+        return 'CoSelection = pollId: {}, orders: {} {}, count: {}'.format(
+            self.poll_id, self.first_order, self.second_order, self.count)
+
+
+class RankedBallotQuerySet(models.QuerySet):
+    def record(self, vote, delta, shard=0):
+        self.record_many([vote], delta, shard)
+
+    def record_many(self, votes, delta, shard=0):
+        """
+        Add delta to the ballot groups of the rankings of the votes. Must run inside the transaction that adds or
+        removes the votes.
+        """
+        counts = Counter((vote.poll_id, vote.ranking) for vote in votes)
+        self.bulk_create([RankedBallot(poll_id=poll_id, ranking=ranking, shard=shard) for poll_id, ranking in counts],
+                         ignore_conflicts=True)
+        rankings_per_update = {}
+        for (poll_id, ranking), count in counts.items():
+            rankings_per_update.setdefault((poll_id, count), []).append(ranking)
+        for (poll_id, count), rankings in rankings_per_update.items():
+            self.filter(poll=poll_id, ranking__in=rankings, shard=shard).update(count=F('count') + delta * count)
+
+    def get_ballots(self, poll):
+        """Return the dict of the rankings of the poll to the number of ballots ranking the choices so."""
+        rows = self.filter(poll=poll).order_by().values_list('ranking').annotate(count=Sum('count'))
+        return {ranking: count for ranking, count in rows if count > 0}
+
+
+class RankedBallot(models.Model):
+    """Number of the votes of a ranked poll with the same ranking, the instant-runoff rounds are run on them."""
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='ranked_ballots')
+    ranking = models.BigIntegerField()
+    # the counter shard of the vote path, a ranking of a sharded poll is the sum of its shard rows
+    shard = models.PositiveSmallIntegerField(default=0)
+    # a shard row may go below zero when a vote is retracted on another shard than it was counted on
+    count = models.IntegerField(default=0)
+
+    objects = RankedBallotQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['poll', 'ranking', 'shard'], name='unique_ranked_ballot'),
+        ]
+
+    def __str__(self):
+        return 'RankedBallot = pollId: {}, ranking: {}, count: {}'.format(
+            self.poll_id, Vote.decode_ranking(self.ranking), self.count)
+
+
+class CategoryStatsQuerySet(models.QuerySet):
+    def add_polls(self, poll_counts):
+        """
+        Add the counts of a dict of the category id to the number of polls added or removed to the poll counters.
+        The rows are only inserted by additions, a removal may run while its category is being deleted.
+        """
+        self.bulk_create([CategoryStats(category_id=category_id) for category_id, count in poll_counts.items()
+                          if category_id is not None and count > 0], ignore_conflicts=True)
+        categories_per_count = {}
+        for category_id, count in poll_counts.items():
+            if category_id is not None and count:
+                categories_per_count.setdefault(count, []).append(category_id)
+        for count, category_ids in categories_per_count.items():
+            self.filter(category__in=category_ids).update(poll_count=F('poll_count') + count)
+
+    def add_creator_polls(self, creator, sign=1):
+        """Add the polls of the creator to the poll counters as their page turns public, or remove them with -1."""
+        poll_counts = Poll.objects.filter(creator=creator, category__isnull=False).order_by() \
+            .values_list('category').annotate(count=Count('id'))
+        self.add_polls({category_id: sign * count for category_id, count in poll_counts})
+
+
+class CategoryStats(models.Model):
+    """
+    The counters of the polls of public pages in a category itself, without its sub categories, and the polls of
+    its subtree with the most votes lately, refreshed by the refreshcategorystats command. The polls of private
+    pages are left out as they are from the poll list of the category.
+    """
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    poll_count = models.IntegerField(default=0)
+    # [poll id, creator id] pairs ranked by their votes in the last CATEGORY_TOP_POLLS_HOURS, of the whole subtree
+    top_polls = models.JSONField(default=list)
+    top_polls_refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = CategoryStatsQuerySet.as_manager()
+
+    def __str__(self):
+        return 'CategoryStats = categoryId: {}, polls: {}'.format(self.category_id, self.poll_count)
+
+
+class CategoryVoteRollupQuerySet(models.QuerySet):
+    def record_many(self, votes, categories, delta, shard=0):
+        """
+        Add delta to the hour buckets of the categories of the votes, categories is a dict of the poll id to its
+        category id. Must run inside the transaction that adds or removes the votes.
+        """
+        counts = Counter()
+        for vote in votes:
+            category_id = categories.get(vote.poll_id)
+            if category_id is not None:
+                counts[(category_id, VoteRollup.get_bucket_start(vote.created_at, VoteRollup.Bucket.HOUR))] += 1
+        self.bulk_create([CategoryVoteRollup(category_id=category_id, bucket_start=bucket_start, shard=shard)
+                          for category_id, bucket_start in counts], ignore_conflicts=True)
+        for (category_id, bucket_start), count in counts.items():
+            self.filter(category=category_id, bucket_start=bucket_start, shard=shard) \
+                .update(count=F('count') + delta * count)
+
+    def get_recent_counts(self, hours):
+        """Return the dict of the category id to the number of votes of its own polls in the last hours."""
+        since = VoteRollup.get_bucket_start(timezone.now() - timedelta(hours=hours - 1), VoteRollup.Bucket.HOUR)
+        return dict(self.filter(bucket_start__gte=since).order_by().values_list('category')
+                    .annotate(count=Sum('count')))
+
+
+class CategoryVoteRollup(models.Model):
+    """Votes on the polls of a category itself per hour, the recent vote counts of the categories are summed on it."""
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='vote_rollups')
+    bucket_start = models.DateTimeField()
+    # the counter shard of the vote path, every vote of a category in the hour hits the bucket
+    shard = models.PositiveSmallIntegerField(default=0)
+    # a shard row may go below zero when a vote is retracted on another shard than it was counted on
+    count = models.IntegerField(default=0)
+
+    objects = CategoryVoteRollupQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'bucket_start', 'shard'], name='unique_category_vote_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket_start'], name='category_vote_rollup_start_idx'),
+        ]
+
+    def __str__(self):
+        return 'CategoryVoteRollup = categoryId: {}, bucket: {}, count: {}'.format(
+            self.category_id, self.bucket_start, self.count)
+
+
+class PollActivityRollupQuerySet(models.QuerySet):
+    def record(self, poll_id, comments=0, likes=0, moment=None):
+        """
+        Add the comments and likes to the hour bucket of moment, now by default, of the poll. Must run inside the
+        transaction that adds or removes them.
+        """
+        bucket_start = VoteRollup.get_bucket_start(moment or timezone.now(), VoteRollup.Bucket.HOUR)
+        self.bulk_create([PollActivityRollup(poll_id=poll_id, bucket_start=bucket_start)], ignore_conflicts=True)
+        self.filter(poll=poll_id, bucket_start=bucket_start) \
+            .update(comments=F('comments') + comments, likes=F('likes') + likes)
+
+    def remove(self, comments, likes):
+        """
+        Take the comments and likes, iterables of (poll id, created_at), out of the hour buckets they were counted
+        in. The buckets dropped since are left alone. Must run inside the transaction that removes them.
+        """
+        counts = {}
+        for index, rows in enumerate((comments, likes)):
+            for poll_id, created_at in rows:
+                key = (poll_id, VoteRollup.get_bucket_start(created_at, VoteRollup.Bucket.HOUR))
+                counts.setdefault(key, [0, 0])[index] += 1
+        for (poll_id, bucket_start), (comment_count, like_count) in counts.items():
+            self.filter(poll=poll_id, bucket_start=bucket_start) \
+                .update(comments=F('comments') - comment_count, likes=F('likes') - like_count)
+
+
+class PollActivityRollup(models.Model):
+    """
+    Comments and comment likes on a poll per hour, the trending score adds them to the votes of its hour rollups.
+    They are far less frequent than the votes, so the buckets are not sharded.
+    """
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='activity_rollups')
+    bucket_start = models.DateTimeField()
+    # may go below zero when a comment or like counted before the bucket is removed in it
+    comments = models.IntegerField(default=0)
+    likes = models.IntegerField(default=0)
+
+    objects = PollActivityRollupQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['poll', 'bucket_start'], name='unique_poll_activity_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket_start'], name='poll_activity_start_idx'),
+        ]
+
+    def __str__(self):
+        return 'PollActivityRollup = pollId: {}, bucket: {}, comments: {}, likes: {}'.format(
+            self.poll_id, self.bucket_start, self.comments, self.likes)
+
+
+class TrendingPoll(models.Model):
+    """A poll of the trending feed, the list is materialized by the refreshtrendingpolls command."""
+    poll = models.OneToOneField(Poll, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    # 1 for the poll with the highest score, a trending page is one range of its index
+    rank = models.PositiveIntegerField(unique=True)
+    score = models.FloatField()
+
+    def __str__(self):
+        return 'TrendingPoll = pollId: {}, rank: {}, score: {:.2f}'.format(self.poll_id, self.rank, self.score)
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    def run_once(self, request, key, run):
+        """
+        Run the request unless the user has already sent the key, return the key and the response of run, or
+        None as the response when the stored outcome of the key is to be replayed. The key is inserted in the
+        transaction of run, so a concurrent request with the same key waits on the unique constraint and then
+        replays the committed outcome.
+        """
+        expired_before = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        keys = self.filter(user=request.user, key=key)
+        idempotency_key = keys.filter(created_at__gte=expired_before).first()
+        if idempotency_key is not None:
+            return idempotency_key, None
+        keys.filter(created_at__lt=expired_before).delete()
+        try:
+            with transaction.atomic():
+                idempotency_key = self.create(user=request.user, key=key,
+                                              fingerprint=IdempotencyKey.get_fingerprint(request))
+                response = run()
+                idempotency_key.status_code = response.status_code
+                idempotency_key.response = response.data
+                idempotency_key.save(update_fields=['status_code', 'response'])
+                return idempotency_key, response
+        except IntegrityError:
+            return self.get(user=request.user, key=key), None
+
+    def delete_expired(self):
+        return self.filter(created_at__lt=timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)).delete()
+
+
+class IdempotencyKey(models.Model):
+    """Outcome of a vote submission sent with an Idempotency-Key header, replayed to the retries of the request."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # hash of the method, path and body of the request, a key can't be reused for a different request
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_key_created_idx'),
+        ]
+
+    def __str__(self):
+        return 'IdempotencyKey = userId: {}, key: {}, status: {}'.format(self.user_id, self.key, self.status_code)
+
+    @staticmethod
+    def get_fingerprint(request):
+        body = json.dumps(request.data, sort_keys=True, default=str)
+        return hashlib.sha256('{} {}\n{}'.format(request.method, request.path, body).encode()).hexdigest()
+
+    def matches(self, request):
+        return self.fingerprint == self.get_fingerprint(request)
+
+
+class CommentQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Exclude the comments of the users who have blocked the user and the comments on their polls."""
+        if not user.blocker_ids:
+            return self
+        return self.exclude(creator__in=user.blocker_ids).exclude(poll__creator__in=user.blocker_ids)
+
+    def release_user_counters(self, user):
+        """
+        Take the reactions and replies of the user off the counters of the comments of other users, before the user
+        is deleted and they go with it by cascade. Must run inside the transaction that deletes the user.
+        """
+        reactions = CommentReaction.objects.filter(user=user).exclude(comment__creator=user)
+        for value, field in ((CommentReaction.Value.LIKE, 'likes_count'),
+                             (CommentReaction.Value.DISLIKE, 'dislikes_count')):
+            # a user has at most one reaction per comment
+            self.filter(pk__in=reactions.filter(value=value).values('comment')).update(**{field: F(field) - 1})
+        replies = self.filter(creator=user, parent__isnull=False).exclude(parent__creator=user).order_by() \
+            .values_list('parent').annotate(count=Count('id'))
+        parent_ids_per_count = {}
+        for parent_id, count in replies:
+            parent_ids_per_count.setdefault(count, []).append(parent_id)
+        for count, parent_ids in parent_ids_per_count.items():
+            self.filter(pk__in=parent_ids).update(replies_count=F('replies_count') - count)
+
+    def release_activity(self, user=None):
+        """
+        Take the comments, their replies at any depth and the likes on all of them out of the poll activity, before
+        they are deleted by cascade. With user, the likes of the user on the other comments are taken out too, as
+        they go with the user. Must run inside the transaction that deletes them.
+        """
+        comments = []
+        rows = list(self.order_by().values_list('pk', 'poll', 'created_at'))
+        while rows:
+            comments.extend(rows)
+            rows = list(Comment.objects.filter(parent__in=[pk for pk, _, _ in rows]).order_by()
+                        .values_list('pk', 'poll', 'created_at'))
+        likes = Q(comment__in=[pk for pk, _, _ in comments])
+        if user is not None:
+            likes |= Q(user=user)
+        PollActivityRollup.objects.remove(
+            [(poll_id, created_at) for _, poll_id, created_at in comments],
+            CommentReaction.objects.filter(likes, value=CommentReaction.Value.LIKE).order_by()
+            .values_list('comment__poll', 'created_at'))
 
 
 class Comment(models.Model):
@@ -120,9 +935,21 @@ class Comment(models.Model):
     content = models.CharField("content", max_length=2000)
     poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='comments')
     parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='replies', null=True)
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    dislikes_count = models.PositiveIntegerField(default=0, editable=False)
+    replies_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CommentQuerySet.as_manager()
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['poll', 'parent', '-created_at', '-id'], name='comment_poll_created_idx'),
+            models.Index(fields=['parent', '-created_at', '-id'], name='comment_parent_created_idx'),
+            models.Index(fields=['poll', 'parent', '-likes_count', '-created_at', '-id'], name='comment_poll_likes_idx'),
+            models.Index(fields=['poll', 'parent', '-dislikes_count', '-created_at', '-id'],
+                         name='comment_poll_dislikes_idx'),
+        ]
 
     def __str__(self):
         username = self.creator.username
@@ -132,5 +959,86 @@ class Comment(models.Model):
         else:
             return f'{self.id}) reply by {username} on comment {self.parent.id}: {_content}'
 
-    likes = models.ManyToManyField(User, related_name='liked_comment')
-    dislikes = models.ManyToManyField(User, related_name='disliked_comment')
+    def update_reaction_counters(self, likes=0, dislikes=0):
+        # must run inside the transaction that adds or removes the reactions
+        Comment.objects.filter(pk=self.pk).update(likes_count=F('likes_count') + likes,
+                                                  dislikes_count=F('dislikes_count') + dislikes)
+
+    def update_replies_counter(self, delta):
+        Comment.objects.filter(pk=self.pk).update(replies_count=F('replies_count') + delta)
+
+    def set_reaction(self, user, value, replaced_values=None):
+        """
+        Set the reaction of the user to value (a CommentReaction.Value, None clears it) and update the counters
+        in one transaction. With replaced_values the reaction is only changed when the current one is among them.
+        Return the previous reaction value.
+        """
+        with transaction.atomic():
+            reaction = CommentReaction.objects.select_for_update().filter(comment=self, user=user).first()
+            previous_value = reaction.value if reaction is not None else None
+            previous_created_at = reaction.created_at if reaction is not None else None
+            if previous_value == value or (replaced_values is not None and previous_value not in replaced_values):
+                return previous_value
+            if reaction is None:
+                try:
+                    with transaction.atomic():
+                        CommentReaction.objects.create(comment=self, user=user, value=value)
+                except IntegrityError:
+                    # a concurrent request of the same user has reacted in the meantime, its row is locked now
+                    return self.set_reaction(user, value, replaced_values)
+            elif value is None:
+                reaction.delete()
+            else:
+                reaction.value = value
+                reaction.created_at = timezone.now()
+                reaction.save(update_fields=['value', 'created_at'])
+            like, dislike = CommentReaction.Value.LIKE, CommentReaction.Value.DISLIKE
+            self.update_reaction_counters(likes=(value == like) - (previous_value == like),
+                                          dislikes=(value == dislike) - (previous_value == dislike))
+            # a removed like is taken out of the hour it was counted in, a new one is counted now
+            if previous_value == like:
+                PollActivityRollup.objects.record(self.poll_id, likes=-1, moment=previous_created_at)
+            if value == like:
+                PollActivityRollup.objects.record(self.poll_id, likes=1)
+        return previous_value
+
+
+class CommentReaction(models.Model):
+    class Value(models.IntegerChoices):
+        LIKE = 1, 'like'
+        DISLIKE = -1, 'dislike'
+
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='reactions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comment_reactions')
+    value = models.SmallIntegerField(choices=Value.choices)
+    # set again when the value changes, a removed like is taken out of the activity of this hour
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['comment', 'user'], name='unique_reaction_per_user_and_comment'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='timeline_entries')
+    # copy of the poll creation time, so a timeline page is one range of the owner index
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'poll'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-poll'], name='timeline_owner_created_idx'),
+        ]
+
+    def __str__(self):
+        return 'TimelineEntry = ownerId: {}, pollId: {}'.format(self.owner_id, self.poll_id)
+
+
+class TimelineSync(models.Model):
+    owner = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='timeline_sync')
+    # creation time of the newest poll pulled into the owner timeline at read time
+    pulled_until = models.DateTimeField(null=True)
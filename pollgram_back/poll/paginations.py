@@ -1,25 +1,43 @@
-from rest_framework.pagination import PageNumberPagination
+from socialmedia.pagination import KeysetPagination
 
 
-class PollPagination(PageNumberPagination):
+class PollPagination(KeysetPagination):
     page_size = 10
-    page_size_query_param = 'page_size'
     max_page_size = 100
+    ordering = ('-created_at', '-id')
 
 
-class VotersPagination(PageNumberPagination):
+class TimelinePagination(KeysetPagination):
+    page_size = 10
+    max_page_size = 100
+    ordering = ('-timeline_created_at', '-id')
+
+
+class TrendingPagination(KeysetPagination):
+    page_size = 10
+    max_page_size = 100
+    ordering = ('trending_rank', 'id')
+
+
+class SearchPagination(KeysetPagination):
+    page_size = 10
+    max_page_size = 100
+    ordering = ('-search_score', '-id')
+
+
+class VotersPagination(KeysetPagination):
     page_size = 20
-    page_size_query_param = 'page_size'
     max_page_size = 200
+    ordering = ('-created_at', '-id')
 
 
-class CommentPagination(PageNumberPagination):
+class CommentPagination(KeysetPagination):
     page_size = 5
-    page_size_query_param = 'page_size'
     max_page_size = 1000
+    ordering = ('-created_at', '-id')
 
 
-class ReplyPagination(PageNumberPagination):
+class ReplyPagination(KeysetPagination):
     page_size = 5
-    page_size_query_param = 'page_size'
     max_page_size = 1000
+    ordering = ('-created_at', '-id')
@@ -1,7 +1,6 @@
-from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
-from poll.models import Poll
+from socialmedia.loaders import get_loader
 
 
 class IsCreatorOrReadOnly(BasePermission):
@@ -10,7 +9,7 @@ class IsCreatorOrReadOnly(BasePermission):
             return True
         elif request.method in SAFE_METHODS:
             return True
-        elif request.user == obj.creator:
+        elif obj.creator_id == request.user.pk:
             return True
         else:
             return False
@@ -18,9 +17,7 @@ class IsCreatorOrReadOnly(BasePermission):
 
 class IsFollowerOrPublicForGetAPoll(BasePermission):
     def has_object_permission(self, request, view, obj):
-        if obj.creator.is_public or request.user == obj.creator or request.user.is_superuser:
-            return True
-        elif obj.creator.get_followers().filter(pk=request.user.id).exists():
+        if request.user.is_superuser or get_loader(request).can_see_content_of(obj.creator):
             return True
         else:
             return False
@@ -28,9 +25,8 @@ class IsFollowerOrPublicForGetAPoll(BasePermission):
 
 class IsFollowerOrPublicForGetAComment(BasePermission):
     def has_object_permission(self, request, view, obj):
-        if obj.poll.creator.is_public or request.user == obj.poll.creator or request.user.is_superuser:
-            return True
-        elif obj.poll.creator.get_followers().filter(pk=request.user.id).exists():
+        poll = get_loader(request).get_poll(obj.poll_id)
+        if request.user.is_superuser or get_loader(request).can_see_content_of(poll.creator):
             return True
         else:
             return False
@@ -39,8 +35,8 @@ class IsFollowerOrPublicForGetAComment(BasePermission):
 class IsCreatorOrPublicPoll(BasePermission):
 
     def has_permission(self, request, view):
-        poll = get_object_or_404(Poll, pk=view.kwargs['poll_pk'])
-        if request.user.is_superuser or poll.creator == request.user:
+        poll = get_loader(request).get_poll(view.kwargs['poll_pk'])
+        if request.user.is_superuser or poll.creator_id == request.user.pk:
             return True
         elif poll.is_public and request.user.can_see_results(poll):
             return True
@@ -50,10 +46,8 @@ class IsCreatorOrPublicPoll(BasePermission):
 
 class IsFollowerOrPublic(BasePermission):
     def has_permission(self, request, view):
-        poll = get_object_or_404(Poll, pk=view.kwargs['poll_pk'])
-
-        if request.user == poll.creator or poll.creator.is_public or poll.creator.get_followers().filter(
-                pk=request.user.id).exists():
+        poll = get_loader(request).get_poll(view.kwargs['poll_pk'])
+        if get_loader(request).can_see_content_of(poll.creator):
             return True
         else:
             return False
@@ -64,15 +58,15 @@ class CommentFilterPermission(BasePermission):
     def has_permission(self, request, view):
         filter_order = request.query_params.get('order')
         if filter_order:
-            poll = get_object_or_404(Poll, pk=view.kwargs['poll_pk'])
+            poll = get_loader(request).get_poll(view.kwargs['poll_pk'])
             return request.user.can_see_results(poll) and poll.is_public
         return True
 
 
 class IsSelf(BasePermission):
     def has_permission(self, request, view):
-        poll = get_object_or_404(Poll, pk=view.kwargs['poll_pk'])
-        if request.user == poll.creator or request.user.is_superuser:
+        poll = get_loader(request).get_poll(view.kwargs['poll_pk'])
+        if poll.creator_id == request.user.pk or request.user.is_superuser:
             return True
         else:
             return False
@@ -0,0 +1,149 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Vote, RankedBallot
+
+
+# the results, their lock and their generations are shared by the workers through the default cache, which must
+# not be a cache of each process, see the poll.E001 deploy check
+
+
+def get_ranked_results_cache_key(poll_id):
+    return 'poll-ranked-results:{}'.format(poll_id)
+
+
+def get_ranked_results_generation_key(poll_id):
+    # bumped by every committed vote of the poll, results built or updated meanwhile are not stored
+    return 'poll-ranked-results-generation:{}'.format(poll_id)
+
+
+def bump_ranked_results_generation(poll_id):
+    generation_key = get_ranked_results_generation_key(poll_id)
+    cache.add(generation_key, 0, None)
+    try:
+        return cache.incr(generation_key)
+    except ValueError:
+        # evicted in between, the results compared to it are dropped
+        return None
+
+
+def get_first_preference(ranking, active_orders):
+    while ranking:
+        order = (ranking & Vote.RANKING_MASK) - 1
+        if order in active_orders:
+            return order
+        ranking >>= Vote.RANKING_BITS
+    return None
+
+
+def decide_round(counts, first_counts):
+    """
+    Return the winner of the round and None, or None and the choice eliminated in it. A choice wins with more than
+    half of the ballots not exhausted yet or as the last one left, the choice with the fewest ballots is eliminated,
+    ties are broken by the fewest first preferences and then by the highest order.
+    """
+    total = sum(counts.values())
+    if not total:
+        return None, None
+    leader = max(counts, key=lambda order: (counts[order], -order))
+    if len(counts) == 1 or 2 * counts[leader] > total:
+        return leader, None
+    return None, min(counts, key=lambda order: (counts[order], first_counts[order], -order))
+
+
+def tally(ballots, orders):
+    """
+    Run the instant-runoff rounds over the ballots, a dict of the ranking to the number of ballots ranking the
+    choices so. Each round has the counts of the choices left, the exhausted ballots and the eliminated choice.
+    """
+    rounds = []
+    active_orders = set(orders)
+    winner = None
+    while active_orders:
+        counts = dict.fromkeys(sorted(active_orders), 0)
+        exhausted = 0
+        for ranking, count in ballots.items():
+            order = get_first_preference(ranking, active_orders)
+            if order is None:
+                exhausted += count
+            else:
+                counts[order] += count
+        winner, eliminated = decide_round(counts, rounds[0]['counts'] if rounds else counts)
+        rounds.append({'counts': counts, 'exhausted': exhausted, 'eliminated': eliminated})
+        if eliminated is None:
+            break
+        active_orders.remove(eliminated)
+    return {'rounds': rounds, 'winner': winner, 'ballots': sum(ballots.values())}
+
+
+def apply_ballot(results, ranking, delta):
+    """
+    Add delta ballots of the ranking to the rounds of the results in place. Return False when the ballots change
+    the outcome of a round, the later rounds are not valid anymore then and the poll has to be tallied again.
+    """
+    rounds = results['rounds']
+    for results_round in rounds:
+        order = get_first_preference(ranking, results_round['counts'])
+        if order is None:
+            results_round['exhausted'] += delta
+        else:
+            results_round['counts'][order] += delta
+    results['ballots'] += delta
+    # the first round counts break the ties of every round, so all of them are checked again
+    for results_round in rounds:
+        winner, eliminated = decide_round(results_round['counts'], rounds[0]['counts'])
+        if eliminated != results_round['eliminated'] or (eliminated is None and winner != results['winner']):
+            return False
+    return True
+
+
+def get_ranked_results(poll):
+    """
+    Return the instant-runoff results of the ranked poll. They are tallied over the ballot groups of the poll,
+    one per distinct ranking, cached and then updated in place by the votes until one changes the outcome of a round.
+    """
+    key = get_ranked_results_cache_key(poll.pk)
+    results = cache.get(key)
+    if results is None:
+        generation_key = get_ranked_results_generation_key(poll.pk)
+        generation = cache.get(generation_key, 0)
+        orders = list(poll.choices.values_list('order', flat=True))
+        results = tally(RankedBallot.objects.get_ballots(poll), orders)
+        cache.set(key, results, settings.RANKED_RESULTS_CACHE_TIMEOUT)
+        if cache.get(generation_key, 0) != generation:
+            # a vote committed after the ballots were read may have found no results to update
+            cache.delete(key)
+    return results
+
+
+def update_ranked_results(poll, ranking_deltas):
+    """
+    Apply the ballots of the votes, a dict of the ranking to the number of ballots added or removed, to the cached
+    results of the poll once they are committed. Must run inside the transaction that adds or removes the votes.
+    """
+    key = get_ranked_results_cache_key(poll.pk)
+    lock_key = key + ':lock'
+
+    def update():
+        generation = bump_ranked_results_generation(poll.pk)
+        if not cache.add(lock_key, True, settings.RANKED_RESULTS_LOCK_TIMEOUT):
+            # a concurrent update holds the lock, the results are dropped instead of waiting for it, and bumping
+            # the generation after the lock is taken makes the holder drop the results it is writing too
+            bump_ranked_results_generation(poll.pk)
+            cache.delete(key)
+            return
+        try:
+            results = cache.get(key)
+            if results is None:
+                return
+            if not all(apply_ballot(results, ranking, delta) for ranking, delta in ranking_deltas.items() if delta):
+                cache.delete(key)
+                return
+            cache.set(key, results, settings.RANKED_RESULTS_CACHE_TIMEOUT)
+            if generation is None or cache.get(get_ranked_results_generation_key(poll.pk)) != generation:
+                cache.delete(key)
+        finally:
+            cache.delete(lock_key)
+
+    transaction.on_commit(update)
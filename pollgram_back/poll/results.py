@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Choice, VoteCounterShard
+
+
+def get_results_cache_key(poll_id):
+    return 'poll-results:{}'.format(poll_id)
+
+
+def build_poll_results(poll):
+    """
+    Read the vote counters of the choices of the poll and add the sums of its counter shards with one GROUP BY,
+    the counts the poll lists show through apply_counter_shards.
+    """
+    choices = dict(Choice.objects.filter(poll=poll).values_list('order', 'vote_count'))
+    if poll.get_counter_shards() > 1:
+        # read without the short cache of the shard sums, the snapshot is kept much longer
+        rows = VoteCounterShard.objects.filter(poll=poll).order_by().values_list('order').annotate(count=Sum('count'))
+        for order, count in rows:
+            choices[order] = choices.get(order, 0) + count
+    return {
+        'choices': {order: count for order, count in choices.items() if count},
+        # the sum of the choice counts like Poll.vote_count
+        'total': sum(choices.values()),
+        'updated_at': timezone.now(),
+    }
+
+
+def get_poll_results(poll):
+    """
+    Return the result snapshot of the poll, a dict of the choices order to count, total and updated_at.
+    The snapshot of a poll with results_max_age is kept for that many seconds regardless of the votes,
+    others are dropped by every vote and retract. Only the poll detail and circular chart endpoints read it,
+    the lists and timelines read the stored counters through apply_counter_shards.
+    """
+    key = get_results_cache_key(poll.pk)
+    results = cache.get(key)
+    if results is None:
+        results = build_poll_results(poll)
+        cache.set(key, results, poll.results_max_age or settings.POLL_RESULTS_CACHE_TIMEOUT)
+    return results
+
+
+def invalidate_poll_results(poll):
+    # must run inside the transaction that adds or removes the votes, the snapshot is dropped once more on commit
+    # in case a concurrent read has rebuilt it from the data before the commit
+    if poll.results_max_age is not None:
+        return
+    key = get_results_cache_key(poll.pk)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def apply_poll_results(poll, choices):
+    """Set the vote counters of the poll and its choices from the result snapshot."""
+    results = get_poll_results(poll)
+    poll.vote_count = results['total']
+    for choice in choices:
+        choice.vote_count = results['choices'].get(choice.order, 0)
+    return results
+
+
+def apply_counter_shards(polls):
+    """
+    Add the counter shard sums of the sharded polls to the stored vote counters of them and their prefetched
+    choices, the stored counters of a sharded poll only hold what has been folded into them.
+    """
+    sharded_polls = [poll for poll in polls if poll.get_counter_shards() > 1]
+    if not sharded_polls:
+        return
+    counts = VoteCounterShard.objects.get_counts([poll.pk for poll in sharded_polls])
+    for poll in sharded_polls:
+        poll_counts = counts.get(poll.pk, {})
+        poll.vote_count += sum(poll_counts.values())
+        for choice in poll.choices.all():
+            choice.vote_count += poll_counts.get(choice.order, 0)
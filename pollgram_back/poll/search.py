@@ -0,0 +1,104 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Coalesce
+
+from socialmedia.models import FollowRelationship
+from .models import Poll, VoteCounterShard
+
+# the full-text index of the polls, a tsvector column with a gin index on postgresql and a fts5 table on sqlite,
+# created by the poll_search migration for the database it runs on
+SEARCH_TABLE = 'poll_pollsearch'
+# no stemming, the questions are written in several languages
+SEARCH_CONFIG = 'simple'
+MAX_SEARCH_TERMS = 10
+
+
+def get_search_terms(query):
+    """Return the lowercase words of the query, the operators of the search syntaxes are dropped."""
+    return re.findall(r'\w+', query.lower())[:MAX_SEARCH_TERMS]
+
+
+def get_match_query(terms):
+    # every term has to match and the last one may be a prefix, as it is often still being typed
+    if connection.vendor == 'postgresql':
+        return ' & '.join("'{}'".format(term) for term in terms) + ':*'
+    return ' '.join('"{}"'.format(term) for term in terms) + '*'
+
+
+def index_polls(polls):
+    """Write the question and description of the polls to the search index. Must run in their transaction."""
+    rows = [(poll.pk, poll.question, poll.description) for poll in polls]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (poll_id, vector) "
+                f"VALUES (%s, setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'A') || "
+                f"setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'B')) "
+                f"ON CONFLICT (poll_id) DO UPDATE SET vector = EXCLUDED.vector", rows)
+        else:
+            # a fts5 table has no unique key to upsert on, the old row of the poll is deleted first
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (rowid, question, description) VALUES (%s, %s, %s)", rows)
+
+
+def unindex_polls(poll_ids):
+    key = 'poll_id' if connection.vendor == 'postgresql' else 'rowid'
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE {key} = %s", [(poll_id,) for poll_id in poll_ids])
+
+
+def rebuild_search_index(chunk_size=1000):
+    """Index every poll again from scratch. Return the number of polls indexed."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    polls = Poll.objects.only('id', 'question', 'description').order_by('id').iterator(chunk_size=chunk_size)
+    count = 0
+    chunk = []
+    for poll in polls:
+        chunk.append(poll)
+        if len(chunk) == chunk_size:
+            index_polls(chunk)
+            count += len(chunk)
+            chunk = []
+    index_polls(chunk)
+    return count + len(chunk)
+
+
+def search_polls(query, user, category=None):
+    """
+    Return the polls matching every term of the query which the user can see, annotated with search_score: the
+    relevance of the question and description, lifted by up to SEARCH_POPULARITY_WEIGHT times as the votes of the
+    poll grow, its counter shards included. The poll gets half of the lift at SEARCH_POPULARITY_HALF_VOTES votes.
+    The polls of private pages are only found by their creator and followers.
+    """
+    match_query = get_match_query(get_search_terms(query))
+    if connection.vendor == 'postgresql':
+        matches = RawSQL(f"SELECT poll_id FROM {SEARCH_TABLE} "
+                         f"WHERE vector @@ to_tsquery('{SEARCH_CONFIG}', %s)", [match_query])
+        relevance = RawSQL(f"SELECT ts_rank_cd(vector, to_tsquery('{SEARCH_CONFIG}', %s)) FROM {SEARCH_TABLE} "
+                           f"WHERE poll_id = poll_poll.id", [match_query], output_field=FloatField())
+    else:
+        matches = RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match_query])
+        # bm25 is lower for better matches, the question counts twice as much as the description
+        relevance = RawSQL(f"SELECT -bm25({SEARCH_TABLE}, 2.0, 1.0) FROM {SEARCH_TABLE} "
+                           f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = poll_poll.id", [match_query],
+                           output_field=FloatField())
+    # the votes of a sharded poll not folded yet are in its counter shards
+    shard_votes = VoteCounterShard.objects.filter(poll=OuterRef('pk')).order_by().values('poll') \
+        .annotate(count=Sum('count')).values('count')
+    vote_count = Cast(F('vote_count') + Coalesce(Subquery(shard_votes), Value(0)), FloatField())
+    popularity = vote_count / (vote_count + Value(float(settings.SEARCH_POPULARITY_HALF_VOTES)))
+    followed_ids = FollowRelationship.objects.filter(from_user=user, pending=False).values('to_user')
+    polls = Poll.objects.filter(Q(creator__is_public=True) | Q(creator=user) | Q(creator__in=followed_ids),
+                                id__in=matches).visible_to(user)
+    if category is not None:
+        polls = polls.filter(category__ancestor_links__ancestor=category)
+    return polls.annotate(search_relevance=relevance).annotate(search_score=ExpressionWrapper(
+        F('search_relevance') * (Value(1.0) + Value(float(settings.SEARCH_POPULARITY_WEIGHT)) * popularity),
+        output_field=FloatField()))
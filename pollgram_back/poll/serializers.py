@@ -1,12 +1,30 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models, transaction
 from django.http import Http404
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from poll.models import Poll, Choice, Vote, File, Image, Category, Comment
+from poll.signals import polls_created
+from poll.models import Poll, Choice, Vote, File, Image, Category, Comment, CommentReaction, VoteRollup, \
+    PollActivityRollup
+from poll.viewer import ViewerContext
+from poll.results import apply_counter_shards
+from poll.search import get_search_terms
 from socialmedia.models import User
 from socialmedia.serializers.user import UserSummarySerializer
 
 
+def get_viewer_context(serializer):
+    # shared by all the nested serializers of one response, see ViewerContext
+    context = serializer.context
+    if 'viewer' not in context:
+        context['viewer'] = ViewerContext(context['request'].user)
+    return context['viewer']
+
+
 class FileSerializer(serializers.ModelSerializer):
     class Meta:
         model = File
@@ -27,12 +45,6 @@ class PollCategorySerializer(serializers.ModelSerializer):
         fields = ('id', 'name')
 
 
-class SubCategorySerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Category
-        fields = ('id', 'name', 'order')
-
-
 class CategorySerializer(serializers.ModelSerializer):
     sub_categories = serializers.SerializerMethodField('get_sub_categories')
 
@@ -41,7 +53,8 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'order', 'sub_categories')
 
     def get_sub_categories(self, obj):
-        return SubCategorySerializer(obj.get_sub_categories(), many=True).data
+        # the tree is read at once by Category.objects.get_tree, the sub categories are nested at any depth
+        return CategorySerializer(obj.get_sub_categories(), many=True).data
 
 
 class ChoiceSerializer(serializers.ModelSerializer):
@@ -53,11 +66,40 @@ class ChoiceSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super(ChoiceSerializer, self).to_representation(instance)
-        if self.context['request'].user.can_see_results(instance.poll):
-            data['vote_count'] = instance.get_votes().count()
+        if get_viewer_context(self).can_see_results(instance.poll):
+            data['vote_count'] = instance.vote_count
+        else:
+            # the key is kept with null as before the counters, when the field defaulted to None
+            data['vote_count'] = None
         return data
 
 
+class PollCreateListSerializer(serializers.ListSerializer):
+    """Creates the polls of a bulk request with one insert of the polls and one of their choices per batch."""
+
+    def validate(self, attrs):
+        if len(attrs) > settings.POLL_BULK_CREATE_MAX_SIZE:
+            raise ValidationError('at most {} polls can be created at once'.format(settings.POLL_BULK_CREATE_MAX_SIZE))
+        return attrs
+
+    def create(self, validated_data):
+        creator = self.context['request'].user
+        choices_per_poll = [item.pop('choices') for item in validated_data]
+        polls = [Poll(**item, creator=creator) for item in validated_data]
+        with transaction.atomic():
+            if connection.features.can_return_rows_from_bulk_insert:
+                Poll.objects.bulk_create(polls, batch_size=settings.POLL_BULK_CREATE_BATCH_SIZE)
+                polls_created.send(sender=Poll, creator=creator, polls=polls)
+            else:
+                # the backend can't return the ids of the inserted rows, the polls are saved one by one
+                for poll in polls:
+                    poll.save()
+            Choice.objects.bulk_create([Choice(poll=poll, **choice)
+                                        for poll, choices in zip(polls, choices_per_poll) for choice in choices],
+                                       batch_size=settings.POLL_BULK_CREATE_BATCH_SIZE)
+        return polls
+
+
 class PollCreateSerializer(serializers.ModelSerializer):
     creator = UserSummarySerializer(read_only=True)
     choices = ChoiceSerializer(many=True)
@@ -67,15 +109,15 @@ class PollCreateSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'created_at', 'question', 'description', 'creator', 'choices', 'is_commentable', 'attached_http_link',
             'image', 'file', 'min_choice_can_vote', 'max_choice_can_vote', 'is_vote_retractable', 'is_public',
-            'visibility_status', 'category')
+            'visibility_status', 'category', 'is_ranked')
         read_only_fields = ('id',)
+        list_serializer_class = PollCreateListSerializer
 
     def create(self, validated_data):
         choices = validated_data.pop('choices')
-        poll = Poll.objects.create(**validated_data, creator=self.context['request'].user)
-        # todo save all choices in one request
-        for choice in choices:
-            Choice.objects.create(poll=poll, **choice)
+        with transaction.atomic():
+            poll = Poll.objects.create(**validated_data, creator=self.context['request'].user)
+            Choice.objects.bulk_create([Choice(poll=poll, **choice) for choice in choices])
         return poll
 
     def validate(self, data):
@@ -83,6 +125,9 @@ class PollCreateSerializer(serializers.ModelSerializer):
             raise ValidationError('min_choice_can_vote can not be greater than max_choice_can_vote')
         if not (2 <= len(data['choices']) <= 10):
             raise ValidationError('you can not create poll with less than 2 choices')
+        orders = [choice['order'] for choice in data['choices']]
+        if len(set(orders)) != len(orders):
+            raise ValidationError('the orders of the choices must be unique')
         return data
 
 
@@ -94,8 +139,8 @@ class VoteResponseSerializer(serializers.ModelSerializer):
         fields = ('selected',)
 
     def get_selected_votes(self, obj):
-        voted_orders = obj.selected.all().values_list('order', flat=True)
-        return voted_orders
+        # the choices of a ranked poll are shown in the order of preference
+        return obj.get_ranking() or obj.get_selected_orders()
 
 
 class VoterUserSerializer(serializers.ModelSerializer):
@@ -105,6 +150,21 @@ class VoterUserSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'avatar')
 
 
+class VoterSerializer(serializers.Serializer):
+    """A vote shown as its voter, the voters list is walked over the votes of the poll."""
+
+    def to_representation(self, instance):
+        return VoterUserSerializer(instance.user, context=self.context).data
+
+
+class PollListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        polls = list(data.all() if isinstance(data, models.Manager) else data)
+        get_viewer_context(self).load(polls)
+        apply_counter_shards(polls)
+        return super(PollListSerializer, self).to_representation(polls)
+
+
 class PollRetrieveSerializer(serializers.ModelSerializer):
     creator = UserSummarySerializer(read_only=True)
     choices = ChoiceSerializer(many=True)
@@ -119,49 +179,44 @@ class PollRetrieveSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'created_at', 'question', 'description', 'creator', 'choices', 'is_commentable', 'attached_http_link',
             'image', 'file', 'max_choice_can_vote', 'min_choice_can_vote', 'is_vote_retractable', 'all_votes',
-            'is_public', 'visibility_status', 'voted_choices', 'category')
+            'is_public', 'visibility_status', 'voted_choices', 'category', 'is_ranked')
         read_only_fields = ('id',)
+        list_serializer_class = PollListSerializer
+        # read by to_representation for all_votes, counter_shards by the list serializer to add the shard sums
+        extra_only_fields = ('vote_count', 'counter_shards')
 
     def to_representation(self, instance):
         data = super(PollRetrieveSerializer, self).to_representation(instance)
         data['voted_choices'] = self.get_user_voted_choices(instance)
-        if self.context['request'].user.can_see_results(instance):
+        if get_viewer_context(self).can_see_results(instance):
             data['all_votes'] = self.get_all_votes(instance)
         return data
 
     def get_all_votes(self, obj):
-        vote_counter = 0
-        for choice in obj.choices.all():
-            vote_counter += choice.votes.count()
-        return vote_counter
+        return obj.vote_count
 
     def get_user_voted_choices(self, obj):
-        user = self.context['request'].user
-        voted_choice_ids = obj.choices.filter(votes__user=user).values_list('order', flat=True)
-        return voted_choice_ids
+        return get_viewer_context(self).get_voted_orders(obj)
+
+
+class CommentListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        comments = list(data.all() if isinstance(data, models.Manager) else data)
+        get_viewer_context(self).load_comments(comments)
+        return super(CommentListSerializer, self).to_representation(comments)
 
 
 class CommentSerializer(serializers.ModelSerializer):
     creator = UserSummarySerializer(read_only=True)
 
-    likes_count = serializers.IntegerField(source='likes.count', read_only=True)
-    dislikes_count = serializers.IntegerField(source='dislikes.count', read_only=True)
     has_reply = serializers.SerializerMethodField('comment_has_reply')
     like_status = serializers.SerializerMethodField('get_like_status')
 
     def comment_has_reply(self, obj):
-        if obj.replies.count() == 0:
-            return False
-        return True
+        return obj.replies_count > 0
 
     def get_like_status(self, obj):
-        user = self.context['request'].user
-        if obj.likes.filter(pk=user.pk).exists():
-            return 'liked'
-        elif obj.dislikes.filter(pk=user.pk).exists():
-            return 'disliked'
-        else:
-            return None
+        return get_viewer_context(self).get_like_status(obj)
 
     class Meta:
         model = Comment
@@ -169,11 +224,19 @@ class CommentSerializer(serializers.ModelSerializer):
             'id', 'created_at', 'content', 'creator', 'parent', 'likes_count', 'dislikes_count', 'poll', 'has_reply',
             'like_status')
         read_only_fields = ('id', 'poll', 'has_reply', 'like_status')
+        list_serializer_class = CommentListSerializer
+        # read by comment_has_reply
+        extra_only_fields = ('replies_count',)
 
     def create(self, validated_data):
         validated_data['creator'] = self.context['request'].user
         validated_data['poll'] = self.context['poll']
-        return super(CommentSerializer, self).create(validated_data)
+        with transaction.atomic():
+            comment = super(CommentSerializer, self).create(validated_data)
+            if comment.parent_id is not None:
+                comment.parent.update_replies_counter(1)
+            PollActivityRollup.objects.record(comment.poll_id, comments=1)
+        return comment
 
     def validate(self, data):
         data = super(CommentSerializer, self).validate(data)
@@ -186,7 +249,79 @@ class CommentSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("You can't reply this comment.")
         if parent and not parent.poll == poll:
             raise serializers.ValidationError("The comment parent doesn't belong to this poll.")
-        if parent and parent.creator.blocked_users.filter(pk=self.context['request'].user.pk):
+        if parent and parent.creator_id in self.context['request'].user.blocker_ids:
             raise Http404()
         return data
 
+
+class ReactionField(serializers.ChoiceField):
+    """A CommentReaction.Value given and shown by its label, null for no reaction."""
+
+    def __init__(self, **kwargs):
+        super(ReactionField, self).__init__(choices=CommentReaction.Value.labels, allow_null=True, **kwargs)
+
+    def to_internal_value(self, data):
+        return CommentReaction.Value[super(ReactionField, self).to_internal_value(data).upper()]
+
+    def to_representation(self, value):
+        return CommentReaction.Value(value).label
+
+
+class ReactionSerializer(serializers.Serializer):
+    reaction = ReactionField()
+    likes_count = serializers.IntegerField(read_only=True)
+    dislikes_count = serializers.IntegerField(read_only=True)
+
+
+class BarChartQuerySerializer(serializers.Serializer):
+    """
+    Query params of the bar chart, ?from=&to=&bucket=hour|day|week. from and to take a date or a datetime,
+    to defaults to now and from to the start of the ninth bucket before to, so the default is ten buckets.
+    """
+    BUCKETS = {
+        'hour': VoteRollup.Bucket.HOUR,
+        'day': VoteRollup.Bucket.DAY,
+        'week': VoteRollup.WEEK,
+    }
+    BUCKET_LENGTHS = {
+        'hour': timedelta(hours=1),
+        'day': timedelta(days=1),
+        'week': timedelta(weeks=1),
+    }
+    DEFAULT_BUCKETS = 10
+    MAX_BUCKETS = 1000
+
+    bucket = serializers.ChoiceField(choices=list(BUCKETS), default='day')
+
+    def get_fields(self):
+        # from is a keyword, so the range fields can't be declared as class attributes
+        fields = super(BarChartQuerySerializer, self).get_fields()
+        fields['from'] = serializers.DateTimeField(input_formats=['iso-8601', '%Y-%m-%d'], required=False)
+        fields['to'] = serializers.DateTimeField(input_formats=['iso-8601', '%Y-%m-%d'], required=False)
+        return fields
+
+    def validate(self, attrs):
+        bucket_length = self.BUCKET_LENGTHS[attrs['bucket']]
+        attrs['bucket'] = self.BUCKETS[attrs['bucket']]
+        attrs.setdefault('to', timezone.now())
+        attrs.setdefault('from', attrs['to'] - bucket_length * (self.DEFAULT_BUCKETS - 1))
+        if attrs['from'] > attrs['to']:
+            raise ValidationError({'from': 'must not be after to.'})
+        if (attrs['to'] - attrs['from']) / bucket_length >= self.MAX_BUCKETS:
+            raise ValidationError({'bucket': 'at most {} buckets can be requested.'.format(self.MAX_BUCKETS)})
+        return attrs
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    """Query params of the poll search, ?q=&category=, the polls of the sub categories are searched too."""
+    q = serializers.CharField(max_length=200)
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False)
+
+    def validate_q(self, value):
+        if not get_search_terms(value):
+            raise serializers.ValidationError('the query has no word to search for')
+        return value
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
@@ -0,0 +1,99 @@
+from collections import Counter
+
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from django.dispatch import Signal, receiver
+
+from poll.models import Poll, Category, CategoryStats, CategoryTreeVersion, Comment
+from poll.search import index_polls, unindex_polls
+from poll.timeline import fan_out_poll, fan_out_polls, backfill_timeline, prune_timeline
+from socialmedia.models import User, FollowRelationship
+
+# sent with the creator and the polls inserted by bulk_create, which sends no post_save
+polls_created = Signal()
+
+
+@receiver(post_save, sender=Poll)
+def fan_out_created_poll(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        fan_out_poll(instance)
+
+
+@receiver(polls_created)
+def fan_out_bulk_created_polls(sender, creator, polls, **kwargs):
+    fan_out_polls(creator.pk, polls)
+
+
+# the polls of private pages are not counted, as they are not listed in their category
+@receiver(post_save, sender=Poll)
+def count_created_poll(sender, instance, created, raw, **kwargs):
+    if created and not raw and instance.category_id is not None and instance.creator.is_public:
+        CategoryStats.objects.add_polls({instance.category_id: 1})
+
+
+@receiver(polls_created)
+def count_bulk_created_polls(sender, creator, polls, **kwargs):
+    if creator.is_public:
+        CategoryStats.objects.add_polls(Counter(poll.category_id for poll in polls))
+
+
+@receiver(post_delete, sender=Poll)
+def count_deleted_poll(sender, instance, **kwargs):
+    if instance.category_id is not None and instance.creator.is_public:
+        CategoryStats.objects.add_polls({instance.category_id: -1})
+
+
+@receiver(pre_save, sender=User)
+def count_creator_polls_on_page_change(sender, instance, raw, update_fields, **kwargs):
+    if raw or instance.pk is None or update_fields is not None and 'is_public' not in update_fields:
+        return
+    was_public = User.objects.filter(pk=instance.pk).values_list('is_public', flat=True).first()
+    if was_public is not None and was_public != instance.is_public:
+        CategoryStats.objects.add_creator_polls(instance, 1 if instance.is_public else -1)
+
+
+@receiver(post_save, sender=Poll)
+def index_saved_poll(sender, instance, raw, update_fields, **kwargs):
+    if not raw and (update_fields is None or {'question', 'description'} & set(update_fields)):
+        index_polls([instance])
+
+
+@receiver(polls_created)
+def index_bulk_created_polls(sender, creator, polls, **kwargs):
+    index_polls(polls)
+
+
+@receiver(post_delete, sender=Poll)
+def unindex_deleted_poll(sender, instance, **kwargs):
+    unindex_polls([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, **kwargs):
+    CategoryTreeVersion.objects.bump()
+
+
+@receiver(post_save, sender=FollowRelationship)
+def backfill_followed_user_polls(sender, instance, raw, **kwargs):
+    if not raw and not instance.pending:
+        backfill_timeline(instance.from_user_id, instance.to_user_id)
+
+
+@receiver(post_delete, sender=FollowRelationship)
+def prune_unfollowed_user_polls(sender, instance, **kwargs):
+    prune_timeline(instance.from_user_id, instance.to_user_id)
+
+
+@receiver(m2m_changed, sender=User.blocked_users.through)
+def prune_blocked_users_polls(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'post_add' or reverse:
+        return
+    for blocked_user_id in pk_set:
+        prune_timeline(instance.pk, blocked_user_id)
+        prune_timeline(blocked_user_id, instance.pk)
+
+
+@receiver(pre_delete, sender=User)
+def release_deleted_user_comment_counters(sender, instance, **kwargs):
+    Comment.objects.release_user_counters(instance)
+    Comment.objects.filter(creator=instance).release_activity(user=instance)
@@ -1,14 +1,36 @@
+import csv
+import json
+import random
+import re
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import skipIf
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework_simplejwt.tokens import AccessToken
 
-from poll.models import Poll
+from poll.checks import check_shared_cache
+from poll.models import Poll, Choice, Vote, VoteRollup, IdempotencyKey, PendingVote, VoteCounterShard, \
+    CoSelection, RankedBallot
+from poll.ranking import tally, apply_ballot, get_ranked_results, get_ranked_results_cache_key, \
+    get_ranked_results_generation_key
 from socialmedia.models import User
 
 
 class PollTest(APITestCase):
     fixtures = ['polls', 'users']
 
+    def setUp(self):
+        # the result snapshots outlive the rolled back test transactions
+        cache.clear()
+
     def vote_api(self, poll_id, token, votes):
         return self.client.post('/api/poll/' + str(poll_id) + '/vote/', {
             "selected": votes
@@ -58,6 +80,45 @@ class PollTest(APITestCase):
         self.assertEqual(1, data['min_choice_can_vote'])
         self.assertEqual('VA', data['visibility_status'])
 
+    def get_poll_data(self, question, orders=(1, 2)):
+        return {
+            "question": question,
+            "choices": [{"context": str(order), "order": order} for order in orders],
+            "min_choice_can_vote": 1,
+            "max_choice_can_vote": 1
+        }
+
+    def test_bulk_create_polls(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        polls_data = [self.get_poll_data('first'), self.get_poll_data('second', (1, 2, 3))]
+        response = self.client.post('/api/poll/bulk/', polls_data, HTTP_AUTHORIZATION=token, format='json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(['first', 'second'], [poll['question'] for poll in response.data])
+        self.assertEqual([2, 3], [len(poll['choices']) for poll in response.data])
+        poll_ids = [poll['id'] for poll in response.data]
+        self.assertEqual(5, Choice.objects.filter(poll__in=poll_ids).count())
+        self.assertEqual(2, user.timeline_entries.filter(poll__in=poll_ids).count())
+
+    def test_bulk_create_polls_with_invalid_poll(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        polls_count = Poll.objects.count()
+        polls_data = [self.get_poll_data('first'), self.get_poll_data('second', (1, 1))]
+        response = self.client.post('/api/poll/bulk/', polls_data, HTTP_AUTHORIZATION=token, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual({}, response.data[0])
+        self.assertIn('non_field_errors', response.data[1])
+        self.assertEqual(polls_count, Poll.objects.count())
+
+    @override_settings(POLL_BULK_CREATE_MAX_SIZE=1)
+    def test_bulk_create_too_many_polls(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.post('/api/poll/bulk/', [self.get_poll_data('first'), self.get_poll_data('second')],
+                                    HTTP_AUTHORIZATION=token, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
     def test_create_poll_when_min_choice_can_vote_is_greater_than_max_choice_can_vote(self):
         user = User.objects.get(id=1)
         token = f'Bearer {str(AccessToken.for_user(user))}'
@@ -171,6 +232,16 @@ class PollTest(APITestCase):
         self.assertFalse(data['is_vote_retractable'])
         self.assertIsNotNone(data['all_votes'])
 
+    def test_get_poll_queries(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        self.client.get('/api/poll/3/', HTTP_AUTHORIZATION=token)
+        # the user, the users who blocked the user, the poll with its creator, image, file and category,
+        # its choices, the viewer vote
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/poll/3/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
     def test_get_hidden_poll_by_creator_user(self):
         user = User.objects.get(id=2)
         token = f'Bearer {str(AccessToken.for_user(user))}'
@@ -214,6 +285,8 @@ class PollTest(APITestCase):
         choices = data['choices']
         self.assertEqual(3, len(choices))
         for choice in choices:
+            # hidden results keep the key with null
+            self.assertIn('vote_count', choice)
             self.assertIsNone(choice['vote_count'])
 
         self.assertEqual('', data['attached_http_link'])
@@ -519,6 +592,31 @@ class PollTest(APITestCase):
         self.assertEqual(2, get_voters_response_results[1]['id'])
         self.assertEqual(1, get_voters_response_results[2]['id'])
 
+    def test_get_poll_voters_list_pages(self):
+        user = User.objects.get(id=3)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        self.vote_api(poll_id=6, token=token, votes=[2])
+        self.client.get('/api/poll/6/choice/2/voters/?page_size=1', HTTP_AUTHORIZATION=token)
+        # the user, the poll with its creator, the viewer vote, the users who blocked the user, the choice,
+        # the page of votes with their voters
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/poll/6/choice/2/voters/?page_size=1', HTTP_AUTHORIZATION=token)
+        self.assertEqual([3], [voter['id'] for voter in response.data['results']])
+        voter_ids = []
+        while response.data['next']:
+            response = self.client.get(response.data['next'], HTTP_AUTHORIZATION=token)
+            voter_ids += [voter['id'] for voter in response.data['results']]
+        self.assertEqual([2, 1], voter_ids)
+
+    def test_get_poll_voters_list_without_blockers(self):
+        User.objects.get(id=1).blocked_users.add(3)
+        user = User.objects.get(id=3)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        self.vote_api(poll_id=6, token=token, votes=[2])
+        response = self.client.get('/api/poll/6/choice/2/voters/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([3, 2], [voter['id'] for voter in response.data['results']])
+
     def test_get_private_page_poll_by_other_user_when_does_not_follow_the_user(self):
         user = User.objects.get(id=4)
         token = f'Bearer {str(AccessToken.for_user(user))}'
@@ -574,13 +672,58 @@ class PollTest(APITestCase):
         response = self.client.get('/api/poll/7/chart/circle/', HTTP_AUTHORIZATION=token)
         self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
 
+    def test_circle_chart_reads_result_snapshot(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.get('/api/poll/7/chart/circle/', HTTP_AUTHORIZATION=token)
+        self.assertIn('Last-Modified', response)
+        # the stored counters are not read once the snapshot is built
+        Choice.objects.filter(poll=7).update(vote_count=10)
+        # the user, the poll with its creator, its choices
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/poll/7/chart/circle/', HTTP_AUTHORIZATION=token)
+        self.assertEqual([2, 1, 1], [choice['vote_count'] for choice in response.data])
+
+    def test_vote_invalidates_result_snapshot(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.get('/api/poll/12/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(0, response.data['all_votes'])
+        self.vote_api(poll_id=12, token=token, votes=[1, 2])
+        response = self.client.get('/api/poll/12/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(2, response.data['all_votes'])
+        self.assertEqual({1: 1, 2: 1, 3: 0, 4: 0},
+                         {choice['order']: choice['vote_count'] for choice in response.data['choices']})
+        self.retract_vote_api(poll_id=12, token=token)
+        response = self.client.get('/api/poll/12/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(0, response.data['all_votes'])
+
+    @override_settings(DEBUG=False)
+    def test_deploy_check_requires_shared_cache(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual(['poll.E001'], [error.id for error in check_shared_cache(None)])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+                                                   'LOCATION': 'memcached:11211'}}):
+            self.assertEqual([], check_shared_cache(None))
+
+    def test_hot_poll_result_snapshot_is_kept_for_its_max_age(self):
+        Poll.objects.filter(id=12).update(results_max_age=60)
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        self.client.get('/api/poll/12/', HTTP_AUTHORIZATION=token)
+        self.vote_api(poll_id=12, token=token, votes=[1, 2])
+        response = self.client.get('/api/poll/12/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(0, response.data['all_votes'])
+        self.assertEqual(2, Poll.objects.get(id=12).vote_count)
+
     def test_get_bar_chart_by_poll_creator(self):
         user = User.objects.get(id=1)
         token = f'Bearer {str(AccessToken.for_user(user))}'
-        response = self.client.get('/api/poll/7/chart/bar/', HTTP_AUTHORIZATION=token)
+        response = self.client.get('/api/poll/7/chart/bar/?from=2021-05-27&to=2021-06-05', HTTP_AUTHORIZATION=token)
         self.assertEqual(status.HTTP_200_OK, response.status_code)
         data = response.data
 
+        self.assertEqual(10, len(data))
         self.assertEqual('2021-05-27', str(data[0]['created_at']))
         self.assertEqual(0, data[0]['count'])
         self.assertEqual('2021-05-28', str(data[1]['created_at']))
@@ -602,8 +745,521 @@ class PollTest(APITestCase):
         self.assertEqual('2021-06-05', str(data[9]['created_at']))
         self.assertEqual(0, data[9]['count'])
 
+    def test_get_bar_chart_by_hour(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        # the authenticated user, the poll of the permission check and one range read of the rollups
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/poll/7/chart/bar/?bucket=hour&from=2021-06-04T11:00:00%2B04:30'
+                                       '&to=2021-06-04T13:59:00%2B04:30', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([0, 2, 0], [item['count'] for item in response.data])
+        self.assertEqual('2021-06-04 12:00:00+04:30', str(response.data[1]['created_at']))
+        self.assertEqual({1: 2}, response.data[1]['choices'])
+
+    def test_get_bar_chart_by_week(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.get('/api/poll/7/chart/bar/?bucket=week&from=2021-05-27&to=2021-06-05',
+                                   HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        # 2021-05-24 and 2021-05-31 are mondays
+        self.assertEqual(['2021-05-24', '2021-05-31'], [str(item['created_at']) for item in response.data])
+        self.assertEqual([0, 3], [item['count'] for item in response.data])
+
+    def test_get_bar_chart_with_invalid_range(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.get('/api/poll/7/chart/bar/?from=2021-06-05&to=2021-05-27', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        response = self.client.get('/api/poll/7/chart/bar/?bucket=hour&from=2021-01-01&to=2021-06-05',
+                                   HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        response = self.client.get('/api/poll/7/chart/bar/?bucket=month', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_vote_and_retract_update_vote_rollups(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.vote_api(poll_id=12, token=token, votes=[1, 2])
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        rollups = VoteRollup.objects.filter(poll=12)
+        self.assertEqual({(VoteRollup.Bucket.HOUR, VoteRollup.POLL_TOTAL, 1), (VoteRollup.Bucket.HOUR, 1, 1),
+                          (VoteRollup.Bucket.HOUR, 2, 1), (VoteRollup.Bucket.DAY, VoteRollup.POLL_TOTAL, 1),
+                          (VoteRollup.Bucket.DAY, 1, 1), (VoteRollup.Bucket.DAY, 2, 1)},
+                         set(rollups.values_list('bucket', 'order', 'count')))
+        response = self.client.get('/api/poll/12/chart/bar/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(10, len(response.data))
+        self.assertEqual(1, response.data[-1]['count'])
+        self.assertEqual({1: 1, 2: 1}, response.data[-1]['choices'])
+
+        response = self.retract_vote_api(poll_id=12, token=token)
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertFalse(rollups.filter(count__gt=0).exists())
+
     def test_get_bar_chart_by_other_user(self):
         user = User.objects.get(id=4)
         token = f'Bearer {str(AccessToken.for_user(user))}'
         response = self.client.get('/api/poll/7/chart/bar/', HTTP_AUTHORIZATION=token)
         self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_export_poll_as_ndjson(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.get('/api/poll/7/export/?output=ndjson', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([2, 1, 1], [record['count'] for record in records if record['record'] == 'choice'])
+        self.assertIn({'record': 'total', 'count': 4}, records)
+        self.assertIn({'record': 'day', 'date': '2021-06-04', 'count': 2},
+                      [record for record in records if record['record'] == 'day'])
+        self.assertEqual(4, len([record for record in records if record['record'] == 'vote']))
+
+    def test_export_poll_as_csv(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.get('/api/poll/7/export/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('text/csv', response['Content-Type'])
+        self.assertEqual('attachment; filename="poll-7.csv"', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(['1', '2', '3'], [row['order'] for row in rows if row['record'] == 'choice'])
+        self.assertTrue(all(row['username'] for row in rows if row['record'] == 'vote'))
+
+    def test_export_poll_by_other_user(self):
+        user = User.objects.get(id=4)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.get('/api/poll/7/export/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_export_poll_with_invalid_output(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.get('/api/poll/7/export/?output=xml', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_vote_updates_stored_vote_counters(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.vote_api(poll_id=12, token=token, votes=[1, 2, 4])
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        choice_counts = dict(Choice.objects.filter(poll=12).values_list('order', 'vote_count'))
+        self.assertEqual({1: 1, 2: 1, 3: 0, 4: 1}, choice_counts)
+        self.assertEqual(3, Poll.objects.get(id=12).vote_count)
+
+    def test_retract_vote_updates_stored_vote_counters(self):
+        # user 1 has voted to 1, 2 of poll 4 and no one else have voted to this poll
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        self.assertEqual(2, Poll.objects.get(id=4).vote_count)
+        response = self.retract_vote_api(poll_id=4, token=token)
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertFalse(Choice.objects.filter(poll=4, vote_count__gt=0).exists())
+        self.assertEqual(0, Poll.objects.get(id=4).vote_count)
+
+    def test_vote_with_idempotency_key_is_replayed(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        first_response = self.client.post('/api/poll/12/vote/', {"selected": [1, 2]}, format='json',
+                                          HTTP_AUTHORIZATION=token, HTTP_IDEMPOTENCY_KEY='vote-12')
+        self.assertEqual(status.HTTP_201_CREATED, first_response.status_code)
+        # the user, the poll of the permission check, the idempotency key
+        with self.assertNumQueries(3):
+            response = self.client.post('/api/poll/12/vote/', {"selected": [1, 2]}, format='json',
+                                        HTTP_AUTHORIZATION=token, HTTP_IDEMPOTENCY_KEY='vote-12')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(first_response.data, response.data)
+        self.assertEqual('true', response['Idempotent-Replayed'])
+        self.assertEqual(2, Poll.objects.get(id=12).vote_count)
+
+    def test_vote_with_reused_idempotency_key(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        self.client.post('/api/poll/12/vote/', {"selected": [1, 2]}, format='json',
+                         HTTP_AUTHORIZATION=token, HTTP_IDEMPOTENCY_KEY='vote-12')
+        response = self.client.post('/api/poll/12/vote/', {"selected": [3]}, format='json',
+                                    HTTP_AUTHORIZATION=token, HTTP_IDEMPOTENCY_KEY='vote-12')
+        self.assertEqual(status.HTTP_422_UNPROCESSABLE_ENTITY, response.status_code)
+
+    def test_vote_with_expired_idempotency_key(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        self.client.post('/api/poll/12/vote/', {"selected": [1, 2]}, format='json',
+                         HTTP_AUTHORIZATION=token, HTTP_IDEMPOTENCY_KEY='vote-12')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        response = self.client.post('/api/poll/12/vote/', {"selected": [1, 2]}, format='json',
+                                    HTTP_AUTHORIZATION=token, HTTP_IDEMPOTENCY_KEY='vote-12')
+        self.assertEqual(status.HTTP_409_CONFLICT, response.status_code)
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        call_command('clearidempotencykeys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_buffered_vote_is_applied_by_worker(self):
+        Poll.objects.filter(id=12).update(buffers_votes=True)
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.vote_api(poll_id=12, token=token, votes=[1, 2])
+        self.assertEqual(status.HTTP_202_ACCEPTED, response.status_code)
+        self.assertEqual([1, 2], response.data['selected'])
+        self.assertEqual(0, Poll.objects.get(id=12).vote_count)
+        # the voter sees the own vote before it is applied
+        response = self.client.get('/api/poll/12/', HTTP_AUTHORIZATION=token)
+        self.assertEqual([1, 2], response.data['voted_choices'])
+        self.assertEqual(status.HTTP_409_CONFLICT, self.vote_api(poll_id=12, token=token, votes=[1]).status_code)
+
+        call_command('applypendingvotes', batch_size=1, stdout=StringIO())
+        self.assertFalse(PendingVote.objects.exists())
+        self.assertEqual([1, 2], Vote.objects.get(user=1, poll=12).get_selected_orders())
+        self.assertEqual(2, Poll.objects.get(id=12).vote_count)
+        choice_counts = dict(Choice.objects.filter(poll=12).values_list('order', 'vote_count'))
+        self.assertEqual({1: 1, 2: 1, 3: 0, 4: 0}, choice_counts)
+        self.assertEqual(3, VoteRollup.objects.filter(poll=12, bucket=VoteRollup.Bucket.DAY, count=1).count())
+
+    def test_late_applied_vote_keeps_its_time(self):
+        Poll.objects.filter(id=12).update(buffers_votes=True)
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        self.assertEqual(status.HTTP_202_ACCEPTED, self.vote_api(poll_id=12, token=token, votes=[1]).status_code)
+        # the worker applies the vote three hours after it was cast
+        cast_at = timezone.now() - timedelta(hours=3)
+        PendingVote.objects.filter(user=1, poll=12).update(created_at=cast_at)
+        call_command('applypendingvotes', stdout=StringIO())
+        self.assertEqual(cast_at, Vote.objects.get(user=1, poll=12).created_at)
+        hour_starts = set(VoteRollup.objects.filter(poll=12, bucket=VoteRollup.Bucket.HOUR, count=1)
+                          .values_list('bucket_start', flat=True))
+        self.assertEqual({VoteRollup.get_bucket_start(cast_at, VoteRollup.Bucket.HOUR)}, hour_starts)
+
+    @override_settings(VOTE_BUFFER_ALL_POLLS=True)
+    def test_retract_buffered_vote(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        self.assertEqual(status.HTTP_202_ACCEPTED, self.vote_api(poll_id=12, token=token, votes=[1]).status_code)
+        response = self.retract_vote_api(poll_id=12, token=token)
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertFalse(PendingVote.objects.exists())
+        call_command('applypendingvotes', stdout=StringIO())
+        self.assertFalse(Vote.objects.filter(user=1, poll=12).exists())
+        self.assertEqual(0, Poll.objects.get(id=12).vote_count)
+
+    def test_benchmark_votes_command(self):
+        polls_count = Poll.objects.count()
+        out = StringIO()
+        call_command('benchmarkvotes', votes=8, stdout=out)
+        self.assertIn('synchronous: 8 votes', out.getvalue())
+        self.assertIn('buffered, end to end: 8 votes', out.getvalue())
+        self.assertEqual(polls_count, Poll.objects.count())
+
+    def test_repair_vote_counters_command(self):
+        Choice.objects.filter(poll=7).update(vote_count=10)
+        Poll.objects.filter(id=7).update(vote_count=0)
+        call_command('repairvotecounters', chunk_size=3, stdout=StringIO())
+        choice_counts = dict(Choice.objects.filter(poll=7).values_list('order', 'vote_count'))
+        self.assertEqual({1: 2, 2: 1, 3: 1}, choice_counts)
+        self.assertEqual(4, Poll.objects.get(id=7).vote_count)
+
+    def test_interleaved_counter_updates_lose_no_increment(self):
+        # two vote requests load the poll before either updates the counters, the updates add to the stored values
+        # instead of writing back what each request has read
+        first, second = Poll.objects.get(id=12), Poll.objects.get(id=12)
+        first.update_vote_counters([1, 2], 1)
+        second.update_vote_counters([2], 1)
+        first.update_vote_counters([3], 1)
+        second.update_vote_counters([3], -1)
+        self.assertEqual(3, Poll.objects.get(id=12).vote_count)
+        choice_counts = dict(Choice.objects.filter(poll=12).values_list('order', 'vote_count'))
+        self.assertEqual({1: 1, 2: 2, 3: 0, 4: 0}, choice_counts)
+
+    def test_sharded_poll_counts_votes_on_shards(self):
+        # no one votes to poll with id 12 before
+        Poll.objects.filter(id=12).update(counter_shards=4)
+        for user_id, votes in ((1, [1, 2, 4]), (2, [1, 2])):
+            token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=user_id)))}'
+            self.assertEqual(status.HTTP_201_CREATED, self.vote_api(poll_id=12, token=token, votes=votes).status_code)
+        self.assertEqual(0, Poll.objects.get(id=12).vote_count)
+        self.assertEqual({12: {1: 2, 2: 2, 4: 1}}, VoteCounterShard.objects.get_counts([12]))
+
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        response = self.client.get('/api/user/1/polls/', HTTP_AUTHORIZATION=token)
+        poll_data = next(poll for poll in response.data['results'] if poll['id'] == 12)
+        self.assertEqual(5, poll_data['all_votes'])
+        self.assertEqual([2, 2, 0, 1], [choice['vote_count'] for choice in poll_data['choices']])
+        # the detail snapshot is read from the same counters
+        response = self.client.get('/api/poll/12/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(5, response.data['all_votes'])
+        self.assertEqual([2, 2, 0, 1], [choice['vote_count'] for choice in response.data['choices']])
+
+        call_command('shardvotecounters', poll=12, shards=0, stdout=StringIO())
+        self.assertIsNone(Poll.objects.get(id=12).counter_shards)
+        self.assertEqual(5, Poll.objects.get(id=12).vote_count)
+        choice_counts = dict(Choice.objects.filter(poll=12).values_list('order', 'vote_count'))
+        self.assertEqual({1: 2, 2: 2, 3: 0, 4: 1}, choice_counts)
+        self.assertFalse(VoteCounterShard.objects.exclude(count=0).exists())
+
+    def test_retract_vote_on_sharded_poll_is_repaired(self):
+        # user 1 has voted to 1, 2 of poll 4 and no one else have voted to this poll
+        Poll.objects.filter(id=4).update(counter_shards=4)
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        self.assertEqual(status.HTTP_204_NO_CONTENT, self.retract_vote_api(poll_id=4, token=token).status_code)
+        self.assertEqual({4: {1: -1, 2: -1}}, VoteCounterShard.objects.get_counts([4]))
+        call_command('repairvotecounters', stdout=StringIO())
+        self.assertFalse(Choice.objects.filter(poll=4, vote_count__gt=0).exists())
+        self.assertEqual(0, Poll.objects.get(id=4).vote_count)
+        # the rows of every choice and shard are created, so the votes during a repair only update locked rows
+        self.assertEqual({4: {1: 0, 2: 0, 3: 0, 4: 0}}, VoteCounterShard.objects.get_counts([4]))
+        self.assertEqual(16, VoteCounterShard.objects.filter(poll=4).count())
+
+    @override_settings(HOT_POLL_VOTES_PER_HOUR=2, HOT_POLL_COUNTER_SHARDS=8)
+    def test_hot_polls_are_raised_to_more_counter_shards(self):
+        for user_id in (1, 2):
+            token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=user_id)))}'
+            self.assertEqual(status.HTTP_201_CREATED, self.vote_api(poll_id=12, token=token, votes=[1]).status_code)
+        call_command('shardvotecounters', hot=True, stdout=StringIO())
+        self.assertEqual(8, Poll.objects.get(id=12).counter_shards)
+        # the votes of poll 7 are not from the current hour
+        self.assertIsNone(Poll.objects.get(id=7).counter_shards)
+
+    def test_get_co_selection_chart(self):
+        # no one votes to poll with id 12 before
+        for user_id, votes in ((1, [1, 2, 4]), (2, [1, 2]), (3, [1, 4])):
+            token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=user_id)))}'
+            self.assertEqual(status.HTTP_201_CREATED, self.vote_api(poll_id=12, token=token, votes=votes).status_code)
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        # the user, the poll, its choices and the matrix, whatever the number of votes
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/poll/12/chart/co-selection/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([1, 2, 3, 4], [choice['order'] for choice in response.data])
+        self.assertEqual(3, response.data[0]['count'])
+        self.assertEqual([
+            {'order': 2, 'count': 2, 'percent': 66.67},
+            {'order': 3, 'count': 0, 'percent': 0},
+            {'order': 4, 'count': 2, 'percent': 66.67},
+        ], response.data[0]['co_selected'])
+        self.assertEqual(0, response.data[2]['count'])
+
+        token3 = f'Bearer {str(AccessToken.for_user(User.objects.get(id=3)))}'
+        self.assertEqual(status.HTTP_204_NO_CONTENT, self.retract_vote_api(poll_id=12, token=token3).status_code)
+        response = self.client.get('/api/poll/12/chart/co-selection/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(1, response.data[3]['count'])
+        self.assertEqual({'order': 1, 'count': 1, 'percent': 100.0}, response.data[3]['co_selected'][0])
+
+    def test_co_selection_chart_of_buffered_votes(self):
+        Poll.objects.filter(id=12).update(buffers_votes=True)
+        for user_id, votes in ((1, [1, 2]), (2, [1, 3])):
+            token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=user_id)))}'
+            self.assertEqual(status.HTTP_202_ACCEPTED, self.vote_api(poll_id=12, token=token, votes=votes).status_code)
+        call_command('applypendingvotes', stdout=StringIO())
+        self.assertEqual({(1, 1): 2, (1, 2): 1, (2, 1): 1, (2, 2): 1, (1, 3): 1, (3, 1): 1, (3, 3): 1},
+                         CoSelection.objects.get_matrix(12))
+
+    def test_co_selection_chart_of_single_choice_poll(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.get('/api/poll/7/chart/co-selection/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_co_selection_chart_by_other_user(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.get('/api/poll/4/chart/co-selection/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_get_ranked_chart(self):
+        # no one votes to poll with id 12 before
+        Poll.objects.filter(id=12).update(is_ranked=True)
+        for user_id, votes in ((1, [1, 2]), (2, [2, 1]), (3, [3, 2]), (4, [4, 2])):
+            token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=user_id)))}'
+            response = self.vote_api(poll_id=12, token=token, votes=votes)
+            self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+            self.assertEqual(votes, response.data['selected'])
+        self.assertEqual([2, 1], Vote.objects.get(user=2, poll=12).get_ranking())
+        self.assertEqual([1, 2], Vote.objects.get(user=1, poll=12).get_selected_orders())
+
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        response = self.client.get('/api/poll/12/chart/ranked/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(2, response.data['winner'])
+        self.assertEqual(4, response.data['ballots'])
+        self.assertEqual([
+            {'choices': {1: 1, 2: 1, 3: 1, 4: 1}, 'exhausted': 0, 'eliminated': 4},
+            {'choices': {1: 1, 2: 2, 3: 1}, 'exhausted': 0, 'eliminated': 3},
+            {'choices': {1: 1, 2: 3}, 'exhausted': 0, 'eliminated': None},
+        ], response.data['rounds'])
+
+    def test_retract_vote_on_ranked_poll(self):
+        Poll.objects.filter(id=12).update(is_ranked=True)
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        self.assertEqual(status.HTTP_201_CREATED, self.vote_api(poll_id=12, token=token, votes=[4, 1]).status_code)
+        self.assertEqual({Vote.encode_ranking([4, 1]): 1}, RankedBallot.objects.get_ballots(12))
+        self.assertEqual(status.HTTP_204_NO_CONTENT, self.retract_vote_api(poll_id=12, token=token).status_code)
+        self.assertEqual({}, RankedBallot.objects.get_ballots(12))
+
+    def test_buffered_vote_on_ranked_poll(self):
+        Poll.objects.filter(id=12).update(is_ranked=True, buffers_votes=True)
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        response = self.vote_api(poll_id=12, token=token, votes=[3, 1])
+        self.assertEqual(status.HTTP_202_ACCEPTED, response.status_code)
+        self.assertEqual([3, 1], response.data['selected'])
+        call_command('applypendingvotes', stdout=StringIO())
+        self.assertEqual([3, 1], Vote.objects.get(user=1, poll=12).get_ranking())
+        self.assertEqual({Vote.encode_ranking([3, 1]): 1}, RankedBallot.objects.get_ballots(12))
+
+    def test_vote_with_choice_ranked_twice(self):
+        Poll.objects.filter(id=12).update(is_ranked=True)
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        response = self.vote_api(poll_id=12, token=token, votes=[1, 2, 1])
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_ranked_chart_of_not_ranked_poll(self):
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        response = self.client.get('/api/poll/12/chart/ranked/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_vote_is_stored_as_one_row_per_user_and_poll(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.vote_api(poll_id=12, token=token, votes=[1, 2, 4])
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        votes = Vote.objects.filter(user=user, poll=12)
+        self.assertEqual(1, votes.count())
+        self.assertEqual([1, 2, 4], votes.get().get_selected_orders())
+        self.assertEqual([1], list(Choice.objects.get(poll=12, order=4).get_votes().values_list('user', flat=True)))
+
+    def test_second_vote_of_user_on_poll_is_rejected_by_database(self):
+        # user 1 has voted to poll 4 before
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Vote.objects.create(user_id=1, poll_id=4, selected_orders=Vote.encode_orders([3]))
+
+
+class RankedTallyTest(SimpleTestCase):
+    def test_ranking_is_packed_in_order_of_preference(self):
+        for orders in ([1], [10, 0, 3], list(range(10, 0, -1))):
+            self.assertEqual(orders, Vote.decode_ranking(Vote.encode_ranking(orders)))
+
+    def test_exhausted_ballots_are_left_out_of_the_majority(self):
+        ballots = {Vote.encode_ranking([1]): 2, Vote.encode_ranking([2]): 2, Vote.encode_ranking([3, 2]): 1}
+        results = tally(ballots, [1, 2, 3])
+        self.assertEqual(2, results['winner'])
+        self.assertEqual({'counts': {1: 2, 2: 3}, 'exhausted': 0, 'eliminated': None}, results['rounds'][1])
+
+    def test_applied_ballots_match_a_full_tally(self):
+        generator = random.Random(20)
+        orders = [1, 2, 3, 4, 5]
+        ballots = {}
+        results = tally(ballots, orders)
+        for _ in range(300):
+            ranking = Vote.encode_ranking(generator.sample(orders, generator.randint(1, 3)))
+            delta = -1 if ballots.get(ranking) and generator.random() < 0.3 else 1
+            ballots[ranking] = ballots.get(ranking, 0) + delta
+            if not apply_ballot(results, ranking, delta):
+                results = tally(ballots, orders)
+            self.assertEqual(tally({ranking: count for ranking, count in ballots.items() if count}, orders), results)
+
+
+class RankedResultsCacheTest(TransactionTestCase):
+    """The votes commit here, so the results are updated through the shared cache like between workers."""
+    fixtures = ['polls', 'users']
+
+    def setUp(self):
+        cache.clear()
+        Poll.objects.filter(id=12).update(is_ranked=True)
+        self.poll = Poll.objects.get(id=12)
+
+    def vote(self, user_id, votes):
+        client = APIClient()
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=user_id)))}'
+        response = client.post('/api/poll/12/vote/', {"selected": votes}, format='json', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+
+    def test_committed_vote_updates_cached_results(self):
+        self.vote(1, [1, 2])
+        self.assertEqual(1, get_ranked_results(self.poll)['ballots'])
+        # the outcome of no round changes, so the cached results are updated in place
+        self.vote(2, [1, 3])
+        self.assertEqual(2, cache.get(get_ranked_results_cache_key(12))['ballots'])
+
+    def test_vote_drops_results_while_another_worker_holds_the_lock(self):
+        self.vote(1, [1, 2])
+        get_ranked_results(self.poll)
+        generation = cache.get(get_ranked_results_generation_key(12))
+        cache.add(get_ranked_results_cache_key(12) + ':lock', True, 5)
+        self.vote(2, [2, 1])
+        self.assertIsNone(cache.get(get_ranked_results_cache_key(12)))
+        # bumped once more, so the results the lock holder is writing are dropped too
+        self.assertEqual(generation + 2, cache.get(get_ranked_results_generation_key(12)))
+        cache.delete(get_ranked_results_cache_key(12) + ':lock')
+        self.assertEqual(2, get_ranked_results(self.poll)['ballots'])
+
+
+@skipIf(connection.vendor == 'sqlite', 'sqlite fails the concurrent writers instead of letting them wait')
+class ConcurrentVoteTest(TransactionTestCase):
+    fixtures = ['polls', 'users']
+
+    def test_concurrent_votes_on_one_poll(self):
+        # every user sends its vote four times at once, like the retries of a flaky connection
+        users = list(User.objects.filter(id__in=[1, 2, 3, 4, 5]))
+        barrier = threading.Barrier(len(users) * 4)
+        status_codes = []
+
+        def vote(user):
+            client = APIClient()
+            token = f'Bearer {str(AccessToken.for_user(user))}'
+            barrier.wait()
+            try:
+                response = client.post('/api/poll/12/vote/', {"selected": [1, 2]}, format='json',
+                                       HTTP_AUTHORIZATION=token, HTTP_IDEMPOTENCY_KEY=f'vote-{user.pk}')
+                status_codes.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=vote, args=(user,)) for user in users for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([status.HTTP_201_CREATED] * len(threads), status_codes)
+        self.assertEqual(len(users), Vote.objects.filter(poll=12).count())
+        self.assertEqual(len(users) * 2, Poll.objects.get(id=12).vote_count)
+        choice_counts = dict(Choice.objects.filter(poll=12).values_list('order', 'vote_count'))
+        self.assertEqual({1: len(users), 2: len(users), 3: 0, 4: 0}, choice_counts)
+
+    def test_concurrent_votes_on_sharded_poll(self):
+        Poll.objects.filter(id=12).update(counter_shards=4)
+        users = list(User.objects.filter(id__in=[1, 2, 3, 4, 5]))
+        barrier = threading.Barrier(len(users))
+
+        def vote(user):
+            client = APIClient()
+            token = f'Bearer {str(AccessToken.for_user(user))}'
+            barrier.wait()
+            try:
+                client.post('/api/poll/12/vote/', {"selected": [1, 2]}, format='json', HTTP_AUTHORIZATION=token)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=vote, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual({12: {1: len(users), 2: len(users)}}, VoteCounterShard.objects.get_counts([12]))
+        call_command('shardvotecounters', fold=True, stdout=StringIO())
+        self.assertEqual(len(users) * 2, Poll.objects.get(id=12).vote_count)
+
+    def test_benchmark_counters_command(self):
+        out, err = StringIO(), StringIO()
+        call_command('benchmarkcounters', threads=8, increments=3, shards=[1, 16], hold_ms=20, stdout=out, stderr=err)
+        self.assertEqual('', err.getvalue())
+        rates = {}
+        for line in out.getvalue().splitlines():
+            shards, increments, rate, counted = re.match(
+                r'(\d+) shards: (\d+) increments in [\d.]+s, (\d+) increments/s, (\d+) counted', line).groups()
+            # no increment is lost by the concurrent writers
+            self.assertEqual(('24', '24'), (increments, counted))
+            rates[int(shards)] = int(rate)
+        # one row serializes the writers for the 20ms of each transaction, the shards let them run side by side
+        self.assertGreater(rates[16], rates[1] * 2)
+        self.assertFalse(Poll.objects.filter(question='benchmark').exists())
@@ -1,13 +1,25 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import AccessToken
 
+from poll.models import Category, CategoryClosure, CategoryStats, CategoryTreeVersion, Poll
 from socialmedia.models import User
 
 
 class CategoryTest(APITestCase):
     fixtures = ['poll_categories', 'users']
 
+    def setUp(self):
+        # the version stamp of the category tree outlives the rolled back test transactions
+        cache.clear()
+
     def test_create_poll_with_category(self):
         user = User.objects.get(id=1)
         token = f'Bearer {str(AccessToken.for_user(user))}'
@@ -116,3 +128,168 @@ class CategoryTest(APITestCase):
         self.assertEqual('programming', first_category_sub_categories[1]['name'])
         self.assertEqual(3, first_category_sub_categories[1]['id'])
         self.assertEqual(3, first_category_sub_categories[1]['order'])
+
+    def test_get_category_polls_queries_do_not_depend_on_page_size(self):
+        user = User.objects.get(id=2)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        query_counts = []
+        for page_size in (1, 10):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(f'/api/poll/category/1/?page_size={page_size}', HTTP_AUTHORIZATION=token)
+            self.assertEqual(page_size if page_size == 1 else 4, len(response.data['results']))
+            query_counts.append(len(context.captured_queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def get_category_poll_ids(self, category_id):
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        response = self.client.get(f'/api/poll/category/{category_id}/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return {poll['id'] for poll in response.data['results']}
+
+    def test_get_category_polls_of_deeper_sub_categories(self):
+        # category 3 is category 1 sub category
+        Category(name='python', parent_id=3, order=5).save()
+        category = Category.objects.get(name='python')
+        self.assertEqual({(1, 2), (3, 1), (category.pk, 0)},
+                         set(category.ancestor_links.values_list('ancestor', 'depth')))
+        Poll.objects.filter(id=15).update(category=category)
+        self.assertIn(15, self.get_category_poll_ids(1))
+        self.assertIn(15, self.get_category_poll_ids(3))
+        self.assertEqual({15}, self.get_category_poll_ids(category.pk))
+
+    def test_move_sub_category(self):
+        # category 3 is category 1 sub category
+        category = Category.objects.get(id=3)
+        first_category_poll_ids = self.get_category_poll_ids(3)
+        category.parent_id = 4
+        category.save()
+        self.assertEqual({(4, 1), (3, 0)}, set(category.ancestor_links.values_list('ancestor', 'depth')))
+        self.assertFalse(first_category_poll_ids & self.get_category_poll_ids(1))
+        self.assertLessEqual(first_category_poll_ids, self.get_category_poll_ids(4))
+
+    def test_move_category_under_its_sub_category(self):
+        category = Category.objects.get(id=1)
+        category.parent_id = 3
+        with self.assertRaises(ValidationError):
+            category.save()
+        self.assertIsNone(Category.objects.get(id=1).parent_id)
+
+    def test_delete_category_deletes_its_closure(self):
+        Category.objects.get(id=1).delete()
+        self.assertFalse(CategoryClosure.objects.filter(descendant__in=[1, 2, 3]).exists())
+        self.assertTrue(CategoryClosure.objects.filter(ancestor=4, descendant=4).exists())
+
+    def test_get_category_tree_in_one_query(self):
+        Category(name='python', parent_id=3, order=5).save()
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        # the user, the version stamp and the categories
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/poll/category/', HTTP_AUTHORIZATION=token)
+        # the tree is kept in the process, only the user and the version stamp are read
+        with self.assertNumQueries(2):
+            self.client.get('/api/poll/category/', HTTP_AUTHORIZATION=token)
+        programming = response.data[0]['sub_categories'][1]
+        self.assertEqual('programming', programming['name'])
+        self.assertEqual(['python'], [category['name'] for category in programming['sub_categories']])
+        self.assertEqual([], response.data[1]['sub_categories'])
+
+    def test_get_categories_not_modified(self):
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        response = self.client.get('/api/poll/category/', HTTP_AUTHORIZATION=token)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        response = self.client.get('/api/poll/category/', HTTP_AUTHORIZATION=token, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual(b'', response.content)
+        self.assertEqual(etag, response['ETag'])
+
+    def test_category_change_is_served_at_once(self):
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        etag = self.client.get('/api/poll/category/', HTTP_AUTHORIZATION=token)['ETag']
+        category = Category.objects.get(id=4)
+        category.name = 'gadgets'
+        category.save()
+        response = self.client.get('/api/poll/category/', HTTP_AUTHORIZATION=token, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('gadgets', response.data[1]['name'])
+        self.assertNotEqual(etag, response['ETag'])
+
+        Category.objects.get(id=4).delete()
+        response = self.client.get('/api/poll/category/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(['learning'], [category['name'] for category in response.data])
+
+    def test_category_change_of_another_worker_is_served(self):
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        self.client.get('/api/poll/category/', HTTP_AUTHORIZATION=token)
+        # changed by another process, only the version stamp in the database tells this one
+        Category.objects.filter(id=4).update(name='gadgets')
+        CategoryTreeVersion.objects.bump()
+        response = self.client.get('/api/poll/category/', HTTP_AUTHORIZATION=token)
+        self.assertEqual('gadgets', response.data[1]['name'])
+
+    def vote(self, user_id, poll_id):
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=user_id)))}'
+        response = self.client.post(f'/api/poll/{poll_id}/vote/', {"selected": [1]}, HTTP_AUTHORIZATION=token,
+                                    format='json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+
+    def test_get_category_stats(self):
+        # categories 2 and 3 are category 1 sub categories, the polls of user 6 are of a private page
+        self.vote(1, 17)
+        self.vote(1, 18)
+        self.vote(2, 18)
+        call_command('refreshcategorystats', recount=True, stdout=StringIO())
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        # the user, the categories, their counters, their recent votes and the blockers of the user
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/poll/category/stats/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        learning, digital = response.data
+        self.assertEqual((4, 3, [18, 17]),
+                         (learning['poll_count'], learning['recent_vote_count'], learning['top_poll_ids']))
+        programming = learning['sub_categories'][1]
+        self.assertEqual((2, 3, [18, 17]),
+                         (programming['poll_count'], programming['recent_vote_count'], programming['top_poll_ids']))
+        self.assertEqual((1, 0, []), (digital['poll_count'], digital['recent_vote_count'], digital['top_poll_ids']))
+
+    def test_category_stats_follow_polls_and_votes(self):
+        call_command('refreshcategorystats', recount=True, stdout=StringIO())
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        response = self.client.post('/api/poll/', {
+            "question": "how old are you?",
+            "choices": [{"context": "48", "order": "1"}, {"context": "22", "order": "2"}],
+            "min_choice_can_vote": 1,
+            "max_choice_can_vote": 1,
+            "category": "4"
+        }, HTTP_AUTHORIZATION=token, format='json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.vote(1, response.data['id'])
+        self.assertEqual(2, Category.objects.get(id=4).stats.poll_count)
+        digital = self.client.get('/api/poll/category/stats/', HTTP_AUTHORIZATION=token).data[1]
+        self.assertEqual((2, 1), (digital['poll_count'], digital['recent_vote_count']))
+
+        self.client.delete(f'/api/poll/{response.data["id"]}/vote/', HTTP_AUTHORIZATION=token)
+        Poll.objects.get(id=19).delete()
+        digital = self.client.get('/api/poll/category/stats/', HTTP_AUTHORIZATION=token).data[1]
+        self.assertEqual((1, 0), (digital['poll_count'], digital['recent_vote_count']))
+
+    def test_category_stats_count_the_polls_of_public_pages(self):
+        call_command('refreshcategorystats', recount=True, stdout=StringIO())
+        # poll 21 of user 6, whose page is private, is not counted as it is not listed in the category
+        Poll.objects.create(creator_id=6, question='how old are you?', category_id=4)
+        self.assertEqual(1, Category.objects.get(id=4).stats.poll_count)
+        Poll.objects.get(id=21).delete()
+        self.assertEqual(1, Category.objects.get(id=4).stats.poll_count)
+
+        user = User.objects.get(id=6)
+        user.is_public = True
+        user.save()
+        self.assertEqual(2, Category.objects.get(id=4).stats.poll_count)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.get('/api/poll/category/4/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(2, len(response.data['results']))
+
+        user.is_public = False
+        user.save(update_fields=['is_public'])
+        self.assertEqual([(1, 1), (2, 1), (3, 2), (4, 1)],
+                         list(CategoryStats.objects.order_by('category').values_list('category', 'poll_count')))
@@ -1,7 +1,17 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import AccessToken
 
+from poll.models import Comment, CommentReaction, Poll, PollActivityRollup, TrendingPoll, VoteRollup
+from poll.trending import get_decay
 from socialmedia.models import User
 
 
@@ -164,6 +174,15 @@ class CommentAndReplyTest(APITestCase):
         self.assertEqual(2, data[0]['id'])
         self.assertEqual('i like benz more', data[0]['content'])
 
+    def test_get_comments_list_fetches_poll_once(self):
+        user = User.objects.get(id=2)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/poll/22/comment/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        poll_queries = [query for query in context.captured_queries if 'FROM "poll_poll"' in query['sql']]
+        self.assertEqual(1, len(poll_queries))
+
     def test_get_comments_list_by_other_user_when_page_is_public(self):
         user = User.objects.get(id=3)
         token = f'Bearer {str(AccessToken.for_user(user))}'
@@ -337,3 +356,192 @@ class LikeAndDislikeTest(APITestCase):
         token = f'Bearer {str(AccessToken.for_user(user))}'
         response = self.client.delete('/api/poll/22/comment/1/dislike/', HTTP_AUTHORIZATION=token)
         self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_dislike_after_like_moves_counters(self):
+        user = User.objects.get(id=6)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.post('/api/poll/22/comment/1/dislike/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        comment = Comment.objects.get(id=1)
+        self.assertEqual((1, 1), (comment.likes_count, comment.dislikes_count))
+        self.assertEqual(CommentReaction.Value.DISLIKE, comment.reactions.get(user=user).value)
+
+        response = self.client.post('/api/poll/22/comment/1/dislike/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_409_CONFLICT, response.status_code)
+        response = self.client.delete('/api/poll/22/comment/1/dislike/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        comment.refresh_from_db()
+        self.assertEqual((1, 0), (comment.likes_count, comment.dislikes_count))
+
+    def test_reply_counter_follows_create_and_delete(self):
+        user = User.objects.get(id=6)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.post('/api/poll/22/comment/', {'content': 'and audi?', 'parent': 2},
+                                    HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(1, Comment.objects.get(id=2).replies_count)
+
+        response = self.client.delete(f'/api/poll/22/comment/{response.data["id"]}/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertEqual(0, Comment.objects.get(id=2).replies_count)
+
+    def test_deleted_user_is_taken_off_comment_counters(self):
+        # user 2 has liked comment 1, disliked comment 5 and replied to comment 1 with comment 4
+        User.objects.get(id=2).delete()
+        comment = Comment.objects.get(id=1)
+        self.assertEqual((1, 0, 1), (comment.likes_count, comment.dislikes_count, comment.replies_count))
+        self.assertEqual(1, Comment.objects.get(id=5).dislikes_count)
+
+    def test_repair_comment_counters(self):
+        Comment.objects.filter(id=1).update(likes_count=7, replies_count=0)
+        out = StringIO()
+        call_command('repaircommentcounters', chunk_size=2, stdout=out)
+        comment = Comment.objects.get(id=1)
+        self.assertEqual((2, 0, 2), (comment.likes_count, comment.dislikes_count, comment.replies_count))
+        self.assertIn('Counters repaired for 1 comments.', out.getvalue())
+
+    def test_comments_list_reactions(self):
+        user = User.objects.get(id=6)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/poll/22/comment/?ordering=-likes', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        reaction_queries = [query for query in context.captured_queries if 'poll_commentreaction' in query['sql']]
+        self.assertEqual(1, len(reaction_queries))
+
+        data = response.data['results']
+        self.assertEqual([1, 2], [comment['id'] for comment in data])
+        self.assertEqual(2, data[0]['likes_count'])
+        self.assertTrue(data[0]['has_reply'])
+        self.assertEqual('liked', data[0]['like_status'])
+        self.assertIsNone(data[1]['like_status'])
+
+    def test_set_reaction(self):
+        user = User.objects.get(id=6)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.put('/api/poll/22/comment/1/reaction/', {'reaction': 'dislike'},
+                                   HTTP_AUTHORIZATION=token, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({'reaction': 'dislike', 'likes_count': 1, 'dislikes_count': 1}, response.data)
+
+        response = self.client.put('/api/poll/22/comment/1/reaction/', {'reaction': None},
+                                   HTTP_AUTHORIZATION=token, format='json')
+        self.assertEqual({'reaction': None, 'likes_count': 1, 'dislikes_count': 0}, response.data)
+        self.assertFalse(CommentReaction.objects.filter(comment=1, user=user).exists())
+
+    def test_set_invalid_reaction(self):
+        user = User.objects.get(id=6)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.put('/api/poll/22/comment/1/reaction/', {'reaction': 'love'},
+                                   HTTP_AUTHORIZATION=token, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_delete_like_when_disliked(self):
+        # user 6 has disliked comment 5
+        user = User.objects.get(id=6)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        response = self.client.delete('/api/poll/22/comment/5/like/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_409_CONFLICT, response.status_code)
+        self.assertEqual(2, Comment.objects.get(id=5).dislikes_count)
+
+
+class TrendingTest(APITestCase):
+    fixtures = ['users', 'comments']
+
+    def get_activity(self, poll_id):
+        return PollActivityRollup.objects.filter(poll=poll_id).aggregate(comments=Sum('comments'), likes=Sum('likes'))
+
+    def test_activity_follows_comments_and_likes(self):
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=6)))}'
+        response = self.client.post('/api/poll/22/comment/', {'content': 'and audi?', 'parent': 2},
+                                    HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.client.post('/api/poll/22/comment/2/like/', HTTP_AUTHORIZATION=token)
+        self.assertEqual({'comments': 1, 'likes': 1}, self.get_activity(22))
+
+        self.client.put('/api/poll/22/comment/2/reaction/', {'reaction': 'dislike'}, HTTP_AUTHORIZATION=token,
+                        format='json')
+        self.client.delete(f'/api/poll/22/comment/{response.data["id"]}/', HTTP_AUTHORIZATION=token)
+        self.assertEqual({'comments': 0, 'likes': 0}, self.get_activity(22))
+
+    def test_deleted_comment_takes_its_replies_and_likes_out_of_activity(self):
+        token6 = f'Bearer {str(AccessToken.for_user(User.objects.get(id=6)))}'
+        token2 = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        comment_id = self.client.post('/api/poll/22/comment/', {'content': 'and audi?', 'parent': None},
+                                      format='json', HTTP_AUTHORIZATION=token6).data['id']
+        reply_id = self.client.post('/api/poll/22/comment/', {'content': 'bmw', 'parent': comment_id},
+                                    HTTP_AUTHORIZATION=token2).data['id']
+        self.client.post(f'/api/poll/22/comment/{comment_id}/like/', HTTP_AUTHORIZATION=token2)
+        self.client.post(f'/api/poll/22/comment/{reply_id}/like/', HTTP_AUTHORIZATION=token2)
+        self.client.post(f'/api/poll/22/comment/{reply_id}/like/', HTTP_AUTHORIZATION=token6)
+        self.assertEqual({'comments': 2, 'likes': 3}, self.get_activity(22))
+
+        response = self.client.delete(f'/api/poll/22/comment/{comment_id}/', HTTP_AUTHORIZATION=token6)
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertEqual({'comments': 0, 'likes': 0}, self.get_activity(22))
+
+    def test_deleted_user_is_taken_out_of_activity(self):
+        token3 = f'Bearer {str(AccessToken.for_user(User.objects.get(id=3)))}'
+        token1 = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        comment_id = self.client.post('/api/poll/12/comment/', {'content': 'why?', 'parent': None},
+                                      format='json', HTTP_AUTHORIZATION=token3).data['id']
+        self.client.post('/api/poll/12/comment/', {'content': 'because', 'parent': comment_id},
+                         HTTP_AUTHORIZATION=token1)
+        self.client.post(f'/api/poll/12/comment/{comment_id}/like/', HTTP_AUTHORIZATION=token1)
+        self.client.post('/api/poll/12/comment/7/like/', HTTP_AUTHORIZATION=token3)
+        self.assertEqual({'comments': 2, 'likes': 2}, self.get_activity(12))
+
+        User.objects.get(id=3).delete()
+        self.assertEqual({'comments': 0, 'likes': 0}, self.get_activity(12))
+
+    def test_removed_like_is_taken_out_of_its_hour(self):
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=6)))}'
+        self.client.post('/api/poll/22/comment/2/like/', HTTP_AUTHORIZATION=token)
+        # the like was given three hours ago
+        liked_at = timezone.now() - timedelta(hours=3)
+        CommentReaction.objects.filter(comment=2, user=6).update(created_at=liked_at)
+        PollActivityRollup.objects.filter(poll=22).update(
+            bucket_start=VoteRollup.get_bucket_start(liked_at, VoteRollup.Bucket.HOUR))
+
+        self.client.put('/api/poll/22/comment/2/reaction/', {'reaction': 'dislike'}, HTTP_AUTHORIZATION=token,
+                        format='json')
+        self.client.put('/api/poll/22/comment/2/reaction/', {'reaction': 'like'}, HTTP_AUTHORIZATION=token,
+                        format='json')
+        self.client.delete('/api/poll/22/comment/2/like/', HTTP_AUTHORIZATION=token)
+        self.assertEqual([0, 0], list(PollActivityRollup.objects.filter(poll=22).order_by('bucket_start')
+                                      .values_list('likes', flat=True)))
+
+    def test_decay(self):
+        now = timezone.now()
+        bucket_start = VoteRollup.get_bucket_start(now, VoteRollup.Bucket.HOUR)
+        self.assertEqual(1, get_decay(bucket_start, now))
+        with override_settings(TRENDING_HALF_LIFE_HOURS=6):
+            self.assertAlmostEqual(0.5, get_decay(now - timedelta(hours=7), now))
+
+    @override_settings(TRENDING_COMMENT_WEIGHT=3, TRENDING_LIKE_WEIGHT=1, TRENDING_HALF_LIFE_HOURS=6)
+    def test_get_trending_polls(self):
+        # poll 21 is of the private page of user 6, poll 23 gains less from its older comments than poll 12
+        now = timezone.now()
+        poll = Poll.objects.create(id=23, creator_id=2, question='is it trending?')
+        PollActivityRollup.objects.record(12, comments=1, likes=1)
+        PollActivityRollup.objects.record(poll.pk, comments=2, moment=now - timedelta(hours=7))
+        PollActivityRollup.objects.record(21, comments=10)
+        PollActivityRollup.objects.record(12, comments=5, moment=now - timedelta(days=3))
+        call_command('refreshtrendingpolls', stdout=StringIO())
+        self.assertEqual([(12, 1), (23, 2)], list(TrendingPoll.objects.order_by('rank').values_list('poll', 'rank')))
+        # 6 weighted comments of an hour which has ended 6 to 7 hours ago, depending on the minute of now
+        self.assertTrue(6 * 0.5 ** (7 / 6) < TrendingPoll.objects.get(poll=23).score <= 3)
+        # the buckets out of the trending window are dropped
+        self.assertEqual({'comments': 1, 'likes': 1}, self.get_activity(12))
+
+        token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=3)))}'
+        response = self.client.get('/api/poll/trending/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([12, 23], [poll['id'] for poll in response.data['results']])
+        response = self.client.get('/api/poll/trending/?page_size=1', HTTP_AUTHORIZATION=token)
+        response = self.client.get(response.data['next'], HTTP_AUTHORIZATION=token)
+        self.assertEqual([23], [poll['id'] for poll in response.data['results']])
+
+        User.objects.get(id=1).blocked_users.add(3)
+        response = self.client.get('/api/poll/trending/', HTTP_AUTHORIZATION=token)
+        self.assertEqual([23], [poll['id'] for poll in response.data['results']])
@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+
+from poll.models import Poll, TimelineEntry, TimelineSync
+from socialmedia.models import FollowRelationship
+
+
+def _write_entries(owner_ids, polls):
+    entries = [TimelineEntry(owner_id=owner_id, poll_id=poll_id, created_at=created_at)
+               for owner_id in owner_ids for poll_id, created_at in polls]
+    TimelineEntry.objects.bulk_create(entries, batch_size=settings.TIMELINE_CHUNK_SIZE, ignore_conflicts=True)
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def fan_out_poll(poll):
+    fan_out_polls(poll.creator_id, [poll])
+
+
+def fan_out_polls(creator_id, polls):
+    """
+    Write the polls of the creator to its timeline and, unless the creator has more followers than
+    TIMELINE_FANOUT_MAX_FOLLOWERS, to the timelines of the followers.
+    Polls which are not fanned out are pulled by the followers when they read their timeline.
+    """
+    polls = [(poll.pk, poll.created_at) for poll in polls]
+    _write_entries([creator_id], polls)
+    followers = FollowRelationship.objects.filter(to_user=creator_id, pending=False)
+    if followers.count() > settings.TIMELINE_FANOUT_MAX_FOLLOWERS:
+        return
+    follower_ids = followers.order_by('from_user').values_list('from_user', flat=True)
+    for follower_ids_chunk in _chunks(follower_ids.iterator(), settings.TIMELINE_CHUNK_SIZE):
+        _write_entries(follower_ids_chunk, polls)
+    Poll.objects.filter(pk__in=[poll_id for poll_id, _ in polls]).update(fanned_out=True)
+
+
+def pull_timeline(owner):
+    """
+    Write the polls which were not fanned out and are created since the last pull to the owner timeline.
+    created_at is stamped before the poll commits, so a poll may commit after a newer one has been pulled:
+    the last TIMELINE_PULL_OVERLAP seconds before the watermark are read again and the entries already
+    pulled are left out.
+    """
+    sync = TimelineSync.objects.filter(owner=owner).first()
+    pulled_until = sync.pulled_until if sync else None
+    followings = FollowRelationship.objects.filter(from_user=owner, pending=False).values('to_user')
+    pulled_polls = Poll.objects.filter(Q(creator__in=followings) | Q(creator=owner), fanned_out=False)
+    if pulled_until is not None:
+        pulled_polls = pulled_polls.filter(
+            created_at__gte=pulled_until - timedelta(seconds=settings.TIMELINE_PULL_OVERLAP)) \
+            .exclude(timeline_entries__owner=owner)
+    polls = pulled_polls.order_by('created_at').values_list('pk', 'created_at')
+    newest = None
+    for polls_chunk in _chunks(polls.iterator(), settings.TIMELINE_CHUNK_SIZE):
+        _write_entries([owner.pk], polls_chunk)
+        newest = polls_chunk[-1][1]
+    if newest is None or (pulled_until is not None and newest <= pulled_until):
+        return
+    # the sync row is only written once a pull has written entries, and a concurrent pull never moves it back
+    if sync is None:
+        TimelineSync.objects.bulk_create([TimelineSync(owner=owner, pulled_until=newest)], ignore_conflicts=True)
+    TimelineSync.objects.filter(Q(pulled_until__isnull=True) | Q(pulled_until__lt=newest), owner=owner) \
+        .update(pulled_until=newest)
+
+
+def backfill_timeline(owner_id, followed_user_id):
+    polls = Poll.objects.filter(creator=followed_user_id).order_by('pk').values_list('pk', 'created_at')
+    for polls_chunk in _chunks(polls.iterator(), settings.TIMELINE_CHUNK_SIZE):
+        _write_entries([owner_id], polls_chunk)
+
+
+def prune_timeline(owner_id, followed_user_id):
+    TimelineEntry.objects.filter(owner=owner_id, poll__creator=followed_user_id).delete()
+
+
+def get_timeline_polls(owner):
+    pull_timeline(owner)
+    return Poll.objects.filter(timeline_entries__owner=owner) \
+        .annotate(timeline_created_at=F('timeline_entries__created_at')) \
+        .order_by('-timeline_created_at', '-id')
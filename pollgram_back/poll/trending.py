@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Poll, PollActivityRollup, TrendingPoll, VoteRollup
+
+
+def get_decay(bucket_start, now):
+    # an hour counts half as much every TRENDING_HALF_LIFE_HOURS from its end
+    age_hours = max((now - bucket_start).total_seconds() / 3600 - 1, 0)
+    return 0.5 ** (age_hours / settings.TRENDING_HALF_LIFE_HOURS)
+
+
+def get_trending_scores(now=None):
+    """
+    Return the dict of the poll id to its trending score: the weighted votes, comments and comment likes of each
+    of its hour buckets in the last TRENDING_WINDOW_HOURS, decayed by the age of the bucket. Only the polls of
+    public creators are scored.
+    """
+    now = now or timezone.now()
+    since = VoteRollup.get_bucket_start(now - timedelta(hours=settings.TRENDING_WINDOW_HOURS - 1),
+                                        VoteRollup.Bucket.HOUR)
+    scores = {}
+    votes = VoteRollup.objects.filter(bucket=VoteRollup.Bucket.HOUR, order=VoteRollup.POLL_TOTAL,
+                                      bucket_start__gte=since, poll__creator__is_public=True) \
+        .order_by().values_list('poll', 'bucket_start').annotate(count=Sum('count'))
+    for poll_id, bucket_start, count in votes:
+        scores[poll_id] = scores.get(poll_id, 0) + \
+            settings.TRENDING_VOTE_WEIGHT * count * get_decay(bucket_start, now)
+    activity = PollActivityRollup.objects.filter(bucket_start__gte=since, poll__creator__is_public=True) \
+        .values_list('poll', 'bucket_start', 'comments', 'likes')
+    for poll_id, bucket_start, comments, likes in activity:
+        scores[poll_id] = scores.get(poll_id, 0) + get_decay(bucket_start, now) * \
+            (settings.TRENDING_COMMENT_WEIGHT * comments + settings.TRENDING_LIKE_WEIGHT * likes)
+    return scores
+
+
+def refresh_trending_polls():
+    """
+    Replace the trending polls by the TRENDING_SIZE polls with the highest positive score and drop the activity
+    buckets which have left the window. Return the number of trending polls.
+    """
+    now = timezone.now()
+    scores = get_trending_scores(now)
+    ranked = sorted(((score, poll_id) for poll_id, score in scores.items() if score > 0),
+                    key=lambda item: (-item[0], item[1]))[:settings.TRENDING_SIZE]
+    with transaction.atomic():
+        TrendingPoll.objects.all().delete()
+        TrendingPoll.objects.bulk_create([TrendingPoll(poll_id=poll_id, rank=rank, score=score)
+                                          for rank, (score, poll_id) in enumerate(ranked, 1)], batch_size=500)
+    PollActivityRollup.objects.filter(bucket_start__lt=VoteRollup.get_bucket_start(
+        now - timedelta(hours=settings.TRENDING_WINDOW_HOURS), VoteRollup.Bucket.HOUR)).delete()
+    return len(ranked)
+
+
+def get_trending_polls(user):
+    """
+    Return the trending polls the user can see in the order of their rank. The creators who have become private
+    since the last refresh are left out too.
+    """
+    return Poll.objects.filter(trending__isnull=False, creator__is_public=True).visible_to(user) \
+        .annotate(trending_rank=F('trending__rank'))
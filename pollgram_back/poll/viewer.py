@@ -0,0 +1,54 @@
+from poll.models import Poll, Vote, PendingVote, CommentReaction
+
+
+class ViewerContext:
+    """
+    Voting and reaction facts of the requesting user about the polls and comments being serialized.
+    The votes of a whole page of polls and the reactions to a whole page of comments are fetched with one query,
+    visibility decisions and like statuses are made from them.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._voted_orders = {}
+        self._loaded_poll_ids = set()
+        self._like_statuses = {}
+        self._loaded_comment_ids = set()
+
+    def load(self, polls):
+        poll_ids = {poll.pk for poll in polls} - self._loaded_poll_ids
+        if not poll_ids:
+            return
+        # the pending votes are read too, so the voters see their votes before the worker applies them
+        votes = Vote.objects.filter(user=self.user, poll__in=poll_ids).values_list('poll', 'selected_orders').union(
+            PendingVote.objects.filter(user=self.user, poll__in=poll_ids).values_list('poll', 'selected_orders'))
+        for poll_id, selected_orders in votes:
+            self._voted_orders[poll_id] = Vote.decode_orders(selected_orders)
+        self._loaded_poll_ids |= poll_ids
+
+    def has_voted(self, poll):
+        self.load([poll])
+        return poll.pk in self._voted_orders
+
+    def get_voted_orders(self, poll):
+        self.load([poll])
+        return self._voted_orders.get(poll.pk, [])
+
+    def can_see_results(self, poll):
+        visibility_status = poll.visibility_status
+        return visibility_status == Poll.PollVisibilityStatus.VISIBLE or poll.creator_id == self.user.pk or (
+                visibility_status == Poll.PollVisibilityStatus.VISIBLE_AFTER_VOTE and self.has_voted(poll))
+
+    def load_comments(self, comments):
+        comment_ids = {comment.pk for comment in comments} - self._loaded_comment_ids
+        if not comment_ids:
+            return
+        reactions = CommentReaction.objects.filter(user=self.user, comment__in=comment_ids) \
+            .values_list('comment', 'value')
+        for comment_id, value in reactions:
+            self._like_statuses[comment_id] = 'liked' if value == CommentReaction.Value.LIKE else 'disliked'
+        self._loaded_comment_ids |= comment_ids
+
+    def get_like_status(self, comment):
+        self.load_comments([comment])
+        return self._like_statuses.get(comment.pk)
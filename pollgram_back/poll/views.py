@@ -1,23 +1,35 @@
-from datetime import timedelta
-
-from django.db.models import Count
+from django.db import transaction, IntegrityError
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
 from django.utils import timezone
+from django.utils.http import http_date, parse_etags
+from drf_spectacular.utils import extend_schema
 from rest_framework import status
 from rest_framework.generics import CreateAPIView, RetrieveDestroyAPIView, ListAPIView, ListCreateAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from socialmedia.models import User
-from .models import Poll, Vote, Image, File, Choice, Category, Comment
-from .paginations import VotersPagination, PollPagination, CommentPagination, ReplyPagination
+from socialmedia.filters import AliasOrderingFilter
+from socialmedia.loaders import get_loader
+from socialmedia.optimizer import optimize_queryset
+from .models import Poll, Vote, Image, File, Choice, Category, Comment, CommentReaction, VoteRollup, IdempotencyKey, \
+    PendingVote, CoSelection, RankedBallot, CategoryVoteRollup
+from .paginations import VotersPagination, PollPagination, CommentPagination, ReplyPagination, TrendingPagination, \
+    SearchPagination
 from .permissions import IsCreatorOrReadOnly, IsCreatorOrPublicPoll, CommentFilterPermission, IsFollowerOrPublic, \
     IsFollowerOrPublicForGetAPoll, IsFollowerOrPublicForGetAComment, IsSelf
 from .serializers import PollCreateSerializer, ImageSerializer, FileSerializer, \
-    VoteResponseSerializer, VoterUserSerializer, PollRetrieveSerializer, CategorySerializer, CommentSerializer, \
-    ChoiceSerializer
+    VoteResponseSerializer, VoterSerializer, PollRetrieveSerializer, CategorySerializer, CommentSerializer, \
+    ChoiceSerializer, ReactionSerializer, BarChartQuerySerializer, ExportQuerySerializer, \
+    SearchQuerySerializer
+from .categories import get_category_tree, get_category_stats_tree
+from .exports import get_export_records, stream_csv, stream_ndjson
+from .ranking import get_ranked_results, update_ranked_results
+from .results import apply_poll_results, invalidate_poll_results
+from .search import search_polls
+from .trending import get_trending_polls
 
 
 class PollRetrieveDestroyAPIView(RetrieveDestroyAPIView):
@@ -25,7 +37,13 @@ class PollRetrieveDestroyAPIView(RetrieveDestroyAPIView):
     permission_classes = [IsAuthenticated, IsCreatorOrReadOnly, IsFollowerOrPublicForGetAPoll]
 
     def get_queryset(self):
-        return Poll.objects.exclude(creator__blocked_users=self.request.user)
+        return optimize_queryset(Poll.objects.visible_to(self.request.user), self.get_serializer_class())
+
+    def get_object(self):
+        poll = super(PollRetrieveDestroyAPIView, self).get_object()
+        if self.request.method == 'GET':
+            apply_poll_results(poll, poll.choices.all())
+        return poll
 
 
 class PollCreateAPIView(CreateAPIView):
@@ -34,18 +52,52 @@ class PollCreateAPIView(CreateAPIView):
     permission_classes = [IsAuthenticated]
 
 
+class PollBulkCreateAPIView(CreateAPIView):
+    """
+    Create a list of polls at once. The polls are created only if all of them are valid, otherwise the errors
+    are reported in a list aligned with the polls of the request.
+    """
+    model = Poll
+    serializer_class = PollCreateSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs['many'] = True
+        return super(PollBulkCreateAPIView, self).get_serializer(*args, **kwargs)
+
+    def perform_create(self, serializer):
+        polls = serializer.save()
+        prefetch_related_objects(polls, 'choices')
+
+
 class VoteAPIView(APIView):
     permission_classes = [IsAuthenticated, IsFollowerOrPublic]
 
     def post(self, request, poll_pk):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return self.submit_vote(request, poll_pk)
+        idempotency_key, response = IdempotencyKey.objects.run_once(
+            request, key, lambda: self.submit_vote(request, poll_pk))
+        if response is not None:
+            return response
+        if not idempotency_key.matches(request):
+            return Response({
+                "status": "idempotency key is already used for another request"
+            }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response(idempotency_key.response, status=idempotency_key.status_code,
+                        headers={'Idempotent-Replayed': 'true'})
+
+    def submit_vote(self, request, poll_pk):
         user = request.user
 
-        poll = get_object_or_404(Poll, ~Q(creator__blocked_users=request.user), pk=poll_pk)
-        if poll.choices.filter(votes__user=user).exists():
+        poll = get_loader(request).get_visible_poll(poll_pk)
+        if user.is_already_voted(poll):
             return Response({
                 "status": "already voted"
             }, status=status.HTTP_409_CONFLICT)
-        choices = poll.choices.filter(order__in=request.data.get('selected', []))
+        selected = request.data.get('selected', [])
+        choices = poll.choices.filter(order__in=selected)
         if not choices:
             return Response({
                 "selected": "this field is required"
@@ -55,20 +107,80 @@ class VoteAPIView(APIView):
             return Response({
                 "status": "invalid number of votes"
             }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
-        created_vote = Vote.objects.create(user=user)
-        created_vote.selected.set(choices)
+        orders = [choice.order for choice in choices]
+        ranking = None
+        if poll.is_ranked:
+            # the choices of a ranked poll are selected in the order of preference
+            if len({str(order) for order in selected}) != len(selected):
+                return Response({
+                    "selected": "a choice can not be ranked twice"
+                }, status=status.HTTP_400_BAD_REQUEST)
+            orders_by_key = {str(order): order for order in orders}
+            ranking = Vote.encode_ranking([orders_by_key[str(order)] for order in selected
+                                           if str(order) in orders_by_key])
+        if poll.uses_vote_buffer():
+            return self.buffer_vote(user, poll, orders, ranking)
+        try:
+            with transaction.atomic():
+                created_vote = Vote.objects.create(user=user, poll=poll, selected_orders=Vote.encode_orders(orders),
+                                                   ranking=ranking)
+                shard = poll.pick_counter_shard()
+                poll.update_vote_counters(orders, 1, shard)
+                VoteRollup.objects.record(created_vote, 1, shard)
+                if poll.is_multi_choice():
+                    CoSelection.objects.record(created_vote, 1, shard)
+                if poll.is_ranked:
+                    RankedBallot.objects.record(created_vote, 1, shard)
+                    update_ranked_results(poll, {ranking: 1})
+                CategoryVoteRollup.objects.record_many([created_vote], {poll.pk: poll.category_id}, 1, shard)
+                invalidate_poll_results(poll)
+        except IntegrityError:
+            # a concurrent request of the same user has voted in the meantime
+            return Response({
+                "status": "already voted"
+            }, status=status.HTTP_409_CONFLICT)
         return Response(VoteResponseSerializer(created_vote).data, status=status.HTTP_201_CREATED)
 
+    def buffer_vote(self, user, poll, orders, ranking):
+        # acknowledged once queued, the applypendingvotes worker inserts the vote and updates the counters
+        try:
+            with transaction.atomic():
+                pending_vote = PendingVote.objects.create(user=user, poll=poll,
+                                                          selected_orders=Vote.encode_orders(orders), ranking=ranking)
+        except IntegrityError:
+            return Response({
+                "status": "already voted"
+            }, status=status.HTTP_409_CONFLICT)
+        return Response(VoteResponseSerializer(pending_vote).data, status=status.HTTP_202_ACCEPTED)
+
     def delete(self, request, poll_pk):
         user = request.user
-        poll = get_object_or_404(Poll, ~Q(creator__blocked_users=request.user), pk=poll_pk)
+        poll = get_loader(request).get_visible_poll(poll_pk)
         if poll.is_vote_retractable:
-            if not poll.choices.filter(votes__user=user).exists():
+            # waits for a worker applying the pending vote, the applied vote is retracted then
+            deleted_pending_count, _ = PendingVote.objects.filter(user=user, poll=poll).delete()
+            if deleted_pending_count:
+                return Response({
+                    "status": "vote retracted"
+                }, status=status.HTTP_204_NO_CONTENT)
+            vote = Vote.objects.filter(user=user, poll=poll).first()
+            if vote is None:
                 return Response({
                     "status": "not voted yet"
                 }, status=status.HTTP_409_CONFLICT)
-            choices = poll.choices.all()
-            Vote.objects.filter(user=user, selected__in=choices).delete()
+            with transaction.atomic():
+                deleted_count, _ = Vote.objects.filter(pk=vote.pk).delete()
+                if deleted_count:
+                    shard = poll.pick_counter_shard()
+                    poll.update_vote_counters(vote.get_selected_orders(), -1, shard)
+                    VoteRollup.objects.record(vote, -1, shard)
+                    if poll.is_multi_choice():
+                        CoSelection.objects.record(vote, -1, shard)
+                    if vote.ranking is not None:
+                        RankedBallot.objects.record(vote, -1, shard)
+                        update_ranked_results(poll, {vote.ranking: -1})
+                    CategoryVoteRollup.objects.record_many([vote], {poll.pk: poll.category_id}, -1, shard)
+                    invalidate_poll_results(poll)
             return Response({
                 "status": "vote retracted"
             }, status=status.HTTP_204_NO_CONTENT)
@@ -81,15 +193,14 @@ class VoteAPIView(APIView):
 class VotersListAPIView(ListAPIView):
     permission_classes = [IsAuthenticated, IsCreatorOrPublicPoll, IsFollowerOrPublic]
     pagination_class = VotersPagination
-    serializer_class = VoterUserSerializer
+    serializer_class = VoterSerializer
 
     def get_queryset(self):
-        poll_id = self.kwargs['poll_pk']
-        order = self.kwargs['order']
-        choice = get_object_or_404(Choice, ~Q(poll__creator__blocked_users=self.request.user), poll=poll_id,
-                                   order=order)
-        user_ids = choice.votes.all().values_list('user', flat=True)
-        return User.objects.filter(id__in=user_ids).exclude(blocked_users=self.request.user)
+        poll = get_loader(self.request).get_visible_poll(self.kwargs['poll_pk'])
+        choice = get_object_or_404(Choice, poll=poll, order=self.kwargs['order'])
+        # newest votes first, so a page is one range of the vote poll index whatever the voter count is
+        return choice.get_votes().visible_to(self.request.user).select_related('user') \
+            .only('poll', 'created_at', 'user__first_name', 'user__last_name', 'user__avatar')
 
 
 class ImageCreateAPIView(CreateAPIView):
@@ -109,8 +220,28 @@ class CategoryListAPIView(ListAPIView):
     serializer_class = CategorySerializer
 
     def get_queryset(self):
-        main_categories = Category.objects.filter(parent=None)
-        return main_categories
+        return Category.objects.get_tree()
+
+    def list(self, request, *args, **kwargs):
+        data, etag = get_category_tree(self.get_serializer_class())
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        # If-None-Match is compared weakly, a client may send the etag back marked as weak
+        etags = [tag[2:] if tag.startswith('W/') else tag
+                 for tag in parse_etags(request.headers.get('If-None-Match', ''))]
+        if '*' in etags or etag in etags:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(data, headers=headers)
+
+
+class CategoryStatsAPIView(APIView):
+    """
+    Show the category tree with the number of polls, the number of votes in the last CATEGORY_RECENT_VOTES_HOURS
+    and the ids of the polls with the most votes lately of each category and its sub categories.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(get_category_stats_tree(request.user))
 
 
 class CategoryPollListAPIView(ListAPIView):
@@ -121,17 +252,37 @@ class CategoryPollListAPIView(ListAPIView):
     def get_queryset(self):
         category_id = self.kwargs['cat_pk']
         category = get_object_or_404(Category, id=category_id)
-        if category.parent is None:
-            sub_categories = category.get_sub_categories().prefetch_related('polls')
-            polls = Poll.objects.none()
-            for sub_cat in sub_categories:
-                polls = polls | sub_cat.polls.filter(creator__is_public=True).exclude(
-                    creator__blocked_users=self.request.user)
-            return polls | category.polls.filter(creator__is_public=True).exclude(
-                creator__blocked_users=self.request.user)
-        else:
-            return Poll.objects.filter(category=category, creator__is_public=True).exclude(
-                creator__blocked_users=self.request.user)
+        # the polls of the category and of its sub categories at any depth, joined over the closure table
+        polls = Poll.objects.filter(category__ancestor_links__ancestor=category, creator__is_public=True) \
+            .visible_to(self.request.user)
+        return optimize_queryset(polls, self.get_serializer_class())
+
+
+class TrendingPollListAPIView(ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = PollRetrieveSerializer
+    pagination_class = TrendingPagination
+
+    def get_queryset(self):
+        # materialized by the refreshtrendingpolls command, a page is one range of the rank index
+        return optimize_queryset(get_trending_polls(self.request.user), self.get_serializer_class())
+
+
+class PollSearchAPIView(ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = PollRetrieveSerializer
+    pagination_class = SearchPagination
+
+    @extend_schema(parameters=[SearchQuerySerializer])
+    def get(self, request, *args, **kwargs):
+        return super(PollSearchAPIView, self).get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        query_serializer = SearchQuerySerializer(data=self.request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        query = query_serializer.validated_data
+        polls = search_polls(query['q'], self.request.user, query.get('category'))
+        return optimize_queryset(polls, self.get_serializer_class())
 
 
 class CommentRetrieveDestroyAPIView(RetrieveDestroyAPIView):
@@ -140,8 +291,17 @@ class CommentRetrieveDestroyAPIView(RetrieveDestroyAPIView):
     lookup_url_kwarg = "comment_pk"
 
     def get_queryset(self):
-        poll = get_object_or_404(Poll, ~Q(creator__blocked_users=self.request.user), pk=self.kwargs.get('poll_pk'))
-        return poll.comments.exclude(creator__blocked_users=self.request.user)
+        poll = get_loader(self.request).get_visible_poll(self.kwargs.get('poll_pk'))
+        return poll.comments.visible_to(self.request.user)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # the comment, its replies and their likes are taken out of the hours they were counted in, the
+            # trending scores of those hours drop with them
+            Comment.objects.filter(pk=instance.pk).release_activity()
+            instance.delete()
+            if instance.parent_id is not None:
+                instance.parent.update_replies_counter(-1)
 
 
 class CommentListCreateAPIView(ListCreateAPIView):
@@ -149,26 +309,27 @@ class CommentListCreateAPIView(ListCreateAPIView):
     serializer_class = CommentSerializer
     pagination_class = CommentPagination
     permission_classes = [IsAuthenticated, CommentFilterPermission, IsFollowerOrPublic]
+    filter_backends = [AliasOrderingFilter]
     ordering_fields = ['likes', 'dislikes']
+    ordering_aliases = {'likes': 'likes_count', 'dislikes': 'dislikes_count'}
 
     def get_serializer_context(self):
         context = super(CommentListCreateAPIView, self).get_serializer_context()
-        context['poll'] = get_object_or_404(Poll, ~Q(creator__blocked_users=self.request.user),
-                                            pk=self.kwargs.get('poll_pk'))
+        context['poll'] = get_loader(self.request).get_visible_poll(self.kwargs.get('poll_pk'))
         return context
 
     def get_queryset(self):
         filter_order = self.request.query_params.get('order')
 
         if filter_order:
-            poll = get_object_or_404(Poll, ~Q(creator__blocked_users=self.request.user), id=self.kwargs['poll_pk'])
+            poll = get_loader(self.request).get_visible_poll(self.kwargs['poll_pk'])
             choice = get_object_or_404(Choice, poll=poll, order=filter_order)
-            users = choice.votes.all().values_list('user', flat=True)
-            return Comment.objects.filter(creator__in=users, poll=poll).exclude(
-                creator__blocked_users=self.request.user)
+            users = choice.get_votes().values_list('user', flat=True)
+            comments = Comment.objects.filter(creator__in=users, poll=poll).visible_to(self.request.user)
         else:
-            poll = get_object_or_404(Poll, ~Q(creator__blocked_users=self.request.user), id=self.kwargs['poll_pk'])
-            return poll.comments.filter(parent=None).exclude(creator__blocked_users=self.request.user)
+            poll = get_loader(self.request).get_visible_poll(self.kwargs['poll_pk'])
+            comments = poll.comments.filter(parent=None).visible_to(self.request.user)
+        return optimize_queryset(comments, self.get_serializer_class())
 
 
 class ReplyListAPIView(ListAPIView):
@@ -177,39 +338,47 @@ class ReplyListAPIView(ListAPIView):
     permission_classes = [IsAuthenticated, IsFollowerOrPublic]
 
     def get_queryset(self):
-        comment = get_object_or_404(Comment, ~Q(creator__blocked_users=self.request.user),
-                                    ~Q(poll__creator__blocked_users=self.request.user),
-                                    id=self.kwargs['comment_pk'])
-        return comment.replies.all().exclude(creator__blocked_users=self.request.user)
+        comment = get_loader(self.request).get_visible_comment(self.kwargs['comment_pk'])
+        return optimize_queryset(comment.replies.visible_to(self.request.user), self.get_serializer_class())
+
+
+class ReactionAPIView(APIView):
+    """
+    Set the reaction of the user to a comment: "like", "dislike" or null to clear it.
+    The counters of the comment after the change are returned.
+    """
+    permission_classes = [IsAuthenticated, IsFollowerOrPublic]
+
+    @extend_schema(request=ReactionSerializer, responses=ReactionSerializer)
+    def put(self, request, poll_pk, comment_pk):
+        comment = get_loader(request).get_visible_comment(comment_pk)
+        serializer = ReactionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        comment.set_reaction(request.user, serializer.validated_data['reaction'])
+        comment.refresh_from_db(fields=['likes_count', 'dislikes_count'])
+        return Response(ReactionSerializer({
+            'reaction': serializer.validated_data['reaction'],
+            'likes_count': comment.likes_count,
+            'dislikes_count': comment.dislikes_count,
+        }).data)
 
 
 class LikeAPIView(APIView):
     permission_classes = [IsAuthenticated, IsFollowerOrPublic]
 
     def post(self, request, poll_pk, comment_pk):
-        user = request.user
-        comment = get_object_or_404(Comment, ~Q(creator__blocked_users=request.user),
-                                    ~Q(poll__creator__blocked_users=request.user),
-                                    pk=comment_pk)
-        if comment.likes.filter(pk=user.pk).exists():
+        comment = get_loader(request).get_visible_comment(comment_pk)
+        if comment.set_reaction(request.user, CommentReaction.Value.LIKE) == CommentReaction.Value.LIKE:
             return Response({"msg": "already liked"}, status=status.HTTP_409_CONFLICT)
-        if comment.dislikes.filter(pk=user.pk).exists():
-            comment.dislikes.remove(user)
-
-        comment.likes.add(user)
 
         return Response({"msg": "liked"}, status=status.HTTP_201_CREATED)
 
     def delete(self, request, poll_pk, comment_pk):
-        user = request.user
-        comment = get_object_or_404(Comment, ~Q(creator__blocked_users=request.user),
-                                    ~Q(poll__creator__blocked_users=request.user),
-                                    pk=comment_pk)
-        if not comment.likes.filter(pk=user.pk).exists():
+        comment = get_loader(request).get_visible_comment(comment_pk)
+        replaced_values = [CommentReaction.Value.LIKE]
+        if comment.set_reaction(request.user, None, replaced_values) != CommentReaction.Value.LIKE:
             return Response({"msg": "not liked"}, status=status.HTTP_409_CONFLICT)
 
-        comment.likes.remove(user)
-
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -217,29 +386,18 @@ class DislikeAPIView(APIView):
     permission_classes = [IsAuthenticated, IsFollowerOrPublic]
 
     def post(self, request, poll_pk, comment_pk):
-        user = request.user
-        comment = get_object_or_404(Comment, ~Q(creator__blocked_users=request.user),
-                                    ~Q(poll__creator__blocked_users=request.user),
-                                    pk=comment_pk)
-        if comment.dislikes.filter(pk=user.pk).exists():
+        comment = get_loader(request).get_visible_comment(comment_pk)
+        if comment.set_reaction(request.user, CommentReaction.Value.DISLIKE) == CommentReaction.Value.DISLIKE:
             return Response({"msg": "already disliked"}, status=status.HTTP_409_CONFLICT)
-        if comment.likes.filter(pk=user.pk).exists():
-            comment.likes.remove(user)
-
-        comment.dislikes.add(user)
 
         return Response({"msg": "disliked"}, status=status.HTTP_201_CREATED)
 
     def delete(self, request, poll_pk, comment_pk):
-        user = request.user
-        comment = get_object_or_404(Comment, ~Q(creator__blocked_users=request.user),
-                                    ~Q(poll__creator__blocked_users=request.user),
-                                    pk=comment_pk)
-        if not comment.dislikes.filter(pk=user.pk).exists():
+        comment = get_loader(request).get_visible_comment(comment_pk)
+        replaced_values = [CommentReaction.Value.DISLIKE]
+        if comment.set_reaction(request.user, None, replaced_values) != CommentReaction.Value.DISLIKE:
             return Response({"msg": "not disliked"}, status=status.HTTP_409_CONFLICT)
 
-        comment.dislikes.remove(user)
-
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -248,28 +406,106 @@ class CircularChartAPIView(ListAPIView):
     permission_classes = [IsAuthenticated, IsSelf]
 
     def get_queryset(self):
-        poll = get_object_or_404(Poll, pk=self.kwargs.get('poll_pk'))
-        return poll.choices
+        poll = get_loader(self.request).get_poll(self.kwargs.get('poll_pk'))
+        choices = list(poll.choices.all())
+        self.results = apply_poll_results(poll, choices)
+        return choices
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(CircularChartAPIView, self).finalize_response(request, response, *args, **kwargs)
+        if hasattr(self, 'results'):
+            response['Last-Modified'] = http_date(self.results['updated_at'].timestamp())
+        return response
+
+
+class CoSelectionChartAPIView(APIView):
+    """
+    Show for each choice of a multi-choice poll how many voters have selected it and how many of them have also
+    selected each other choice, with the percentage of them.
+    """
+    permission_classes = [IsAuthenticated, IsSelf]
+
+    def get(self, request, poll_pk):
+        poll = get_loader(request).get_poll(poll_pk)
+        if not poll.is_multi_choice():
+            return Response({
+                "status": "this poll is not multi choice"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        orders = list(poll.choices.order_by('order').values_list('order', flat=True))
+        matrix = CoSelection.objects.get_matrix(poll)
+        data = []
+        for order in orders:
+            count = matrix.get((order, order), 0)
+            data.append({
+                "order": order,
+                "count": count,
+                "co_selected": [{
+                    "order": other_order,
+                    "count": matrix.get((order, other_order), 0),
+                    "percent": round(100 * matrix.get((order, other_order), 0) / count, 2) if count else 0,
+                } for other_order in orders if other_order != order],
+            })
+        return Response(data)
+
+
+class RankedChartAPIView(APIView):
+    """
+    Show the instant-runoff rounds of a ranked poll: the ballots of each choice left in the round, the ballots
+    without a choice left and the choice eliminated, and the winner.
+    """
+    permission_classes = [IsAuthenticated, IsSelf]
+
+    def get(self, request, poll_pk):
+        poll = get_loader(request).get_poll(poll_pk)
+        if not poll.is_ranked:
+            return Response({
+                "status": "this poll is not ranked"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        results = get_ranked_results(poll)
+        return Response({
+            "winner": results['winner'],
+            "ballots": results['ballots'],
+            "rounds": [{
+                "choices": results_round['counts'],
+                "exhausted": results_round['exhausted'],
+                "eliminated": results_round['eliminated'],
+            } for results_round in results['rounds']],
+        })
 
 
 class BarChartAPIView(APIView):
     permission_classes = [IsAuthenticated, IsSelf]
 
+    @extend_schema(parameters=[BarChartQuerySerializer])
+    def get(self, request, poll_pk):
+        query_serializer = BarChartQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        query = query_serializer.validated_data
+        series = VoteRollup.objects.get_series(poll_pk, query['from'], query['to'], query['bucket'])
+        return Response([{
+            # hour buckets are shown by their local start time, day and week buckets by their local start date
+            "created_at": timezone.localtime(item['bucket_start']) if query['bucket'] == VoteRollup.Bucket.HOUR
+            else timezone.localdate(item['bucket_start']),
+            "count": item['count'],
+            "choices": item['choices'],
+        } for item in series])
+
+
+class PollExportAPIView(APIView):
+    permission_classes = [IsAuthenticated, IsSelf]
+    content_types = {
+        'csv': 'text/csv',
+        'ndjson': 'application/x-ndjson',
+    }
+
+    @extend_schema(parameters=[ExportQuerySerializer])
     def get(self, request, poll_pk):
-        last_nine_days_date = timezone.now().date() - timedelta(days=9)
-        results_qs = Vote.objects.filter(selected__poll__pk=poll_pk,
-                                         created_at__gte=last_nine_days_date).values('created_at').annotate(
-            count=Count('created_at'))
-        today = timezone.now().date()
-        results_list = list(results_qs)
-        available_dates = [item['created_at'] for item in results_list]
-        for i in range(10):
-            this_date = today - timedelta(days=i)
-            if this_date not in available_dates:
-                this_date_count_dict = {
-                    "created_at": this_date,
-                    "count": 0
-                }
-                results_list.append(this_date_count_dict)
-        results_list.sort(key=lambda x: x['created_at'])
-        return Response(results_list)
+        query_serializer = ExportQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        output = query_serializer.validated_data['output']
+        poll = get_loader(request).get_poll(poll_pk)
+        records = get_export_records(poll, request.user)
+        stream = stream_csv(records) if output == 'csv' else stream_ndjson(records)
+        response = StreamingHttpResponse(stream, content_type=self.content_types[output])
+        response['Content-Disposition'] = 'attachment; filename="poll-{}.{}"'.format(poll.pk, output)
+        return response
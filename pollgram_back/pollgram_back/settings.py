@@ -101,7 +101,10 @@ WSGI_APPLICATION = 'pollgram_back.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
-if IS_DOCKERIZED and 'test' not in sys.argv:
+# the tests run on sqlite, unless TEST_ON_POSTGRES is set like in the postgres job of the CI
+TEST_ON_POSTGRES = os.environ.get("TEST_ON_POSTGRES", "0") == "1"
+
+if IS_DOCKERIZED and 'test' not in sys.argv or TEST_ON_POSTGRES:
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.postgresql",
@@ -192,6 +195,74 @@ DEFAULT_SUPERUSER = {
     "EMAIL": os.environ.get("DJANGO_SUPERUSER_EMAIL", "admin@local.dev"),
 }
 
+# polls of users with more followers are pulled by the followers at read time instead of being fanned out
+TIMELINE_FANOUT_MAX_FOLLOWERS = int(os.environ.get("TIMELINE_FANOUT_MAX_FOLLOWERS", "5000"))
+TIMELINE_CHUNK_SIZE = int(os.environ.get("TIMELINE_CHUNK_SIZE", "1000"))
+# seconds before the last pulled poll read again by the next pull, for the polls which committed late
+TIMELINE_PULL_OVERLAP = int(os.environ.get("TIMELINE_PULL_OVERLAP", "300"))
+
+# paginated lists with more estimated rows report the planner estimate instead of an exact count
+ESTIMATED_COUNT_THRESHOLD = int(os.environ.get("ESTIMATED_COUNT_THRESHOLD", "10000"))
+
+# the poll result snapshots are invalidated through the cache, so every worker must share the backend,
+# the containers use the memcached service and check --deploy fails on a cache of each process
+if IS_DOCKERIZED:
+    DEFAULT_CACHE_BACKEND = "django.core.cache.backends.memcached.MemcachedCache"
+    DEFAULT_CACHE_LOCATION = "memcached:11211"
+else:
+    DEFAULT_CACHE_BACKEND = "django.core.cache.backends.locmem.LocMemCache"
+    DEFAULT_CACHE_LOCATION = ""
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get("DJANGO_CACHE_BACKEND", DEFAULT_CACHE_BACKEND),
+        'LOCATION': os.environ.get("DJANGO_CACHE_LOCATION", DEFAULT_CACHE_LOCATION),
+    }
+}
+POLL_RESULTS_CACHE_TIMEOUT = int(os.environ.get("POLL_RESULTS_CACHE_TIMEOUT", "3600"))
+
+# rows fetched per round trip of the server-side cursors of the poll exports
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "2000"))
+
+# seconds the outcome of a vote submission sent with an Idempotency-Key header is replayed for
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", "86400"))
+
+# polls accepted by one bulk create request and polls or choices inserted per statement
+POLL_BULK_CREATE_MAX_SIZE = int(os.environ.get("POLL_BULK_CREATE_MAX_SIZE", "500"))
+POLL_BULK_CREATE_BATCH_SIZE = int(os.environ.get("POLL_BULK_CREATE_BATCH_SIZE", "100"))
+
+# queue the votes of all the polls, not only of those with buffers_votes, for the applypendingvotes worker
+VOTE_BUFFER_ALL_POLLS = os.environ.get("VOTE_BUFFER_ALL_POLLS", "0") == "1"
+VOTE_BUFFER_BATCH_SIZE = int(os.environ.get("VOTE_BUFFER_BATCH_SIZE", "500"))
+
+# number of counter shard rows per choice of the polls without counter_shards, 1 keeps the counters on the rows
+VOTE_COUNTER_SHARDS = int(os.environ.get("VOTE_COUNTER_SHARDS", "1"))
+VOTE_COUNTER_SHARDS_CACHE_TIMEOUT = int(os.environ.get("VOTE_COUNTER_SHARDS_CACHE_TIMEOUT", "5"))
+# shardvotecounters --hot raises the polls with this many votes in the current hour to HOT_POLL_COUNTER_SHARDS
+HOT_POLL_VOTES_PER_HOUR = int(os.environ.get("HOT_POLL_VOTES_PER_HOUR", "1000"))
+HOT_POLL_COUNTER_SHARDS = int(os.environ.get("HOT_POLL_COUNTER_SHARDS", "16"))
+
+# the instant-runoff results of the ranked polls are cached and updated in place by the votes
+RANKED_RESULTS_CACHE_TIMEOUT = int(os.environ.get("RANKED_RESULTS_CACHE_TIMEOUT", "3600"))
+RANKED_RESULTS_LOCK_TIMEOUT = int(os.environ.get("RANKED_RESULTS_LOCK_TIMEOUT", "5"))
+
+# hours of votes counted as the recent votes of a category, and of the velocity its top polls are ranked by
+CATEGORY_RECENT_VOTES_HOURS = int(os.environ.get("CATEGORY_RECENT_VOTES_HOURS", "24"))
+CATEGORY_TOP_POLLS_HOURS = int(os.environ.get("CATEGORY_TOP_POLLS_HOURS", "6"))
+CATEGORY_TOP_POLLS = int(os.environ.get("CATEGORY_TOP_POLLS", "10"))
+
+# the trending score sums the weighted votes, comments and comment likes of the last TRENDING_WINDOW_HOURS,
+# each hour counting half as much every TRENDING_HALF_LIFE_HOURS, the TRENDING_SIZE best polls are listed
+TRENDING_WINDOW_HOURS = int(os.environ.get("TRENDING_WINDOW_HOURS", "48"))
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get("TRENDING_HALF_LIFE_HOURS", "6"))
+TRENDING_VOTE_WEIGHT = float(os.environ.get("TRENDING_VOTE_WEIGHT", "1"))
+TRENDING_COMMENT_WEIGHT = float(os.environ.get("TRENDING_COMMENT_WEIGHT", "3"))
+TRENDING_LIKE_WEIGHT = float(os.environ.get("TRENDING_LIKE_WEIGHT", "0.5"))
+TRENDING_SIZE = int(os.environ.get("TRENDING_SIZE", "500"))
+
+# the poll search score lifts the text relevance by up to SEARCH_POPULARITY_WEIGHT times as the votes grow,
+# a poll with SEARCH_POPULARITY_HALF_VOTES votes gets half of the lift
+SEARCH_POPULARITY_WEIGHT = float(os.environ.get("SEARCH_POPULARITY_WEIGHT", "1"))
+SEARCH_POPULARITY_HALF_VOTES = int(os.environ.get("SEARCH_POPULARITY_HALF_VOTES", "100"))
 
 SITE_DOMAIN_NAME = os.environ.get("SITE_DOMAIN_NAME", "localhost.dev")
 SITE_DISPLAY_NAME = os.environ.get("SITE_DISPLAY_NAME", "localhost")
@@ -0,0 +1,16 @@
+from rest_framework.filters import OrderingFilter
+
+
+class AliasOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter which maps the public ordering names of `view.ordering_aliases` to model fields,
+    e.g. `?ordering=-likes` to the stored `likes_count` counter.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super(AliasOrderingFilter, self).get_ordering(request, queryset, view)
+        aliases = getattr(view, 'ordering_aliases', {})
+        if not ordering or not aliases:
+            return ordering
+        return [('-' if term.startswith('-') else '') + aliases.get(term.lstrip('-'), term.lstrip('-'))
+                for term in ordering]
@@ -0,0 +1,81 @@
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+
+class RequestLoader:
+    """
+    Identity map of the polls, comments and users one request works on. The permission classes and the view of
+    the request share it, so each object is fetched once with its creator and each follow check is made once.
+    get_poll, get_comment and get_user ignore blocks, the get_visible_* variants raise Http404 for the content of
+    the users who have blocked the requesting user.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._polls = {}
+        self._comments = {}
+        self._users = {}
+        self._is_following = {}
+
+    def get_poll(self, pk):
+        pk = int(pk)
+        if pk not in self._polls:
+            Poll = apps.get_model('poll', 'Poll')
+            poll = get_object_or_404(Poll.objects.select_related('creator'), pk=pk)
+            self._polls[pk] = poll
+            self._users.setdefault(poll.creator_id, poll.creator)
+        return self._polls[pk]
+
+    def get_comment(self, pk):
+        pk = int(pk)
+        if pk not in self._comments:
+            Comment = apps.get_model('poll', 'Comment')
+            comment = get_object_or_404(Comment.objects.select_related('creator', 'poll__creator'), pk=pk)
+            self._comments[pk] = comment
+            self._polls.setdefault(comment.poll_id, comment.poll)
+            self._users.setdefault(comment.creator_id, comment.creator)
+            self._users.setdefault(comment.poll.creator_id, comment.poll.creator)
+        return self._comments[pk]
+
+    def get_user(self, pk):
+        pk = int(pk)
+        if pk not in self._users:
+            self._users[pk] = get_object_or_404(get_user_model(), pk=pk)
+        return self._users[pk]
+
+    def get_visible_poll(self, pk):
+        poll = self.get_poll(pk)
+        if poll.creator_id in self.user.blocker_ids:
+            raise Http404
+        return poll
+
+    def get_visible_comment(self, pk):
+        comment = self.get_comment(pk)
+        if comment.creator_id in self.user.blocker_ids or comment.poll.creator_id in self.user.blocker_ids:
+            raise Http404
+        return comment
+
+    def get_visible_user(self, pk):
+        user = self.get_user(pk)
+        if user.pk in self.user.blocker_ids:
+            raise Http404
+        return user
+
+    def is_following(self, user):
+        """Whether the requesting user follows the user and the follow request is accepted."""
+        if user.pk not in self._is_following:
+            FollowRelationship = apps.get_model('socialmedia', 'FollowRelationship')
+            self._is_following[user.pk] = FollowRelationship.objects.filter(
+                from_user=self.user, to_user=user, pending=False).exists()
+        return self._is_following[user.pk]
+
+    def can_see_content_of(self, user):
+        return user.pk == self.user.pk or user.is_public or self.is_following(user)
+
+
+def get_loader(request):
+    if not hasattr(request, 'loader'):
+        request.loader = RequestLoader(request.user)
+    return request.loader
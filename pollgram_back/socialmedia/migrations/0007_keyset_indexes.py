@@ -0,0 +1,21 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialmedia', '0006_user_blocked_users'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='followrelationship',
+            index=models.Index(fields=['to_user', 'pending', 'from_user'], name='follow_to_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='followrelationship',
+            index=models.Index(fields=['from_user', 'pending', 'to_user'], name='follow_from_user_idx'),
+        ),
+    ]
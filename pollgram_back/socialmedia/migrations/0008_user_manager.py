@@ -0,0 +1,20 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:32
+
+from django.db import migrations
+import socialmedia.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialmedia', '0007_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', socialmedia.models.UserManager()),
+            ],
+        ),
+    ]
@@ -1,7 +1,20 @@
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from django.utils.functional import cached_property
+
+
+class UserQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Exclude the users who have blocked the user."""
+        if not user.blocker_ids:
+            return self
+        return self.exclude(pk__in=user.blocker_ids)
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    pass
 
 
 class User(AbstractUser):
@@ -29,6 +42,16 @@ class User(AbstractUser):
                                         through='FollowRelationship')
     blocked_users = models.ManyToManyField("self", related_name='blocker_users', symmetrical=False)
 
+    objects = UserManager()
+
+    @cached_property
+    def blocker_ids(self):
+        # computed once per instance, for request.user once per request
+        return set(self.blocker_users.values_list('pk', flat=True))
+
+    def clear_blocker_ids(self):
+        self.__dict__.pop('blocker_ids', None)
+
     def get_followers(self):
         # sort results have added to have a stable response
         return self.followers.filter(follows_relationships__pending=False)
@@ -53,10 +76,13 @@ class User(AbstractUser):
         visibility_status = poll.visibility_status
         return visibility_status == 'VI' or (
                 visibility_status == 'VA' and
-                self.is_already_voted(poll)) or poll.creator == self
+                self.is_already_voted(poll)) or poll.creator_id == self.pk
 
     def is_already_voted(self, poll):
-        return poll.choices.filter(votes__user=self).exists()
+        if self.votes.filter(poll=poll).exists():
+            return True
+        # the votes on a poll which buffers them are pending until the worker applies them
+        return poll.uses_vote_buffer() and self.pending_votes.filter(poll=poll).exists()
 
     class Meta:
         verbose_name = "User"
@@ -76,6 +102,10 @@ class FollowRelationship(models.Model):
     class Meta:
         verbose_name = "FollowRelationship"
         unique_together = ('from_user', 'to_user')
+        indexes = [
+            models.Index(fields=['to_user', 'pending', 'from_user'], name='follow_to_user_idx'),
+            models.Index(fields=['from_user', 'pending', 'to_user'], name='follow_from_user_idx'),
+        ]
 
     def __str__(self):
         # ask for needed test?
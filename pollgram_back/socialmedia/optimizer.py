@@ -0,0 +1,65 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def _get_plan(model, serializer, prefix=''):
+    """
+    Walk the fields of the serializer and collect the columns it reads, the forward relations it serializes
+    (joined with select_related) and the to-many relations it serializes (prefetched).
+    Fields which are not backed by a model field are skipped, the columns they read are listed in
+    `Meta.extra_only_fields` of the serializer.
+    """
+    only_fields = {prefix + model._meta.pk.name}
+    select_related = []
+    prefetches = []
+    meta = getattr(serializer, 'Meta', None)
+    only_fields.update(prefix + name for name in getattr(meta, 'extra_only_fields', ()))
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*' or '.' in field.source:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        path = prefix + field.source
+
+        if isinstance(field, serializers.ListSerializer):
+            if not (model_field.one_to_many or model_field.many_to_many):
+                continue
+            # the prefetched rows of a reverse foreign key are matched to their parent with the foreign key
+            extra_fields = [model_field.field.name] if model_field.one_to_many else []
+            queryset = optimize_queryset(model_field.related_model._default_manager.all(), field.child, extra_fields)
+            prefetches.append(Prefetch(path, queryset=queryset))
+        elif isinstance(field, serializers.BaseSerializer):
+            if not model_field.concrete or not (model_field.many_to_one or model_field.one_to_one):
+                continue
+            only_fields.add(path)
+            select_related.append(path)
+            nested_only_fields, nested_select_related, nested_prefetches = _get_plan(
+                model_field.related_model, field, prefix=path + '__')
+            only_fields.update(nested_only_fields)
+            select_related.extend(nested_select_related)
+            prefetches.extend(nested_prefetches)
+        elif model_field.concrete:
+            only_fields.add(path)
+    return only_fields, select_related, prefetches
+
+
+def optimize_queryset(queryset, serializer, extra_fields=()):
+    """
+    Load everything the serializer (class or instance) reads with a fixed number of queries:
+    select_related for nested forward relations, Prefetch for nested lists and `.only()`
+    for the columns of the serialized fields.
+    """
+    if isinstance(serializer, type):
+        serializer = serializer()
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    only_fields, select_related, prefetches = _get_plan(queryset.model, serializer)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset.only(*only_fields, *extra_fields)
@@ -1,4 +1,220 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Planner estimate of the queryset rows on PostgreSQL, exact count on small results and other databases.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimated_count = int(plan[0]['Plan']['Plan Rows'])
+        if estimated_count >= settings.ESTIMATED_COUNT_THRESHOLD:
+            return estimated_count
+    return queryset.count()
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on the values of the ordering fields of the first or last item of a page,
+    the last ordering field must be unique. Pages are stable while new rows are inserted and
+    every page is one index range instead of an OFFSET scan.
+    Total count is only computed on `?with_count=1` and is estimated on large tables.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'with_count'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = self.get_ordering(request, queryset, view)
+        position, reverse = self.decode_cursor(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = estimate_count(queryset)
+
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position, reverse))
+        ordering = [self.get_order_by(field, descending ^ reverse) for field, descending in self.fields]
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.first_position = self.get_position(results[0]) if results else None
+        self.last_position = self.get_position(results[-1]) if results else None
+        return results
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True,
+                                 cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        """
+        The ordering requested through an OrderingFilter if it only has plain columns or annotations,
+        followed by the pagination ordering as tie breaker.
+        """
+        default_fields = [(field.lstrip('-'), field.startswith('-')) for field in self.ordering]
+        requested_ordering = None
+        for filter_backend in getattr(view, 'filter_backends', []):
+            if issubclass(filter_backend, OrderingFilter):
+                requested_ordering = filter_backend().get_ordering(request, queryset, view)
+        if not requested_ordering:
+            return default_fields
+        requested_fields = [(field.lstrip('-'), field.startswith('-')) for field in requested_ordering]
+        if not all(self.is_keyset_field(queryset, field) for field, _ in requested_fields):
+            return default_fields
+        requested_names = {field for field, _ in requested_fields}
+        return requested_fields + [field for field in default_fields if field[0] not in requested_names]
+
+    @staticmethod
+    def is_keyset_field(queryset, name):
+        if name in queryset.query.annotations:
+            return True
+        try:
+            field = queryset.model._meta.get_field(name)
+        except LookupError:
+            return False
+        return field.concrete and not field.is_relation and not field.null
+
+    @staticmethod
+    def get_order_by(field, descending):
+        return '-' + field if descending else field
+
+    def get_keyset_filter(self, position, reverse):
+        keyset_filter = Q()
+        equal_filter = Q()
+        for (field, descending), value in zip(self.fields, position):
+            lookup = 'lt' if descending ^ reverse else 'gt'
+            keyset_filter |= equal_filter & Q(**{'{}__{}'.format(field, lookup): value})
+            equal_filter &= Q(**{field: value})
+        return keyset_filter
+
+    def get_position(self, instance):
+        position = []
+        for field, _ in self.fields:
+            value = getattr(instance, field)
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return position
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position, reverse = cursor['p'], bool(cursor['r'])
+            if not isinstance(position, list) or len(position) != len(self.fields):
+                raise ValueError
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        encoded = urlsafe_b64encode(json.dumps({'p': position, 'r': int(reverse)}).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.last_position is None:
+            # an empty page reached backwards, start over from the first page
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.last_position, False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_position is None:
+            return None
+        return self.encode_cursor(self.first_position, True)
+
+    def get_paginated_response(self, data):
+        response_data = OrderedDict()
+        if self.count is not None:
+            response_data['count'] = self.count
+        response_data['next'] = self.get_next_link()
+        response_data['previous'] = self.get_previous_link()
+        response_data['results'] = data
+        return Response(response_data)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {
+                    'type': 'integer',
+                    'example': 123,
+                    'description': 'Only present with `with_count=1`, estimated on large tables.',
+                },
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'previous': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {
+                    'type': 'string',
+                },
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {
+                    'type': 'integer',
+                },
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to 1 to include the (estimated) total count.',
+                'schema': {
+                    'type': 'integer',
+                },
+            },
+        ]
 
 
 class BlockedUsersPagination(PageNumberPagination):
@@ -13,10 +229,10 @@ class SearchResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
-class DefaultPagination(PageNumberPagination):
+class DefaultPagination(KeysetPagination):
     page_size = 50
-    page_size_query_param = 'page_size'
     max_page_size = 1000
+    ordering = ('-id',)
 
 
 class FollowRequestPagination(PageNumberPagination):
@@ -1,7 +1,6 @@
-from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
-from socialmedia.models import User
+from socialmedia.loaders import get_loader
 
 
 class IsSelfOrReadOnly(BasePermission):
@@ -18,8 +17,8 @@ class IsSelfOrReadOnly(BasePermission):
 
 class IsFollowerOrPublic(BasePermission):
     def has_permission(self, request, view):
-        user = get_object_or_404(User, pk=view.kwargs['pk'])
-        if user.get_followers().filter(pk=request.user.id).exists() or request.user == user or user.is_public:
+        user = get_loader(request).get_user(view.kwargs['pk'])
+        if get_loader(request).can_see_content_of(user):
             return True
         else:
             return False
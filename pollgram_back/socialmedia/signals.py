@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, m2m_changed
 from django.dispatch import receiver
 
+from poll.timeline import backfill_timeline
 from socialmedia.models import User, FollowRelationship
 
 
@@ -8,5 +9,16 @@ from socialmedia.models import User, FollowRelationship
 def accept_all_follow_requests(sender, instance, created, **kwargs):
     if not created and instance.is_public:
         follow_relationships = FollowRelationship.objects.filter(to_user=instance, pending=True)
-        if follow_relationships.exists():
+        follower_ids = list(follow_relationships.values_list('from_user', flat=True))
+        if follower_ids:
             follow_relationships.update(pending=False)
+            # the update sends no post_save, the polls of the user are copied to the accepted followers here
+            for follower_id in follower_ids:
+                backfill_timeline(follower_id, instance.pk)
+
+
+@receiver(m2m_changed, sender=User.blocked_users.through)
+def clear_blocker_ids(sender, instance, action, reverse, **kwargs):
+    # the blockers of the instance have changed through instance.blocker_users
+    if reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        instance.clear_blocker_ids()
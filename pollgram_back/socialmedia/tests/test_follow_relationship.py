@@ -151,14 +151,14 @@ class RetrieveFollowRelationshipAPITest(APITestCase):
         self.assertEqual(response.data['followings_count'], 1)
         
     def test_followers_api(self):
-        response = self.client.get('/api/user/3/followers/', HTTP_AUTHORIZATION=self.user2_token)
+        response = self.client.get('/api/user/3/followers/?with_count=1', HTTP_AUTHORIZATION=self.user2_token)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 2)
         followers = list(map(lambda item: item['id'], response.data['results']))
         self.assertEqual(followers, [2, 1])
 
     def test_followings_api(self):
-        response = self.client.get('/api/user/3/followings/', HTTP_AUTHORIZATION=self.user2_token)
+        response = self.client.get('/api/user/3/followings/?with_count=1', HTTP_AUTHORIZATION=self.user2_token)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['count'], 1)
         followings = list(map(lambda item: item['id'], response.data['results']))
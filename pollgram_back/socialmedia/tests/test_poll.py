@@ -1,13 +1,36 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import AccessToken
 
+from poll.models import Poll, TimelineEntry, TimelineSync
 from socialmedia.models import User
 
 
 class UserPollTest(APITestCase):
     fixtures = ['poll_users_fixture', 'poll_fixture']
 
+    def create_poll_api(self, token):
+        return self.client.post('/api/poll/', {
+            "question": "timeline question",
+            "choices": [
+                {
+                    "context": "yes",
+                    "order": "1"
+                },
+                {
+                    "context": "no",
+                    "order": "2"
+                }
+            ],
+            "min_choice_can_vote": 1,
+            "max_choice_can_vote": 1
+        }, HTTP_AUTHORIZATION=token, format='json')
+
     def test_get_public_page_polls(self):
         user = User.objects.get(id=3)
         token = f'Bearer {str(AccessToken.for_user(user))}'
@@ -47,7 +70,8 @@ class UserPollTest(APITestCase):
         for poll in user_polls:
             self.assertEqual(6, poll['creator']['id'])
 
-        right_polls_order = [13, 14]
+        # polls 13 and 14 are created at the same time, ties are ordered by id
+        right_polls_order = [14, 13]
         for i in range(0, 2):
             self.assertEqual(right_polls_order[i], user_polls[i]['id'])
 
@@ -61,7 +85,8 @@ class UserPollTest(APITestCase):
         for poll in user_polls:
             self.assertEqual(6, poll['creator']['id'])
 
-        right_polls_order = [13, 14]
+        # polls 13 and 14 are created at the same time, ties are ordered by id
+        right_polls_order = [14, 13]
         for i in range(0, 2):
             self.assertEqual(right_polls_order[i], user_polls[i]['id'])
 
@@ -81,3 +106,137 @@ class UserPollTest(APITestCase):
         right_polls_order = [12, 11, 9, 8, 7, 6, 5, 4, 3, 2]
         for i in range(0, 10):
             self.assertEqual(right_polls_order[i], polls[i]['id'])
+
+    def test_user_timeline_fetches_viewer_votes_once_per_page(self):
+        user = User.objects.get(id=1)
+        token = f'Bearer {str(AccessToken.for_user(user))}'
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/user/timeline/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        vote_queries = [query for query in context.captured_queries if 'FROM "poll_vote"' in query['sql']]
+        self.assertEqual(1, len(vote_queries))
+
+        polls = {poll['id']: poll for poll in response.data['results']}
+        # user 1 has voted to 1, 2 of poll 4 and poll 4 is visible after vote
+        self.assertEqual([1, 2], polls[4]['voted_choices'])
+        self.assertIsNotNone(polls[4]['all_votes'])
+        self.assertEqual([], polls[11]['voted_choices'])
+        self.assertIsNone(polls[11]['all_votes'])
+
+    def assert_queries_do_not_depend_on_page_size(self, url, token):
+        # the first read of a timeline pulls the polls which were not fanned out
+        self.client.get(url, HTTP_AUTHORIZATION=token)
+        query_counts = []
+        for page_size in (1, 10):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(f'{url}?page_size={page_size}', HTTP_AUTHORIZATION=token)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            query_counts.append(len(context.captured_queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_user_timeline_queries_do_not_depend_on_page_size(self):
+        user2_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        self.assert_queries_do_not_depend_on_page_size('/api/user/timeline/', user2_token)
+
+    def test_user_polls_queries_do_not_depend_on_page_size(self):
+        user3_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=3)))}'
+        self.assert_queries_do_not_depend_on_page_size('/api/user/2/polls/', user3_token)
+
+    def test_created_poll_is_fanned_out_to_followers_timeline(self):
+        # user 2 follows user 1
+        user1_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        user2_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        poll_id = self.create_poll_api(user1_token).data['id']
+        self.assertTrue(Poll.objects.get(id=poll_id).fanned_out)
+        self.assertTrue(TimelineEntry.objects.filter(owner=2, poll=poll_id).exists())
+        self.assertTrue(TimelineEntry.objects.filter(owner=1, poll=poll_id).exists())
+
+        response = self.client.get('/api/user/timeline/', HTTP_AUTHORIZATION=user2_token)
+        self.assertEqual(poll_id, response.data['results'][0]['id'])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=0)
+    def test_poll_of_user_with_many_followers_is_pulled_into_followers_timeline(self):
+        user1_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        user2_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        poll_id = self.create_poll_api(user1_token).data['id']
+        self.assertFalse(Poll.objects.get(id=poll_id).fanned_out)
+        self.assertFalse(TimelineEntry.objects.filter(owner=2, poll=poll_id).exists())
+
+        response = self.client.get('/api/user/timeline/', HTTP_AUTHORIZATION=user2_token)
+        self.assertEqual(poll_id, response.data['results'][0]['id'])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=0, TIMELINE_PULL_OVERLAP=60)
+    def test_poll_committed_after_a_newer_pulled_poll_is_pulled(self):
+        user1_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}'
+        user2_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        newer_poll_id = self.create_poll_api(user1_token).data['id']
+        self.client.get('/api/user/timeline/', HTTP_AUTHORIZATION=user2_token)
+        pulled_until = TimelineSync.objects.get(owner=2).pulled_until
+        self.assertEqual(Poll.objects.get(id=newer_poll_id).created_at, pulled_until)
+
+        # stamped before the pulled poll and committed after it, and another one stamped at the same time
+        late_poll_id = self.create_poll_api(user1_token).data['id']
+        Poll.objects.filter(id=late_poll_id).update(created_at=pulled_until - timedelta(seconds=30))
+        tied_poll_id = self.create_poll_api(user1_token).data['id']
+        Poll.objects.filter(id=tied_poll_id).update(created_at=pulled_until)
+        self.client.get('/api/user/timeline/', HTTP_AUTHORIZATION=user2_token)
+        self.assertTrue(TimelineEntry.objects.filter(owner=2, poll=late_poll_id).exists())
+        self.assertTrue(TimelineEntry.objects.filter(owner=2, poll=tied_poll_id).exists())
+        self.assertEqual(pulled_until, TimelineSync.objects.get(owner=2).pulled_until)
+
+    def test_timeline_read_without_new_polls_does_not_write(self):
+        user2_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        self.client.get('/api/user/timeline/', HTTP_AUTHORIZATION=user2_token)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/user/timeline/', HTTP_AUTHORIZATION=user2_token)
+        writes = [query['sql'] for query in context.captured_queries
+                  if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual([], writes)
+
+    def test_unfollow_prunes_timeline(self):
+        user2_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        self.client.get('/api/user/timeline/', HTTP_AUTHORIZATION=user2_token)
+        self.assertTrue(TimelineEntry.objects.filter(owner=2, poll__creator=1).exists())
+
+        response = self.client.delete('/api/user/1/follow/', HTTP_AUTHORIZATION=user2_token)
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertFalse(TimelineEntry.objects.filter(owner=2, poll__creator=1).exists())
+        response = self.client.get('/api/user/timeline/', HTTP_AUTHORIZATION=user2_token)
+        for poll in response.data['results']:
+            self.assertEqual(2, poll['creator']['id'])
+
+    def test_accepted_follow_requests_get_old_polls_in_timeline(self):
+        # user 2 has asked to follow user 6, whose page is private
+        user = User.objects.get(id=6)
+        user.is_public = True
+        user.save()
+        self.assertEqual([13, 14], sorted(TimelineEntry.objects.filter(owner=2, poll__creator=6)
+                                          .values_list('poll', flat=True)))
+
+    def test_user_timeline_cursor_pages(self):
+        user2_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        response = self.client.get('/api/user/timeline/?page_size=4', HTTP_AUTHORIZATION=user2_token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        self.assertEqual([12, 11, 9, 8], [poll['id'] for poll in response.data['results']])
+
+        # a new poll does not shift the next page
+        self.create_poll_api(f'Bearer {str(AccessToken.for_user(User.objects.get(id=1)))}')
+        response = self.client.get(response.data['next'], HTTP_AUTHORIZATION=user2_token)
+        self.assertEqual([7, 6, 5, 4], [poll['id'] for poll in response.data['results']])
+
+        response = self.client.get(response.data['previous'], HTTP_AUTHORIZATION=user2_token)
+        self.assertEqual([12, 11, 9, 8], [poll['id'] for poll in response.data['results']])
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_user_timeline_with_count(self):
+        user2_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        response = self.client.get('/api/user/timeline/?with_count=1', HTTP_AUTHORIZATION=user2_token)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(TimelineEntry.objects.filter(owner=2).count(), response.data['count'])
+
+    def test_user_timeline_with_invalid_cursor(self):
+        user2_token = f'Bearer {str(AccessToken.for_user(User.objects.get(id=2)))}'
+        response = self.client.get('/api/user/timeline/?cursor=invalid', HTTP_AUTHORIZATION=user2_token)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
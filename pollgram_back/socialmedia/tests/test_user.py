@@ -296,3 +296,28 @@ class UserDestroyAPITest(APITestCase):
         self.assertEqual(admin_user_response.status_code, status.HTTP_204_NO_CONTENT)
 
 # TODO: UserAvatarAPI and UserCoverApi test
+
+
+class BlockUserAPITest(APITestCase):
+    fixtures = ['user_fixture']
+
+    def test_blocked_user_does_not_see_blocker(self):
+        blocker = get_user_model().objects.get(id=2)
+        blocked = get_user_model().objects.get(id=3)
+        response = self.client.post('/api/user/3/block/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(blocker)}')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        token = f'Bearer {AccessToken.for_user(blocked)}'
+        response = self.client.get('/api/user/2/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get('/api/user/', HTTP_AUTHORIZATION=token)
+        self.assertNotIn(2, [user['id'] for user in response.data['results']])
+
+    def test_blocker_ids_are_cleared_on_block_changes(self):
+        blocker = get_user_model().objects.get(id=2)
+        blocked = get_user_model().objects.get(id=3)
+        self.assertEqual(set(), blocked.blocker_ids)
+        blocked.blocker_users.add(blocker)
+        self.assertEqual({2}, blocked.blocker_ids)
+        blocked.blocker_users.remove(blocker)
+        self.assertEqual(set(), blocked.blocker_ids)
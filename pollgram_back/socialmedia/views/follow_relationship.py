@@ -1,11 +1,11 @@
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
-from django.db.models import Q
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from ..loaders import get_loader
 from ..models import FollowRelationship
 from ..pagination import DefaultPagination, FollowRequestPagination
 from ..permissons import IsSelfOrReadOnly
@@ -16,7 +16,7 @@ class FollowAPIView(APIView):
     permission_classes = [IsAuthenticated, IsSelfOrReadOnly]
 
     def get(self, request, pk):
-        to_user = get_object_or_404(get_user_model(), ~Q(blocked_users=request.user), pk=pk)
+        to_user = get_loader(request).get_visible_user(pk)
         follow_status = request.user.get_follow_status(to_user=to_user)
         if request.user == to_user:
             return Response({
@@ -28,7 +28,7 @@ class FollowAPIView(APIView):
             })
 
     def post(self, request, pk):
-        to_user = get_object_or_404(get_user_model(), ~Q(blocked_users=request.user), pk=pk)
+        to_user = get_loader(request).get_visible_user(pk)
         if request.user == to_user:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         elif FollowRelationship.objects.filter(from_user=request.user, to_user=to_user).exists():
@@ -47,7 +47,7 @@ class FollowAPIView(APIView):
             }, status=status.HTTP_201_CREATED)
 
     def delete(self, request, pk):
-        to_user = get_object_or_404(get_user_model(), ~Q(blocked_users=request.user), pk=pk)
+        to_user = get_loader(request).get_visible_user(pk)
         if request.user == to_user:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         elif not FollowRelationship.objects.filter(from_user=request.user, to_user=to_user).exists():
@@ -64,7 +64,7 @@ class FollowingsAPIView(ListAPIView):
     pagination_class = DefaultPagination
 
     def get_queryset(self):
-        user = get_object_or_404(get_user_model(), ~Q(blocked_users=self.request.user), pk=self.kwargs['pk'])
+        user = get_loader(self.request).get_visible_user(self.kwargs['pk'])
         return user.get_followings()
 
 
@@ -74,7 +74,7 @@ class FollowersAPIView(ListAPIView):
     pagination_class = DefaultPagination
 
     def get_queryset(self):
-        user = get_object_or_404(get_user_model(), ~Q(blocked_users=self.request.user), pk=self.kwargs['pk'])
+        user = get_loader(self.request).get_visible_user(self.kwargs['pk'])
         return user.get_followers()
 
 
@@ -82,8 +82,8 @@ class FollowRequestStatusHandlerAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, user_pk):
-        follow_relationship = get_object_or_404(FollowRelationship, ~Q(from_user__blocked_users=self.request.user),
-                                                from_user__pk=user_pk, to_user=request.user)
+        follow_requests = FollowRelationship.objects.exclude(from_user__in=request.user.blocker_ids)
+        follow_relationship = get_object_or_404(follow_requests, from_user__pk=user_pk, to_user=request.user)
         follow_relationship.pending = False
         follow_relationship.save()
         return Response({
@@ -91,8 +91,8 @@ class FollowRequestStatusHandlerAPIView(APIView):
         }, status=status.HTTP_201_CREATED)
 
     def delete(self, request, user_pk):
-        follow_relationship = get_object_or_404(FollowRelationship, ~Q(from_user__blocked_users=self.request.user),
-                                                from_user__pk=user_pk, to_user=request.user)
+        follow_requests = FollowRelationship.objects.exclude(from_user__in=request.user.blocker_ids)
+        follow_relationship = get_object_or_404(follow_requests, from_user__pk=user_pk, to_user=request.user)
         follow_relationship.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -104,6 +104,6 @@ class FollowRequestListAPIView(ListAPIView):
 
     def get_queryset(self):
         follow_relationships = FollowRelationship.objects.filter(to_user=self.request.user.id, pending=True) \
-            .exclude(from_user__blocked_users=self.request.user)
+            .exclude(from_user__in=self.request.user.blocker_ids)
         from_user_ids = follow_relationships.values_list('from_user', flat=True)
         return get_user_model().objects.filter(id__in=from_user_ids)
@@ -1,5 +1,4 @@
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
 from django.db.models import Q
 from rest_framework import status
 from rest_framework import filters
@@ -9,12 +8,14 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
+from socialmedia.optimizer import optimize_queryset
 from socialmedia.pagination import SearchResultsSetPagination, BlockedUsersPagination
 
-from poll.models import Poll
-from poll.paginations import PollPagination
+from poll.paginations import PollPagination, TimelinePagination
+from poll.timeline import get_timeline_polls
 from poll.serializers import PollRetrieveSerializer
 
+from ..loaders import get_loader
 from ..models import FollowRelationship
 from ..serializers.user import (
     UserAdminAccessSerializer,
@@ -29,7 +30,7 @@ class UserAPIView(RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated, IsSelfOrReadOnly]
 
     def get_queryset(self):
-        return get_user_model().objects.exclude(blocked_users=self.request.user)
+        return get_user_model().objects.visible_to(self.request.user)
     
 
     def get_serializer_class(self):
@@ -63,20 +64,16 @@ class UserListAPIView(ListAPIView):
     search_fields = ['username', 'first_name', 'last_name']
 
     def get_queryset(self):
-        return get_user_model().objects.exclude(blocked_users=self.request.user)
+        return get_user_model().objects.visible_to(self.request.user)
 
 
 class UserTimelineListAPIView(ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = PollRetrieveSerializer
-    pagination_class = PollPagination
+    pagination_class = TimelinePagination
 
     def get_queryset(self):
-        followings = self.request.user.get_followings().prefetch_related('polls')
-        polls = Poll.objects.none()
-        for following in followings:
-            polls = polls | following.polls.all()
-        return polls | self.request.user.polls.all()
+        return optimize_queryset(get_timeline_polls(self.request.user), self.get_serializer_class())
 
 
 class PollListAPIView(ListAPIView):
@@ -85,8 +82,8 @@ class PollListAPIView(ListAPIView):
     serializer_class = PollRetrieveSerializer
 
     def get_queryset(self):
-        user = get_object_or_404(get_user_model(), ~Q(blocked_users=self.request.user), id=self.kwargs['pk'])
-        return user.polls.all()
+        user = get_loader(self.request).get_visible_user(self.kwargs['pk'])
+        return optimize_queryset(user.polls.all(), self.get_serializer_class())
 
 
 class BlockedUsersListAPIView(ListAPIView):
@@ -102,7 +99,7 @@ class BlockUserAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, pk):
-        user = get_object_or_404(get_user_model(), ~Q(blocked_users=self.request.user), pk=pk)
+        user = get_loader(self.request).get_visible_user(pk)
         if request.user.pk == pk:
             return Response({
                 "status": "You can't block yourself."
@@ -113,15 +110,17 @@ class BlockUserAPIView(APIView):
             }, status=status.HTTP_409_CONFLICT)
         else:
             request.user.blocked_users.add(user)
+            user.clear_blocker_ids()
             FollowRelationship.objects.filter(Q(from_user=request.user, to_user=user) | Q(from_user=user, to_user=request.user)).delete()
             return Response(UserSummarySerializer(user).data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, pk):
-        user = get_object_or_404(get_user_model(), ~Q(blocked_users=self.request.user), pk=pk)
+        user = get_loader(self.request).get_visible_user(pk)
         if not request.user.blocked_users.filter(pk=pk).exists():
             return Response({
                 "status": "already unblocked"
             }, status=status.HTTP_409_CONFLICT)
         else:
             request.user.blocked_users.remove(user)
+            user.clear_blocker_ids()
             return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file